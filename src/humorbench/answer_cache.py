@@ -0,0 +1,98 @@
+"""On-disk cache of answers extracted from run files.
+
+Entries are keyed by the SHA-256 of a run file's contents together with
+the answer key and ``answer_extraction.EXTRACTOR_VERSION``, so a file is
+parsed once no matter which evaluation script (or which copy or hard link
+of it) asks for it, and changing the extractor invalidates every entry.
+The digests themselves are memoised by (size, mtime) in a
+``run_dedup.DigestCache``, so unchanged files are not re-hashed.
+Like ``completion_cache``, entries are written to a temporary file and
+renamed into place, so concurrent evaluations can share the cache.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from typing import Any
+
+from answer_extraction import EXTRACTOR_VERSION, extract_files
+from run_dedup import DigestCache
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "humorbench", "answers")
+
+
+def answer_key(digest: str, key: str, default: Any) -> str:
+    """Cache key of the answers extracted from a file with contents ``digest``."""
+    record = {"file": digest, "key": key, "default": default, "version": EXTRACTOR_VERSION}
+    encoded = json.dumps(record, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class AnswerCache:
+    """Directory of extracted answer lists, sharded by the first two hex digits of the key."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR) -> None:
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> list | None:
+        """Return the cached answers for a key, or None."""
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                answers = json.load(f)["answers"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return answers
+
+    def put(self, key: str, answers: list) -> None:
+        """Store an answer list atomically."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.{uuid.uuid4().hex}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"answers": answers}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def cached_extract_files(
+    filepaths: list[str],
+    key: str,
+    default: Any = "",
+    cache: AnswerCache | None = None,
+    workers: int | None = None,
+    digests: DigestCache | None = None,
+) -> list[list]:
+    """``extract_files`` that only parses files whose answers are not cached yet.
+
+    Args:
+        filepaths: Run files.
+        key: Answer key to extract.
+        default: Value for blocks without an answer.
+        cache: Answer cache; without one every file is extracted.
+        workers: Worker processes for the files that miss the cache.
+        digests: Memo of the files' digests (default: the shared one).
+
+    Returns:
+        One answer list per file, in the order of ``filepaths``.
+    """
+    if cache is None:
+        return extract_files(filepaths, key, default, workers=workers)
+
+    memo = digests or DigestCache()
+    keys = [answer_key(memo.digest(path), key, default) for path in filepaths]
+    if digests is None:
+        memo.save()
+    results = [cache.get(k) for k in keys]
+    missing = [i for i, answers in enumerate(results) if answers is None]
+    extracted = extract_files([filepaths[i] for i in missing], key, default, workers=workers)
+    for i, answers in zip(missing, extracted, strict=True):
+        cache.put(keys[i], answers)
+        results[i] = answers
+    return results
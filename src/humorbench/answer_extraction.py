@@ -0,0 +1,277 @@
+"""Streaming extraction of JSON answers from ``=== Prompt i ===`` run files.
+
+Replaces the ``re.split`` + greedy ``\\{.*\\}`` approach: run files are read
+in chunks one block at a time, as undecoded UTF-8, and each block is
+searched from the end for the last occurrence of the answer key. From the
+key, one scan backwards and one forwards pair the braces that enclose it,
+skipping string literals and escapes. Both start at the key's opening
+quote, where the string state is known, so quotes in the reasoning earlier
+in the block cannot throw them off. Each enclosing ``{ ... }`` span, innermost first, is decoded with
+``json.JSONDecoder.raw_decode``, and the first object that contains the key
+is the answer. Work is linear in the text around the key, and earlier
+malformed objects or stray braces no longer make extraction fail.
+
+Blocks are yielded like ``re.split(r"=== Prompt \\d+ ===", text)[1:]``:
+the text before the first header is dropped, so answer ``i`` of a file
+belongs to prompt ``i + 1`` and to dataset row ``i``.
+
+Run as a script to benchmark against the regex extractor::
+
+    python answer_extraction.py --completions-dir ../../completions
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any
+
+HEADER_RE = re.compile(rb"=== Prompt \d+ ===")
+_TOKENS = {bytes: re.compile(rb'[{}"\\]'), str: re.compile(r'[{}"\\]')}
+# Everything up to the next brace outside a string literal (or an unterminated string)
+_SKIP = {
+    bytes: re.compile(rb'[^{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}"]*)*', re.DOTALL),
+    str: re.compile(r'[^{}"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^{}"]*)*', re.DOTALL),
+}
+_DECODER = json.JSONDecoder()
+
+# Bump whenever a change can alter extracted answers (invalidates answer_cache).
+EXTRACTOR_VERSION = 3
+
+TASK_KEYS = {1: "category", 2: "ANSWER"}
+
+
+def iter_blocks(filepath: str, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """Yield the UTF-8 completion after each ``=== Prompt i ===`` header of a run file.
+
+    Text before the first header is not a completion and is skipped, so the
+    i-th block belongs to prompt i. The file is read in ``chunk_size``
+    pieces, holding at most one chunk plus the current block in memory.
+    Blocks stay undecoded: headers, keys and braces are ASCII, and decoding
+    the whole file costs more than finding the answers in it.
+    """
+    pending = b""
+    seen_header = False
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            pending += chunk
+            start = 0
+            for match in HEADER_RE.finditer(pending):
+                if seen_header:
+                    yield pending[start:match.start()]
+                seen_header = True
+                start = match.end()
+            pending = pending[start:]
+    if seen_header:
+        yield pending
+
+
+def _decode(text: bytes) -> str:
+    """Decode UTF-8 with the newline translation of a file opened in text mode."""
+    return text.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _escaped(text: str | bytes, pos: int) -> bool:
+    """Whether the character at ``pos`` follows an odd number of backslashes."""
+    backslash = b"\\" if isinstance(text, bytes) else "\\"
+    count = 0
+    while pos - count > 0 and text[pos - count - 1:pos - count] == backslash:
+        count += 1
+    return count % 2 == 1
+
+
+def _tokens_before(text: str | bytes, start: int, end: int) -> Iterator[re.Match]:
+    """Braces, quotes and backslashes in ``text[start:end]``, last first.
+
+    The text is searched in chunks that double from 64 characters, since
+    the brace that opens the answer is usually right before its key.
+    """
+    pattern = _TOKENS[type(text)]
+    chunk_size = 64
+    while end > start:
+        lo = max(start, end - chunk_size)
+        yield from reversed(list(pattern.finditer(text, lo, end)))
+        end = lo
+        chunk_size *= 2
+
+
+def _openers(text: str | bytes, start: int, key_pos: int) -> Iterator[int]:
+    """Positions of the unclosed ``{`` between ``start`` and the key, innermost first."""
+    depth = 0
+    in_string = False
+    for match in _tokens_before(text, start, key_pos):
+        char = match.group()
+        pos = match.start()
+        if char in ('"', b'"'):
+            if not _escaped(text, pos):
+                in_string = not in_string
+        elif in_string or char in ("\\", b"\\"):
+            continue
+        elif char in ("}", b"}"):
+            depth += 1
+        elif depth:
+            depth -= 1
+        else:
+            yield pos
+
+
+def _closers(text: str | bytes, key_pos: int) -> Iterator[int]:
+    """Positions of the unopened ``}`` after the key, innermost first."""
+    skip = _SKIP[type(text)]
+    close_brace = b"}" if isinstance(text, bytes) else "}"
+    depth = 0
+    pos = key_pos
+    next_close = text.find(close_brace, pos)
+    while True:
+        # Truncated answers often have no closing brace left at all
+        if next_close == -1:
+            return
+        pos = skip.match(text, pos).end()
+        char = text[pos:pos + 1]
+        if char in ("{", b"{"):
+            depth += 1
+        elif char not in ("}", b"}"):
+            return  # end of the block, or a string that never ends
+        elif depth:
+            depth -= 1
+        else:
+            yield pos
+        pos += 1
+        if next_close < pos:
+            next_close = text.find(close_brace, pos)
+
+
+def _decode_span(text: str | bytes, start: int, end: int, key_pos: int) -> Any:
+    """``raw_decode`` the value at ``start`` within ``text[start:end]``; None unless it spans the key."""
+    span = text[start:end]
+    key_offset = key_pos - start
+    if isinstance(span, bytes):
+        if not span.isascii() or b"\r" in span:
+            # The object must span the key: compare in characters, not bytes
+            key_offset = len(_decode(span[:key_offset]))
+        span = _decode(span)
+    parsed, length = _DECODER.raw_decode(span)
+    return parsed if length > key_offset else None
+
+
+def last_json_object(text: str | bytes, key: str) -> dict | None:
+    """Return the last well-formed JSON object in ``text`` that has ``key``.
+
+    Only ``{`` after the previous occurrence of the key are considered for
+    each occurrence: an object that starts before it also spans that
+    occurrence and is tried with it instead. UTF-8 ``bytes`` are searched as
+    is and only the candidate spans are decoded.
+    """
+    raw = isinstance(text, bytes)
+    needle = f'"{key}"'.encode() if raw else f'"{key}"'
+    key_pos = text.rfind(needle)
+    while key_pos != -1:
+        prev_pos = text.rfind(needle, 0, key_pos)
+        openers = _openers(text, prev_pos + 1, key_pos)
+        for start, end in zip(openers, _closers(text, key_pos), strict=False):
+            try:
+                parsed = _decode_span(text, start, end + 1, key_pos)
+            except (json.JSONDecodeError, RecursionError):
+                parsed = None
+            if isinstance(parsed, dict) and key in parsed:
+                return parsed
+        key_pos = prev_pos
+    return None
+
+
+def extract_answer(text: str | bytes, key: str, default: Any = "") -> Any:
+    """Return ``key`` of the last JSON object in one completion, or ``default``."""
+    parsed = last_json_object(text, key)
+    return default if parsed is None else parsed[key]
+
+
+def extract_answers(filepath: str, key: str, default: Any = "") -> list:
+    """Extract the answer of every block of a run file, one per prompt in order."""
+    return [extract_answer(block, key, default) for block in iter_blocks(filepath)]
+
+
+def extract_files(filepaths: list[str], key: str, default: Any = "", workers: int | None = None) -> list[list]:
+    """Run ``extract_answers`` on several run files across a process pool.
+
+    Args:
+        filepaths: Run files; each one is a unit of work.
+        key: Answer key to extract.
+        default: Value for blocks without an answer.
+        workers: Number of worker processes (default: number of cores).
+            With one worker, or a single file, no pool is started.
+
+    Returns:
+        One answer list per file, in the order of ``filepaths``.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(filepaths))
+    if workers <= 1:
+        return [extract_answers(path, key, default) for path in filepaths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(extract_answers, filepaths, repeat(key), repeat(default)))
+
+
+def regex_extract_answers(filepath: str, key: str, default: Any = "") -> list:
+    """The original greedy-regex extractor, kept for benchmarking."""
+    with open(filepath, encoding="utf-8") as f:
+        text = f.read()
+    results = []
+    for block in re.split(r"=== Prompt \d+ ===", text)[1:]:
+        block = block.strip()
+        matches = re.findall(r"\{.*\}", block, re.DOTALL) if block else []
+        if not matches:
+            results.append(default)
+            continue
+        try:
+            results.append(json.loads(matches[-1])[key])
+        except (json.JSONDecodeError, KeyError, TypeError):
+            results.append(default)
+    return results
+
+
+def benchmark(completions_dir: str) -> None:
+    """Compare throughput and recovered answers of both extractors on a completions tree."""
+    from answer_schemas import task_from_prompt_file
+    from completion_store import find_run_files
+
+    files = [
+        (path, TASK_KEYS[task_from_prompt_file(prefix)])
+        for prefix, run_files in sorted(find_run_files(completions_dir).items())
+        for path in run_files.values()
+        if task_from_prompt_file(prefix)
+    ]
+    total_bytes = sum(os.path.getsize(path) for path, _ in files)
+    print(f"{len(files)} run files, {total_bytes / 1e6:.1f} MB")
+
+    for name, extractor in [("regex", regex_extract_answers), ("streaming", extract_answers)]:
+        start = time.perf_counter()
+        found = 0
+        blocks = 0
+        for path, key in files:
+            answers = extractor(path, key, None)
+            blocks += len(answers)
+            found += sum(answer is not None for answer in answers)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name:>9}: {elapsed:.2f}s ({total_bytes / 1e6 / elapsed:.1f} MB/s), "
+            f"answers found in {found}/{blocks} completions"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the streaming answer extractor")
+    parser.add_argument(
+        "--completions-dir",
+        type=str,
+        default="../../completions",
+        help="Root of the completions tree (default: ../../completions)",
+    )
+    args = parser.parse_args()
+    benchmark(args.completions_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""JSON schemas for guided (grammar-constrained) decoding of Task 1 and Task 2 answers.
+
+Constraining generation to these schemas makes the model emit only the
+answer object (plus an optional, length-bounded reasoning string), so
+completions are an order of magnitude shorter and always parse.
+"""
+
+import os
+
+from prompt_templates import TASK1_TYPES, TASK2_ROLES
+
+JOKE_END_MARKER = "END OF JOKE"
+# Without gold line counts a Task 2 answer may have 1 to this many times the
+# joke's \n-separated lines; labelled jokes have 0.19x to 1.8x as many labels.
+MAX_LABELS_PER_LINE = 2
+
+
+def task_from_prompt_file(prompt_file: str) -> int | None:
+    """Infer the task number from a prompt file name (``...task1...`` / ``...task2...``)."""
+    name = os.path.basename(prompt_file)
+    if "task1" in name:
+        return 1
+    if "task2" in name:
+        return 2
+    return None
+
+
+def count_joke_lines(prompt: str) -> int:
+    """Count the newline-separated lines of the joke embedded in a Task 2 prompt.
+
+    Jokes are stored with literal ``\\n`` separators, and every Task 2
+    template closes the joke with ``END OF JOKE``, so the joke's lines are
+    the ``\\n``-separated pieces before the last marker. This is not the
+    number of gold labels: the labelled lines of most English jokes are
+    split differently (see ``gold_line_counts``).
+    """
+    joke_part = prompt.rsplit(JOKE_END_MARKER, 1)[0]
+    return joke_part.count("\\n") + 1
+
+
+def gold_line_counts(dataset_path: str, joke_col: str = "Joke") -> dict[str, int]:
+    """Number of gold Task 2 labels of every labelled joke of a TSV, by joke text."""
+    import pandas as pd
+
+    task2 = pd.read_csv(dataset_path, sep="\t")[[joke_col, "Task2 Label"]].dropna()
+    return {joke.strip(): label.count("\\n") + 1 for joke, label in zip(task2[joke_col], task2["Task2 Label"], strict=True)}
+
+
+def gold_line_count(prompt: str, line_counts: dict[str, int]) -> int | None:
+    """Gold label count of the joke a Task 2 prompt embeds, or None if it is not in ``line_counts``."""
+    joke_part = prompt.rsplit(JOKE_END_MARKER, 1)[0].rstrip()
+    matches = [joke for joke in line_counts if joke_part.endswith(joke)]
+    return line_counts[max(matches, key=len)] if matches else None
+
+
+def _with_reasoning(properties: dict, required: list, reasoning_chars: int | None) -> dict:
+    if reasoning_chars:
+        # Reasoning comes first so the model can think before committing to an answer.
+        properties = {"reasoning": {"type": "string", "maxLength": reasoning_chars}, **properties}
+        required = ["reasoning", *required]
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": required,
+        "additionalProperties": False,
+    }
+
+
+def task1_schema(reasoning_chars: int | None = None) -> dict:
+    """Schema for ``{"category": <one of TASK1_TYPES>}``."""
+    return _with_reasoning({"category": {"type": "string", "enum": TASK1_TYPES}}, ["category"], reasoning_chars)
+
+
+def task2_schema(num_lines: int, reasoning_chars: int | None = None, max_lines: int | None = None) -> dict:
+    """Schema for ``{"ANSWER": [...]}`` with exactly ``num_lines`` role labels, or up to ``max_lines``."""
+    answer = {
+        "type": "array",
+        "items": {"type": "string", "enum": TASK2_ROLES},
+        "minItems": num_lines,
+        "maxItems": num_lines if max_lines is None else max_lines,
+    }
+    return _with_reasoning({"ANSWER": answer}, ["ANSWER"], reasoning_chars)
+
+
+def answer_schema(
+    task: int,
+    prompt: str,
+    reasoning_chars: int | None = None,
+    line_counts: dict[str, int] | None = None,
+) -> dict:
+    """Return the answer schema for one prompt of the given task.
+
+    A Task 2 answer has exactly the gold number of labels if the joke is in
+    ``line_counts`` (see ``gold_line_counts``), and otherwise between 1 and
+    ``MAX_LABELS_PER_LINE`` labels per ``\\n``-separated line of the joke.
+    """
+    if task == 1:
+        return task1_schema(reasoning_chars)
+    if task == 2:
+        num_lines = gold_line_count(prompt, line_counts) if line_counts else None
+        if num_lines is None:
+            return task2_schema(1, reasoning_chars, max_lines=MAX_LABELS_PER_LINE * count_joke_lines(prompt))
+        return task2_schema(num_lines, reasoning_chars)
+    raise ValueError(f"Unknown task: {task}")
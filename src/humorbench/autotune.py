@@ -0,0 +1,200 @@
+"""Persisted engine batch settings found by ``vllm_inference --autotune``.
+
+Settings are stored per (model, tensor parallel size, max model length) in
+a JSON file next to the HuggingFace cache, so every later run of the same
+model picks them up without repeating the calibration.
+
+Each calibration trial runs in its own process (``run_trial_process``), so
+an engine that fails to start, runs out of memory or hangs cannot take the
+calibration down with it, and its GPU memory is returned when the process
+exits. Run as a script, this module is that process::
+
+    python autotune.py <trial config JSON> <result JSON>
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+# (max_num_seqs, max_num_batched_tokens) candidates tried during calibration.
+DEFAULT_GRID: list[tuple[int, int]] = [
+    (64, 8192),
+    (128, 8192),
+    (256, 8192),
+    (128, 16384),
+    (256, 16384),
+    (512, 16384),
+]
+
+# Cap on the tokens generated per sample during calibration, so each trial
+# stays short; the job's own max_tokens applies if it is lower.
+CALIBRATION_MAX_TOKENS = 256
+
+
+def settings_path() -> str:
+    """Location of the tuned-settings file."""
+    return os.path.join(os.environ.get("HF_HOME", os.path.expanduser("~")), "humorbench_autotune.json")
+
+
+def settings_key(model_name: str, tensor_parallel_size: int, max_model_len: int | None) -> str:
+    return f"{model_name}|tp={tensor_parallel_size}|max_model_len={max_model_len or 'auto'}"
+
+
+def _load_all(path: str) -> dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_tuned_settings(
+    model_name: str, tensor_parallel_size: int, max_model_len: int | None, path: str | None = None
+) -> dict | None:
+    """Return the stored settings for a model, or None if it was never tuned."""
+    return _load_all(path or settings_path()).get(
+        settings_key(model_name, tensor_parallel_size, max_model_len)
+    )
+
+
+def save_tuned_settings(
+    model_name: str,
+    tensor_parallel_size: int,
+    max_model_len: int | None,
+    settings: dict,
+    path: str | None = None,
+) -> None:
+    """Store the settings for a model, keeping entries for other models."""
+    path = path or settings_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    all_settings = _load_all(path)
+    all_settings[settings_key(model_name, tensor_parallel_size, max_model_len)] = settings
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(all_settings, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_trial(config: dict) -> dict:
+    """Load an engine with one candidate setting and time the calibration sample.
+
+    Args:
+        config: ``model``, ``tensor_parallel_size``, ``max_model_len``,
+            ``enable_prefix_caching``, the candidate ``max_num_seqs`` and
+            ``max_num_batched_tokens``, the sampling fields ``temperature``,
+            ``top_p``, ``max_tokens`` and ``n`` (samples per prompt, 1 if
+            absent), and the sample ``prompts``.
+
+    Returns:
+        ``generated_tokens``, ``elapsed_s`` and ``tokens_per_s``.
+    """
+    from vllm import SamplingParams
+    from vllm_inference import load_llm, measure_prompt_lengths, stream_generate
+
+    llm = load_llm(
+        config["model"],
+        tensor_parallel_size=config["tensor_parallel_size"],
+        max_model_len=config["max_model_len"],
+        max_num_batched_tokens=config["max_num_batched_tokens"],
+        max_num_seqs=config["max_num_seqs"],
+        enable_prefix_caching=config["enable_prefix_caching"],
+    )
+    sampling_params = SamplingParams(
+        n=config.get("n", 1),
+        temperature=config["temperature"],
+        top_p=config["top_p"],
+        max_tokens=config["max_tokens"],
+        stop=["### END"]
+    )
+    prompts = config["prompts"]
+    lengths = measure_prompt_lengths(llm, prompts)
+    start = time.perf_counter()
+    generated = 0
+    for _, output in stream_generate(llm, prompts, sampling_params, request_tag="autotune", prompt_lengths=lengths):
+        generated += sum(len(o.token_ids) for o in output.outputs)
+    elapsed = time.perf_counter() - start
+    return {"generated_tokens": generated, "elapsed_s": elapsed, "tokens_per_s": generated / elapsed}
+
+
+def run_trial_process(config: dict, work_dir: str, timeout: float | None = None) -> dict:
+    """Run ``run_trial`` in a fresh process and report how it went.
+
+    The trial gets its own process group, which is killed once the trial
+    ends or exceeds ``timeout`` seconds, so engine worker processes do not
+    outlive it.
+
+    Returns:
+        ``{"status": "ok", ...}`` with the results of ``run_trial``, or
+        ``{"status": "failed", "error": ...}``.
+    """
+    name = f"trial_{config['max_num_seqs']}_{config['max_num_batched_tokens']}"
+    config_path = os.path.join(work_dir, f"{name}.json")
+    result_path = os.path.join(work_dir, f"{name}_result.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), config_path, result_path],
+        start_new_session=True,
+    )
+    try:
+        returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        returncode = None
+    finally:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+
+    if returncode is None:
+        return {"status": "failed", "error": f"timed out after {timeout:g}s"}
+    if os.path.exists(result_path):
+        with open(result_path, encoding="utf-8") as f:
+            result = json.load(f)
+        if returncode == 0 or result.get("status") == "failed":
+            return result
+    return {"status": "failed", "error": f"exited with code {returncode}"}
+
+
+def resolve_engine_settings(
+    model_name: str,
+    tensor_parallel_size: int,
+    max_model_len: int | None,
+    max_num_seqs: int | None,
+    max_num_batched_tokens: int | None,
+) -> tuple[int | None, int | None]:
+    """Fill in tuned ``max_num_seqs``/``max_num_batched_tokens`` unless given explicitly."""
+    if max_num_seqs is not None or max_num_batched_tokens is not None:
+        return max_num_seqs, max_num_batched_tokens
+    tuned = load_tuned_settings(model_name, tensor_parallel_size, max_model_len)
+    if tuned is None:
+        return None, None
+    if tuned.get("max_num_seqs") is None:
+        print(f"Every autotune setting failed for {model_name}; using engine defaults")
+        return None, None
+    print(
+        f"Using autotuned settings for {model_name}: max_num_seqs={tuned['max_num_seqs']}, "
+        f"max_num_batched_tokens={tuned['max_num_batched_tokens']} "
+        f"({tuned['tokens_per_s']:.0f} tok/s in calibration)"
+    )
+    return tuned["max_num_seqs"], tuned["max_num_batched_tokens"]
+
+
+def main() -> None:
+    config_path, result_path = sys.argv[1:3]
+    with open(config_path, encoding="utf-8") as f:
+        config = json.load(f)
+    try:
+        result = dict(run_trial(config), status="ok")
+    except Exception as e:
+        result = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    sys.exit(0 if result["status"] == "ok" else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Content-addressed cache of completions shared across jobs.
+
+Every completion is stored under the SHA-256 of (model, prompt, sampling
+parameters, seed, sample index), so a prompt that reappears unchanged in
+another prompt file or a rerun is never sent to the engine twice. Entries
+are written to a temporary file and renamed into place, which keeps the
+cache safe for concurrent jobs on a shared (network) filesystem: a reader
+sees either no entry or a complete one.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+# Request fields that do not change what a single sample looks like.
+_IGNORED_PARAMS = {"n"}
+
+
+def completion_key(model: str, prompt: str, params: dict, seed: int | None, sample_index: int) -> str:
+    """Return the cache key of one sample.
+
+    Args:
+        model: Model name or path.
+        prompt: Prompt text.
+        params: Sampling fields as built by ``vllm_inference.make_request_params``.
+            ``n`` is ignored, so sample j of an n-way request and run j+1 of
+            a run-by-run job share a key.
+        seed: Engine seed, or None if unseeded.
+        sample_index: 0-based sample (run) index.
+    """
+    record = {
+        "model": model,
+        "prompt": prompt,
+        "params": {k: v for k, v in params.items() if k not in _IGNORED_PARAMS},
+        "seed": seed,
+        "sample": sample_index,
+    }
+    encoded = json.dumps(record, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class CompletionCache:
+    """Directory of cached completions, sharded by the first two hex digits of the key."""
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached entry for a key (``text``, and ``meta`` if recorded), or None."""
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entry = None
+        if not isinstance(entry, dict) or "text" not in entry:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, text: str, meta: dict | None = None) -> None:
+        """Store a completion atomically; concurrent writers of the same key are harmless.
+
+        ``meta`` (token counts, finish reason) is kept with the text so a hit
+        fills the Parquet store as completely as the original generation.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.{uuid.uuid4().hex}"
+        entry = {"text": text}
+        if meta:
+            entry["meta"] = meta
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class CachedWriter:
+    """Wrap a run writer so cached completions are filled in before generation.
+
+    On construction every pending prompt with a cache entry is written
+    straight to the wrapped writer, with the token counts and finish reason
+    recorded when it was generated, so ``pending`` (and therefore what is
+    submitted to the engine) only contains the misses. Newly generated
+    completions are stored in the cache as they are written.
+    """
+
+    def __init__(self, writer, cache: CompletionCache, keys: list[str]) -> None:
+        self.writer = writer
+        self.cache = cache
+        self.keys = keys
+        self.num_prompts = writer.num_prompts
+        for index in writer.pending:
+            entry = cache.get(keys[index])
+            if entry is not None:
+                writer.write(index, entry["text"], entry.get("meta"))
+
+    @property
+    def output_files(self) -> list[str]:
+        return self.writer.output_files
+
+    @property
+    def pending(self) -> list[int]:
+        return self.writer.pending
+
+    @property
+    def meta(self) -> dict:
+        return getattr(self.writer, "meta", {})
+
+    def write(self, index: int, text: str, meta: dict | None = None) -> None:
+        self.writer.write(index, text, meta)
+        self.cache.put(self.keys[index], text, meta)
+
+    def finalize(self) -> bool:
+        return self.writer.finalize()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def wrap_writers(
+    run_writers: list,
+    cache: CompletionCache,
+    model: str,
+    prompts: list[str],
+    params: dict | list[dict],
+    seed: int | None,
+) -> list:
+    """Wrap one writer per run in a ``CachedWriter`` and report the hit rate.
+
+    ``params`` is either shared by every prompt or a list with one dict per
+    prompt (guided decoding).
+    """
+    per_prompt = isinstance(params, list)
+    wrapped = []
+    for sample_index, writer in enumerate(run_writers):
+        keys = [
+            completion_key(model, prompt, params[i] if per_prompt else params, seed, sample_index)
+            for i, prompt in enumerate(prompts)
+        ]
+        wrapped.append(CachedWriter(writer, cache, keys))
+    looked_up = cache.hits + cache.misses
+    if looked_up:
+        print(f"Completion cache: {cache.hits}/{looked_up} samples found in {cache.cache_dir}")
+    return wrapped
@@ -0,0 +1,123 @@
+"""Byte-offset index for random access to completions inside run files.
+
+``<run_file>.idx`` records where every ``=== Prompt i ===`` block starts
+and ends, together with the run file's size and mtime; a stale index is
+rebuilt automatically. ``CompletionIndex`` memory-maps the run file and
+returns a single completion without reading or splitting the rest.
+
+Usage (print the five answers to joke 17)::
+
+    python completion_index.py ../../completions/en/qwen3-8b/en_task1_qwen3-8b 17
+"""
+
+import argparse
+import json
+import mmap
+import os
+import re
+
+HEADER_RE = re.compile(rb"^=== Prompt (\d+) ===\n", re.MULTILINE)
+
+
+def index_path(run_file: str) -> str:
+    return f"{run_file}.idx"
+
+
+def _file_signature(run_file: str) -> tuple[int, int]:
+    stat = os.stat(run_file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_index(run_file: str) -> dict:
+    """Scan a run file and write its index sidecar atomically."""
+    size, mtime_ns = _file_signature(run_file)
+    spans = {}
+    with open(run_file, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        headers = list(HEADER_RE.finditer(data))
+        for k, match in enumerate(headers):
+            start = match.end()
+            end = headers[k + 1].start() if k + 1 < len(headers) else size
+            # write_completion_file terminates every block with a blank line.
+            if data[end - 2:end] == b"\n\n" and end - 2 >= start:
+                end -= 2
+            spans[int(match.group(1))] = (start, end)
+        if size:
+            data.close()
+    index = {"size": size, "mtime_ns": mtime_ns, "spans": spans}
+
+    tmp_path = f"{index_path(run_file)}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path(run_file))
+    return index
+
+
+def load_index(run_file: str) -> dict:
+    """Return the index of a run file, rebuilding it if missing or stale."""
+    try:
+        with open(index_path(run_file), encoding="utf-8") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return build_index(run_file)
+    if (index["size"], index["mtime_ns"]) != _file_signature(run_file):
+        return build_index(run_file)
+    index["spans"] = {int(k): tuple(v) for k, v in index["spans"].items()}
+    return index
+
+
+class CompletionIndex:
+    """Random access to the completions of one run file by prompt number."""
+
+    def __init__(self, run_file: str) -> None:
+        self.run_file = run_file
+        self.spans = load_index(run_file)["spans"]
+        self._file = open(run_file, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.spans else None
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def get(self, prompt_id: int) -> str:
+        """Return the completion of ``=== Prompt prompt_id ===`` (1-based)."""
+        start, end = self.spans[prompt_id]
+        # Match text-mode reads (universal newlines) used by the other readers.
+        return self._map[start:end].decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "CompletionIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_completion(run_file: str, prompt_id: int) -> str:
+    """Return one completion of a run file via its index."""
+    with CompletionIndex(run_file) as index:
+        return index.get(prompt_id)
+
+
+def read_prompt_runs(run_path: str, prompt_id: int, num_runs: int = 5) -> list[str]:
+    """Return prompt ``prompt_id``'s completion from each of ``<run_path>_run1..K.txt``."""
+    return [read_completion(f"{run_path}_run{r}.txt", prompt_id) for r in range(1, num_runs + 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Print one prompt's completions from every run")
+    parser.add_argument("run_path", help="Completion prefix, e.g. .../en_task1_qwen3-8b")
+    parser.add_argument("prompt_id", type=int, help="1-based prompt number, as in === Prompt i ===")
+    parser.add_argument("--num-runs", type=int, default=5, help="Number of runs (default: 5)")
+    args = parser.parse_args()
+
+    for run_num, text in enumerate(read_prompt_runs(args.run_path, args.prompt_id, args.num_runs), 1):
+        print(f"=== Run {run_num} / Prompt {args.prompt_id} ===")
+        print(f"{text}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Columnar (Parquet) store for completions.
+
+One Parquet file per completion prefix (``<prefix>.parquet`` next to where
+``<prefix>_run1.txt`` ... ``<prefix>_runK.txt`` would be) holds one row per
+(prompt, sample) with the columns in ``SCHEMA_FIELDS``. The ``answer``
+column stores the answer already extracted from the raw text as JSON, so
+evaluation can read that column alone instead of regex-splitting the text.
+The schema metadata records the ``EXTRACTOR_VERSION`` that column was
+extracted with; a store from another version is re-extracted from its
+``text`` column on read.
+
+A prefix is read from its store unless one of its run text files is newer
+(for instance after a ``--resume`` rerun wrote text next to an old store);
+``uses_store`` makes that choice for every reader.
+
+Run as a script to convert an existing tree of ``=== Prompt i ===`` files::
+
+    python completion_store.py --completions-dir ../../completions
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+from collections import defaultdict
+
+import answer_extraction
+from answer_extraction import TASK_KEYS
+from answer_schemas import task_from_prompt_file
+from completion_writer import read_completion_file
+
+SCHEMA_FIELDS = [
+    ("prompt_id", "int32"),  # 1-based, as in ``=== Prompt i ===``
+    ("sample_index", "int32"),  # 0-based; run K is sample K-1
+    ("text", "string"),
+    ("answer", "string"),  # JSON of the extracted answer
+    ("prompt_tokens", "int32"),
+    ("generated_tokens", "int32"),
+    ("finish_reason", "string"),
+]
+
+RUN_FILE_RE = re.compile(r"^(?P<prefix>.+)_run(?P<run>\d+)\.txt$")
+VERSION_KEY = b"extractor_version"
+
+
+def store_path(prefix: str) -> str:
+    """Parquet file holding every run of a completion prefix."""
+    return f"{prefix}.parquet"
+
+
+def uses_store(prefix: str) -> bool:
+    """Whether a prefix is read from its store: it exists and no run text file is newer."""
+    try:
+        store_mtime = os.stat(store_path(prefix)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    for path in glob.glob(f"{glob.escape(prefix)}_run*.txt"):
+        match = RUN_FILE_RE.match(path)
+        if match and match["prefix"] == prefix and os.stat(path).st_mtime_ns > store_mtime:
+            return False
+    return True
+
+
+def empty_answer(task: int):
+    """What evaluation uses for a completion without a parsable answer."""
+    return "" if task == 1 else []
+
+
+def extract_answer(text: str, task: int):
+    """Extract the answer of one completion exactly like ``eval_taskN.extract_answers``."""
+    return answer_extraction.extract_answer(text, TASK_KEYS[task], empty_answer(task))
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [(name, getattr(pa, kind)()) for name, kind in SCHEMA_FIELDS],
+        metadata={VERSION_KEY: str(answer_extraction.EXTRACTOR_VERSION).encode("ascii")},
+    )
+
+
+def extractor_version(path: str) -> int | None:
+    """``EXTRACTOR_VERSION`` the answer column of a store was extracted with (None if unrecorded)."""
+    import pyarrow.parquet as pq
+
+    value = (pq.read_schema(path).metadata or {}).get(VERSION_KEY)
+    return int(value) if value is not None else None
+
+
+def write_store(path: str, rows: list[dict]) -> None:
+    """Atomically write rows (dicts keyed by ``SCHEMA_FIELDS``) to a Parquet file."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rows = sorted(rows, key=lambda r: (r["sample_index"], r["prompt_id"]))
+    columns = {name: [row.get(name) for row in rows] for name, _ in SCHEMA_FIELDS}
+    table = pa.table(columns, schema=_schema())
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def make_rows(sample_index: int, texts: list[str], task: int, meta: dict[int, dict] | None = None) -> list[dict]:
+    """Rows for one run; ``meta`` maps 0-based prompt index to token counts and finish reason."""
+    meta = meta or {}
+    rows = []
+    for i, text in enumerate(texts):
+        rows.append({
+            "prompt_id": i + 1,
+            "sample_index": sample_index,
+            "text": text,
+            "answer": json.dumps(extract_answer(text, task), ensure_ascii=False),
+            **(meta.get(i) or {}),
+        })
+    return rows
+
+
+def write_run_store(prefix: str, run_writers: list, task: int, remove_text: bool = False) -> str:
+    """Write the finalized run files of a job to ``<prefix>.parquet``.
+
+    Token counts and finish reasons are taken from each writer's ``meta``
+    (completions restored from a previous job or the completion cache have
+    none). With ``remove_text`` the run text files are deleted afterwards.
+    """
+    rows = []
+    for sample_index, writer in enumerate(run_writers):
+        for output_file in writer.output_files:
+            rows.extend(make_rows(sample_index, read_completion_file(output_file), task, writer.meta))
+    path = store_path(prefix)
+    write_store(path, rows)
+    if remove_text:
+        for writer in run_writers:
+            for output_file in writer.output_files:
+                os.remove(output_file)
+    return path
+
+
+def num_samples(path: str) -> int:
+    """Number of samples (runs) stored in a Parquet file."""
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    sample_index = pq.read_table(path, columns=["sample_index"])["sample_index"]
+    return pc.max(sample_index).as_py() + 1 if len(sample_index) else 0
+
+
+def read_answers(path: str, sample_index: int, task: int) -> list:
+    """Read the extracted answers of one sample, reading only the answer column.
+
+    Like ``eval_taskN.extract_answers`` on the run's text file, the result
+    holds exactly one answer per prompt, in prompt order, so answer ``i``
+    belongs to dataset row ``i`` and both sources evaluate identically. If
+    the store was written by another extractor version, the answers are
+    extracted again from the ``text`` column.
+    """
+    import pyarrow.parquet as pq
+
+    current = extractor_version(path) == answer_extraction.EXTRACTOR_VERSION
+    column = "answer" if current else "text"
+    table = pq.read_table(
+        path,
+        columns=["prompt_id", column],
+        filters=[("sample_index", "=", sample_index)],
+    )
+    if table.num_rows == 0:
+        raise FileNotFoundError(f"No sample {sample_index} in {path}")
+    table = table.sort_by("prompt_id")
+    prompt_ids = table["prompt_id"].to_pylist()
+    if prompt_ids != list(range(1, len(prompt_ids) + 1)):
+        raise ValueError(f"Sample {sample_index} of {path} does not hold exactly prompts 1..{len(prompt_ids)}")
+    if not current:
+        return [extract_answer(text, task) for text in table["text"].to_pylist()]
+    return [json.loads(a) for a in table["answer"].to_pylist()]
+
+
+def read_rows(path: str, task: int) -> list[dict]:
+    """Read every row of a store, re-extracting the answers if it is from another extractor version."""
+    import pyarrow.parquet as pq
+
+    rows = pq.read_table(path).to_pylist()
+    if extractor_version(path) != answer_extraction.EXTRACTOR_VERSION:
+        for row in rows:
+            row["answer"] = json.dumps(extract_answer(row["text"], task), ensure_ascii=False)
+    return rows
+
+
+def read_texts(path: str, sample_index: int) -> list[str]:
+    """Read the raw completion texts of one sample in prompt order."""
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=["prompt_id", "text"], filters=[("sample_index", "=", sample_index)])
+    return table.sort_by("prompt_id")["text"].to_pylist()
+
+
+def find_run_files(completions_dir: str) -> dict[str, dict[int, str]]:
+    """Group ``<prefix>_runK.txt`` files under a directory by prefix."""
+    prefixes: dict[str, dict[int, str]] = defaultdict(dict)
+    for path in glob.glob(os.path.join(completions_dir, "**", "*_run*.txt"), recursive=True):
+        match = RUN_FILE_RE.match(path)
+        if match:
+            prefixes[match["prefix"]][int(match["run"])] = path
+    return prefixes
+
+
+def convert_prefix(prefix: str, run_files: dict[int, str], task: int, remove_text: bool = False) -> None:
+    """Convert the text files of one prefix into ``<prefix>.parquet``."""
+    rows = []
+    for run_num in sorted(run_files):
+        rows.extend(make_rows(run_num - 1, read_completion_file(run_files[run_num]), task))
+    write_store(store_path(prefix), rows)
+    if remove_text:
+        for path in run_files.values():
+            os.remove(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert === Prompt i === completion files to Parquet")
+    parser.add_argument(
+        "--completions-dir",
+        type=str,
+        default="../../completions",
+        help="Root of the completions tree (default: ../../completions)",
+    )
+    parser.add_argument("--overwrite", action="store_true", help="Rebuild stores that already exist")
+    parser.add_argument(
+        "--remove-text",
+        action="store_true",
+        help="Delete the text files once their store has been written",
+    )
+    args = parser.parse_args()
+
+    prefixes = find_run_files(args.completions_dir)
+    print(f"Found {len(prefixes)} completion prefixes under {args.completions_dir}")
+    for prefix, run_files in sorted(prefixes.items()):
+        task = task_from_prompt_file(prefix)
+        if task is None:
+            print(f"Skipping {prefix}: could not determine the task from its name")
+            continue
+        if os.path.exists(store_path(prefix)) and not args.overwrite:
+            print(f"Skipping {prefix}: store already exists")
+            continue
+        convert_prefix(prefix, run_files, task, remove_text=args.remove_text)
+        print(f"Wrote {store_path(prefix)} ({len(run_files)} runs)")
+
+
+if __name__ == "__main__":
+    main()
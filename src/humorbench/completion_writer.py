@@ -0,0 +1,220 @@
+"""Incremental, resumable writer for ``=== Prompt i ===`` completion files."""
+
+import bisect
+import json
+import os
+import re
+
+
+def progress_path(output_file: str) -> str:
+    """Return the progress sidecar path for an output file."""
+    return f"{output_file}.progress.jsonl"
+
+
+def write_completion_file(output_file: str, responses: list[str]) -> None:
+    """Atomically write responses in the ``=== Prompt i ===`` format."""
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        for i, response in enumerate(responses, 1):
+            f.write(f"=== Prompt {i} ===\n")
+            f.write(f"{response}\n\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, output_file)
+
+
+def read_completion_file(output_file: str) -> list[str]:
+    """Read back the responses of a file written by ``write_completion_file``."""
+    with open(output_file, encoding="utf-8") as f:
+        text = f.read()
+    blocks = re.split(r"^=== Prompt \d+ ===\n", text, flags=re.MULTILINE)[1:]
+    return [block[:-2] if block.endswith("\n\n") else block for block in blocks]
+
+
+class CompletionWriter:
+    """Persist completions one at a time as the engine finishes them.
+
+    Every completion is appended to ``<output>.progress.jsonl`` and fsync'd
+    before the next one is accepted, so a preempted job loses at most the
+    requests that were still in flight. Once all prompts have a completion,
+    ``finalize`` writes the usual ``=== Prompt i ===`` file in prompt order
+    and removes the sidecar.
+    """
+
+    def __init__(self, output_file: str, num_prompts: int, resume: bool = False):
+        """Open the writer.
+
+        Args:
+            output_file: Final ``=== Prompt i ===`` file to produce.
+            num_prompts: Number of prompts the file must contain.
+            resume: Keep completions recorded by a previous, interrupted run
+                instead of starting from scratch.
+        """
+        self.output_file = output_file
+        self.progress_file = progress_path(output_file)
+        self.num_prompts = num_prompts
+        self.responses: dict[int, str] = {}
+        self.meta: dict[int, dict] = {}
+        self.finished = False
+
+        if resume and os.path.exists(self.progress_file):
+            self._load_progress()
+        elif resume and os.path.exists(output_file):
+            # A finalized file without a sidecar means the run already completed.
+            self.finished = True
+
+        out_dir = os.path.dirname(output_file)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        mode = "a" if resume else "w"
+        self._progress = None if self.finished else open(
+            self.progress_file, mode, encoding="utf-8"
+        )
+        if self._progress is not None and self._progress.tell() > 0:
+            # Terminate a torn last line so the next record starts cleanly.
+            with open(self.progress_file, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._progress.write("\n")
+
+    def _load_progress(self) -> None:
+        with open(self.progress_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be torn if the job died mid-write.
+                    continue
+                if 0 <= record["index"] < self.num_prompts:
+                    self.responses[record["index"]] = record["text"]
+                    if record.get("meta"):
+                        self.meta[record["index"]] = record["meta"]
+
+    @property
+    def output_files(self) -> list[str]:
+        return [self.output_file]
+
+    @property
+    def pending(self) -> list[int]:
+        """Indices of prompts that still have no completion."""
+        if self.finished:
+            return []
+        return [i for i in range(self.num_prompts) if i not in self.responses]
+
+    def write(self, index: int, text: str, meta: dict | None = None) -> None:
+        """Record the completion for prompt ``index`` durably.
+
+        ``meta`` (token counts, finish reason) is kept alongside the text
+        for the Parquet store; it is not part of the text output.
+        """
+        record = {"index": index, "text": text}
+        if meta:
+            record["meta"] = meta
+            self.meta[index] = meta
+        self._progress.write(json.dumps(record) + "\n")
+        self._progress.flush()
+        os.fsync(self._progress.fileno())
+        self.responses[index] = text
+
+    def finalize(self) -> bool:
+        """Write the ordered output file if every prompt has a completion.
+
+        Returns:
+            True if the output file is complete.
+        """
+        if self.finished:
+            return True
+        if self.pending:
+            return False
+        self.close()
+        write_completion_file(
+            self.output_file, [self.responses[i] for i in range(self.num_prompts)]
+        )
+        os.remove(self.progress_file)
+        self.finished = True
+        return True
+
+    def close(self) -> None:
+        """Close the progress sidecar without finalizing."""
+        if self._progress is not None:
+            self._progress.close()
+            self._progress = None
+
+
+class StdoutWriter:
+    """Writer used when no output file is given: prints completions in order."""
+
+    def __init__(self, num_prompts: int) -> None:
+        self.num_prompts = num_prompts
+        self.responses: dict[int, str] = {}
+        self.finished = False
+
+    @property
+    def output_files(self) -> list[str]:
+        return []
+
+    @property
+    def pending(self) -> list[int]:
+        if self.finished:
+            return []
+        return [i for i in range(self.num_prompts) if i not in self.responses]
+
+    def write(self, index: int, text: str, meta: dict | None = None) -> None:
+        self.responses[index] = text
+
+    def finalize(self) -> bool:
+        if self.finished:
+            return True
+        if self.pending:
+            return False
+        for i in range(self.num_prompts):
+            print(f"=== Prompt {i + 1} ===")
+            print(f"{self.responses[i]}\n")
+        self.responses.clear()
+        self.finished = True
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class WriterGroup:
+    """Expose several writers as one writer over their concatenated prompts.
+
+    Used to submit the prompts of many files in a single generate batch:
+    global index ``i`` is routed to the writer whose prompt range contains it.
+    """
+
+    def __init__(self, writers: list) -> None:
+        self.writers = writers
+        self.offsets = []
+        total = 0
+        for writer in writers:
+            self.offsets.append(total)
+            total += writer.num_prompts
+        self.num_prompts = total
+
+    @property
+    def output_files(self) -> list[str]:
+        return [f for writer in self.writers for f in writer.output_files]
+
+    @property
+    def pending(self) -> list[int]:
+        return [
+            offset + i
+            for offset, writer in zip(self.offsets, self.writers, strict=True)
+            for i in writer.pending
+        ]
+
+    def write(self, index: int, text: str, meta: dict | None = None) -> None:
+        k = bisect.bisect_right(self.offsets, index) - 1
+        self.writers[k].write(index - self.offsets[k], text, meta)
+
+    def finalize(self) -> bool:
+        # Finalize every writer, not just up to the first that is incomplete
+        results = [writer.finalize() for writer in self.writers]
+        return all(results)
+
+    def close(self) -> None:
+        for writer in self.writers:
+            writer.close()
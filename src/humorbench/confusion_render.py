@@ -0,0 +1,168 @@
+"""Confusion matrices saved as data, and their deferred rendering to heatmaps.
+
+``eval_taskN`` no longer plots. For every k it writes the confusion matrix
+(true labels as rows, predicted labels as columns, both sorted) to
+``<save_path>_pass@<k>.csv`` with its labels and to ``.npy`` as a bare
+int64 array in the same order. The files are only rewritten when the
+counts change.
+
+Rendering the PNGs is a separate stage. The evaluation drivers collect one
+``(csv, png, title)`` job per matrix and call ``render_matrices`` after the
+results are written (unless ``--no-render``). The jobs run in a process pool
+on the headless Agg backend, and a PNG newer than its CSV is skipped, so a
+rerun only renders the matrices that changed.
+
+Run as a script to render every matrix under a results directory::
+
+    python confusion_render.py ../../results
+"""
+
+import argparse
+import os
+import re
+import time
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from eval_metrics import DEFAULT_KS
+
+MATRIX_SUFFIXES = (".csv", ".npy")
+
+RenderJob = tuple[str, str, str]
+
+
+def matrix_paths(save_path: str, ks: Sequence[int] = DEFAULT_KS) -> list[str]:
+    """Matrix files written by ``eval_taskN`` for one save path."""
+    return [f"{save_path}_pass@{k}{suffix}" for k in ks for suffix in MATRIX_SUFFIXES]
+
+
+def save_matrix(save_path: str, k: int, cm: pd.DataFrame) -> bool:
+    """Write a confusion matrix as CSV and ``.npy``; returns False if it is unchanged."""
+    prefix = f"{save_path}_pass@{k}"
+    text = cm.to_csv()
+    try:
+        with open(f"{prefix}.csv", encoding="utf-8") as f:
+            if f.read() == text and os.path.exists(f"{prefix}.npy"):
+                return False
+    except FileNotFoundError:
+        pass
+
+    # The CSV goes last: its mtime is what render_matrices compares against
+    tmp_suffix = f".tmp.{os.getpid()}"
+    with open(f"{prefix}.npy{tmp_suffix}", "wb") as f:
+        np.save(f, cm.to_numpy(dtype=np.int64))
+    os.replace(f"{prefix}.npy{tmp_suffix}", f"{prefix}.npy")
+    with open(f"{prefix}.csv{tmp_suffix}", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(f"{prefix}.csv{tmp_suffix}", f"{prefix}.csv")
+    return True
+
+
+def render_jobs(save_path: str, title: str, ks: Sequence[int] = DEFAULT_KS) -> list[RenderJob]:
+    """Render jobs of the matrices of one save path, titled ``"<title> Pass@<k>"``."""
+    return [(f"{save_path}_pass@{k}.csv", f"{save_path}_pass@{k}.png", f"{title} Pass@{k}") for k in ks]
+
+
+def is_stale(csv_path: str, png_path: str) -> bool:
+    """Whether the PNG is missing or older than its matrix."""
+    try:
+        return os.stat(png_path).st_mtime_ns < os.stat(csv_path).st_mtime_ns
+    except FileNotFoundError:
+        return True
+
+
+def render_matrix(csv_path: str, png_path: str, title: str) -> str:
+    """Render one saved matrix as an annotated heatmap."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    cm = pd.read_csv(csv_path, index_col=0)
+    ls = list(cm.columns)
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(
+        cm,
+        annot=True,
+        fmt="d",
+        cmap="Blues",
+        xticklabels=ls,
+        yticklabels=ls
+    )
+
+    plt.xlabel("Predicted label")
+    plt.ylabel("True label")
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(png_path)
+    plt.close()
+    return png_path
+
+
+def render_matrices(jobs: list[RenderJob], workers: int | None = None, force: bool = False) -> int:
+    """Render the jobs whose PNG is stale across a process pool.
+
+    Args:
+        jobs: ``(csv_path, png_path, title)`` of each matrix.
+        workers: Number of worker processes (default: number of cores).
+            With one worker, or a single stale job, no pool is started.
+        force: Render every job, even if its PNG is up to date.
+
+    Returns:
+        The number of PNGs rendered.
+    """
+    stale = [job for job in jobs if force or is_stale(job[0], job[1])]
+    print(f"Rendering {len(stale)} of {len(jobs)} confusion matrices")
+    workers = min(workers or os.cpu_count() or 1, len(stale))
+    if workers <= 1:
+        for job in stale:
+            render_matrix(*job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_matrix, *zip(*stale, strict=True)))
+    return len(stale)
+
+
+def find_jobs(results_dir: str) -> list[RenderJob]:
+    """Render jobs of every ``*_pass@<k>.csv`` matrix under ``results_dir``.
+
+    Titles follow the drivers' ``"Task N Confusion Matrix <model> Pass@<k>"``
+    for files named ``taskN_confusion_matrix_<model>_pass@<k>.csv``.
+    """
+    jobs = []
+    for root, _, files in os.walk(results_dir):
+        for name in sorted(files):
+            match = re.fullmatch(r"(.*)_pass@(\d+)\.csv", name)
+            if not match:
+                continue
+            stem, k = match.groups()
+            named = re.fullmatch(r"task(\d)_confusion_matrix_(.+)", stem)
+            title = f"Task {named.group(1)} Confusion Matrix {named.group(2)}" if named else stem
+            path = os.path.join(root, name)
+            jobs.append((path, path[: -len(".csv")] + ".png", f"{title} Pass@{k}"))
+    return jobs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render saved confusion matrices to PNG heatmaps")
+    parser.add_argument("results_dirs", type=str, nargs="+", help="Directories searched for *_pass@<k>.csv matrices")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Rendering processes (default: number of cores)",
+    )
+    parser.add_argument("--force", action="store_true", help="Re-render PNGs that are up to date")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    jobs = [job for results_dir in args.results_dirs for job in find_jobs(results_dir)]
+    rendered = render_matrices(jobs, workers=args.workers, force=args.force)
+    print(f"Rendered {rendered} PNGs in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
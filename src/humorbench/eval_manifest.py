@@ -0,0 +1,168 @@
+"""Manifest of what produced each evaluation result, for incremental reruns.
+
+Each evaluation script keeps ``<out_path>_manifest.json`` next to its
+``*_res.csv`` files. For every (task, model) cell it records the
+fingerprint of the cell's inputs (dataset TSVs, completion files, the
+evaluation code and any parameters), the confusion-matrix files it wrote
+and its metrics. On a rerun a cell whose fingerprint is unchanged and
+whose outputs still exist is not evaluated again; its stored metrics go
+into the CSV instead.
+
+File hashes are memoised in the manifest by (size, mtime), so an
+unchanged tree is fingerprinted without re-reading every completion.
+"""
+
+import hashlib
+import json
+import os
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from confusion_render import matrix_paths
+from eval_metrics import DEFAULT_KS
+from run_dedup import file_digest
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules whose source determines the metrics of a cell.
+CODE_FILES = [
+    "eval_task1.py",
+    "eval_task2.py",
+    "answer_extraction.py",
+    "completion_store.py",
+    "eval_metrics.py",
+    "label_taxonomy.py",
+    "confusion_render.py",
+    "experiment.py",
+    "answer_cache.py",
+    "run_dedup.py",
+    "eval_manifest.py",
+    "completion_writer.py",
+]
+
+
+def code_version(files: list[str] = CODE_FILES) -> str:
+    """SHA-256 over the source of the evaluation code."""
+    digest = hashlib.sha256()
+    for name in files:
+        digest.update(name.encode("utf-8"))
+        digest.update(file_digest(os.path.join(_HERE, name)).encode("ascii"))
+    return digest.hexdigest()
+
+
+def run_inputs(run_path: str, num_runs: int = 5) -> list[str]:
+    """Completion files a run path is evaluated from (Parquet store or run files)."""
+    from completion_store import store_path, uses_store
+
+    if uses_store(run_path):
+        return [store_path(run_path)]
+    return [f"{run_path}_run{r}.txt" for r in range(1, num_runs + 1)]
+
+
+def cm_outputs(save_path: str, ks: Sequence[int] = DEFAULT_KS) -> list[str]:
+    """Confusion-matrix files written by ``eval_taskN`` for one save path."""
+    return matrix_paths(save_path, ks)
+
+
+class EvalManifest:
+    """Fingerprints, outputs and metrics of the cells of one results CSV."""
+
+    def __init__(self, path: str, force: bool = False) -> None:
+        self.path = path
+        self.force = force
+        self.code = code_version()
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        self.files: dict[str, list] = data.get("files", {})
+        self.cells: dict[str, dict] = data.get("cells", {})
+
+    def _digest(self, path: str) -> str | None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        cached = self.files.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_digest(path)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def fingerprint(self, inputs: list[str], params: dict | None = None) -> str:
+        """Fingerprint of a cell: its input files' contents, the code version and ``params``."""
+        record = {
+            "inputs": {path: self._digest(path) for path in inputs},
+            "code": self.code,
+            "params": params or {},
+        }
+        encoded = json.dumps(record, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def lookup(self, cell: str, inputs: list[str], params: dict | None = None) -> tuple[Any, ...] | None:
+        """Stored result of a cell if its fingerprint is unchanged and its outputs exist, else None."""
+        entry = self.cells.get(cell)
+        if (
+            self.force
+            or entry is None
+            or entry["fingerprint"] != self.fingerprint(inputs, params)
+            or not all(os.path.exists(path) for path in entry["outputs"])
+        ):
+            return None
+        print(f"{cell}: inputs unchanged, reusing results from {self.path}")
+        return tuple(tuple(x) if isinstance(x, list) else x for x in entry["result"])
+
+    def record(
+        self,
+        cell: str,
+        inputs: list[str],
+        outputs: list[str],
+        result: tuple[Any, ...],
+        params: dict | None = None,
+    ) -> None:
+        """Store the result of a freshly evaluated cell and save the manifest."""
+        self.cells[cell] = {
+            "fingerprint": self.fingerprint(inputs, params),
+            "inputs": inputs,
+            "outputs": outputs,
+            "result": result,
+        }
+        self.save()
+
+    def run(
+        self,
+        cell: str,
+        inputs: list[str],
+        outputs: list[str],
+        fn: Callable[..., tuple[Any, ...]],
+        *args,
+        params: dict | None = None,
+        **kwargs,
+    ) -> tuple[Any, ...]:
+        """Return ``fn(*args, **kwargs)``, or the stored result if the cell is up to date.
+
+        Args:
+            cell: Cell name, e.g. ``"task1/qwen3-8b"``.
+            inputs: Files the cell reads (dataset TSVs and completion files).
+            outputs: Files the cell writes; a missing one forces a rerun.
+            fn: Evaluation function, e.g. ``eval_task1``; its result must be
+                JSON-serialisable as nested lists (tuples are restored).
+            params: Extra values that change the result, e.g. the joke column.
+        """
+        result = self.lookup(cell, inputs, params)
+        if result is None:
+            result = fn(*args, **kwargs)
+            self.record(cell, inputs, outputs, result, params)
+        return result
+
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        out_dir = os.path.dirname(self.path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"code": self.code, "files": self.files, "cells": self.cells}, f, indent=1, default=float)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,400 @@
+"""Vectorised pass@k metrics on integer label codes.
+
+Labels are encoded once to integer codes (``LabelCodes``), predictions are
+held as a (questions x samples x lines) int array padded with ``PAD``, and
+pass@k counts, the confusion matrix, macro-F1 and one-vs-rest AUC are all
+computed with NumPy from that array. The results are identical to the
+previous per-item loops feeding ``sklearn.metrics.f1_score`` and
+``roc_auc_score`` on ``label_binarize``-d string labels:
+
+- macro-F1 averages ``2tp / (2tp + fp + fn)`` over every label that occurs
+  in the truths or the predictions, in sorted label order, so unknown
+  predictions that keep their own code count as extra labels, as before;
+- with 0/1 scores the ROC curve of class ``c`` has a single inner point
+  ``(fpr, tpr)``, so its AUC is the trapezoid area
+  ``fpr * tpr / 2 + (1 - fpr) * (1 + tpr) / 2`` averaged over the classes
+  present in the truths (only the second class if there are two).
+
+``evaluate_all_k`` scores every k from one correctness tensor: pass@k
+accuracy is the fraction of lines answered correctly by one of the first
+``k`` samples (for k = 1, the accuracy of the first sample), the unbiased
+pass@k is ``1 - C(n - c, k) / C(n, k)`` over the ``n`` samples of each
+line (``c`` of them correct), majority@k votes over the first ``k``
+samples, and the confusion matrix of the first ``k`` samples is a
+cumulative sum of per-sample matrices.
+
+``bootstrap_ci`` resamples questions (jokes) with replacement. Per-question
+sufficient statistics (pass@k, unbiased pass@k and majority@k sums,
+per-label tp / predicted / true counts) are stacked into one matrix, so all
+resamples of every metric come from a single (resamples x questions)
+weight-matrix product rather than from re-scoring each resample.
+
+Run as a script to benchmark against the sklearn path::
+
+    python eval_metrics.py
+"""
+
+import argparse
+import time
+from collections.abc import Sequence
+from math import comb
+
+import numpy as np
+
+PAD = -1
+
+DEFAULT_KS = (1, 5)
+DEFAULT_RESAMPLES = 10000
+# Per-k columns of the results CSVs, in the order of eval_taskN's metric tuples:
+# the point estimates, then the lower and upper bootstrap bound of each
+METRIC_COLUMNS = ("pass@{k}_acc", "pass@{k}_f1", "pass@{k}_auc", "maj@{k}_acc", "pass@{k}_unbiased")
+# Keys of evaluate_all_k and bootstrap_ci results behind each of METRIC_COLUMNS
+METRIC_KEYS = ("pass", "f1", "auc", "majority", "unbiased")
+CI_SUFFIXES = ("_lo", "_hi")
+
+
+class LabelCodes:
+    """Integer codes for label names; unseen names get new codes on first use."""
+
+    def __init__(self, labels: Sequence[str]) -> None:
+        self.names: list[str] = list(labels)
+        self.codes: dict[str, int] = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def code(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+def pass_at_k(pred: np.ndarray, truth: np.ndarray, k: int) -> tuple[int, int, np.ndarray, np.ndarray]:
+    """Score the first ``k`` samples of every question.
+
+    Args:
+        pred: (questions, samples, lines) predicted codes, ``samples >= k``.
+        truth: (questions, lines) true codes; ``PAD`` marks lines a
+            question does not have.
+        k: Number of samples per question.
+
+    Returns:
+        ``(num_correct, total, y_true, y_pred)``: lines with a correct
+        answer among the ``k`` samples, number of lines, and the flat
+        (truth, prediction) code pairs of every line and sample.
+    """
+    pred = pred[:, :k, :]
+    valid = truth != PAD
+    hits = (pred == truth[:, None, :]).any(axis=1) & valid
+    pair_mask = np.broadcast_to(valid[:, None, :], pred.shape)
+    y_true = np.broadcast_to(truth[:, None, :], pred.shape)[pair_mask]
+    y_pred = pred[pair_mask]
+    return int(hits.sum()), int(valid.sum()), y_true, y_pred
+
+
+def confusion_matrix(y_true: np.ndarray, y_pred: np.ndarray, num_codes: int) -> np.ndarray:
+    """(num_codes, num_codes) counts, rows are truths and columns predictions."""
+    counts = np.bincount(y_true * num_codes + y_pred, minlength=num_codes * num_codes)
+    return counts.reshape(num_codes, num_codes)
+
+
+def macro_f1(cm: np.ndarray, names: Sequence[str]) -> float:
+    """Macro-F1 over the labels present in the truths or the predictions."""
+    tp = np.diag(cm).astype(float)
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    present = sorted(np.flatnonzero((support > 0) | (predicted > 0)), key=lambda c: names[c])
+    tp = tp[present]
+    fp = predicted[present] - tp
+    fn = support[present] - tp
+    return float(np.average(2 * tp / (2 * tp + fp + fn)))
+
+
+def ovr_auc(cm: np.ndarray, names: Sequence[str]) -> float:
+    """Macro one-vs-rest AUC of 0/1 predictions over the classes present in the truths."""
+    support = cm.sum(axis=1)
+    predicted = cm.sum(axis=0)
+    n = support.sum()
+    classes = sorted(np.flatnonzero(support > 0), key=lambda c: names[c])
+    if len(classes) < 2:
+        raise ValueError("Only one class present in y_true. ROC AUC score is not defined in that case.")
+    if len(classes) == 2:
+        # label_binarize keeps a single column (the second class) for two classes
+        classes = classes[1:]
+    scores = []
+    for c in classes:
+        tpr = cm[c, c] / support[c]
+        fpr = (predicted[c] - cm[c, c]) / (n - support[c])
+        if tpr == fpr:
+            # roc_curve drops the collinear inner point
+            scores.append(0.5)
+        else:
+            scores.append(fpr * tpr / 2.0 + (1.0 - fpr) * (1.0 + tpr) / 2.0)
+    return float(np.average(scores))
+
+
+def confusion_dict(cm: np.ndarray, codes: LabelCodes, labels: Sequence[str], other: str = "NA") -> dict[str, dict[str, int]]:
+    """Dict-of-dict confusion matrix over ``labels``; other codes are counted as ``other``."""
+    fold = np.array([labels.index(name) if name in labels else labels.index(other) for name in codes.names])
+    folded = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    np.add.at(folded, (fold[:, None], fold[None, :]), cm)
+    return {t: dict(zip(labels, row, strict=True)) for t, row in zip(labels, folded.tolist(), strict=True)}
+
+
+def unbiased_pass_at_k(num_correct: np.ndarray, n: int, k: int) -> float:
+    """Mean of ``1 - C(n - c, k) / C(n, k)`` over lines with ``c`` correct samples out of ``n``."""
+    table = np.array([1.0 - comb(n - c, k) / comb(n, k) for c in range(n + 1)])
+    return float(table[num_correct].mean())
+
+
+def majority_votes(pred: np.ndarray, k: int) -> np.ndarray:
+    """Most frequent code among the first ``k`` samples; ties go to the earliest sample."""
+    first = pred[:, :k, :]
+    counts = (first[:, :, None, :] == first[:, None, :, :]).sum(axis=2)
+    winner = counts.argmax(axis=1)
+    return np.take_along_axis(first, winner[:, None, :], axis=1)[:, 0, :]
+
+
+def evaluate_all_k(pred: np.ndarray, truth: np.ndarray, names: Sequence[str], ks: Sequence[int]) -> dict[int, dict]:
+    """Score every k in ``ks`` from one pass over the predictions.
+
+    Args:
+        pred: (questions, n, lines) predicted codes for all ``n`` samples.
+        truth: (questions, lines) true codes, ``PAD`` for missing lines.
+        names: Label name of every code.
+        ks: Values of k, each at most ``n``.
+
+    Returns:
+        For each k: ``pass`` (pass@k accuracy, ``num_correct / total``),
+        ``unbiased`` (unbiased pass@k), ``majority`` (majority@k accuracy),
+        ``num_correct`` (lines answered correctly by one of the first k
+        samples), ``total`` (lines), and the ``cm`` (confusion matrix of the
+        first k samples), ``f1`` and ``auc`` computed from it.
+    """
+    _, n, _ = pred.shape
+    num_codes = len(names)
+    valid = truth != PAD
+    total = int(valid.sum())
+    correct = (pred == truth[:, None, :]) & valid[:, None, :]
+    correct_per_line = correct.sum(axis=1)[valid]
+    first_hit = np.cumsum(correct, axis=1) > 0
+
+    # Confusion matrix of each sample, then of the first k samples by cumulative sum
+    sample = np.broadcast_to(np.arange(n)[None, :, None], pred.shape)
+    mask = np.broadcast_to(valid[:, None, :], pred.shape)
+    y_true = np.broadcast_to(truth[:, None, :], pred.shape)[mask]
+    flat = (sample[mask] * num_codes + y_true) * num_codes + pred[mask]
+    per_sample = np.bincount(flat, minlength=n * num_codes * num_codes).reshape(n, num_codes, num_codes)
+    cumulative = np.cumsum(per_sample, axis=0)
+
+    results = {}
+    for k in ks:
+        if not 1 <= k <= n:
+            raise ValueError(f"k={k} needs between 1 and {n} samples")
+        cm = cumulative[k - 1]
+        majority = majority_votes(pred, k)
+        num_correct = int(first_hit[:, k - 1, :][valid].sum())
+        results[k] = {
+            "pass": num_correct / total,
+            "unbiased": unbiased_pass_at_k(correct_per_line, n, k),
+            "majority": float((majority == truth)[valid].mean()),
+            "num_correct": num_correct,
+            "total": total,
+            "cm": cm,
+            "f1": macro_f1(cm, names),
+            "auc": ovr_auc(cm, names),
+        }
+    return results
+
+
+def bootstrap_ci(
+    pred: np.ndarray,
+    truth: np.ndarray,
+    names: Sequence[str],
+    ks: Sequence[int],
+    num_resamples: int = DEFAULT_RESAMPLES,
+    level: float = 0.95,
+    seed: int = 0,
+    batch_size: int = 1000,
+) -> dict[int, dict[str, tuple[float, float]]]:
+    """Percentile bootstrap intervals of every metric of ``evaluate_all_k``, resampling questions.
+
+    Args:
+        pred: (questions, n, lines) predicted codes.
+        truth: (questions, lines) true codes, ``PAD`` for missing lines.
+        names: Label name of every code.
+        ks: Values of k.
+        num_resamples: Number of bootstrap resamples.
+        level: Coverage of the intervals.
+        seed: Seed of the resampling, so intervals are reproducible.
+        batch_size: Resamples drawn per matrix product.
+
+    Returns:
+        For each k, ``(low, high)`` of every metric in ``METRIC_KEYS``.
+        AUC averages over the classes present in each resample.
+    """
+    num_questions, n, _ = pred.shape
+    num_codes = len(names)
+    valid = truth != PAD
+    correct = (pred == truth[:, None, :]) & valid[:, None, :]
+    correct_per_line = correct.sum(axis=1)
+    first_hit = np.cumsum(correct, axis=1) > 0
+
+    # Per-question label counts of each sample, accumulated over the first k samples
+    question = np.broadcast_to(np.arange(num_questions)[None, :, None], (n, num_questions, pred.shape[2]))
+    sample = np.broadcast_to(np.arange(n)[:, None, None], question.shape)
+    pred_s = pred.transpose(1, 0, 2)
+    mask = np.broadcast_to(valid[None], question.shape)
+    hit = correct.transpose(1, 0, 2) & mask
+    base = (sample * num_questions + question) * num_codes
+    size = n * num_questions * num_codes
+    predicted = np.bincount((base + pred_s)[mask], minlength=size).reshape(n, num_questions, num_codes).cumsum(axis=0)
+    true_pos = np.bincount((base + pred_s)[hit], minlength=size).reshape(n, num_questions, num_codes).cumsum(axis=0)
+    support = np.bincount((np.arange(num_questions)[:, None] * num_codes + truth)[valid], minlength=num_questions * num_codes)
+    support = support.reshape(num_questions, num_codes)
+
+    # Columns in name order, so the two-class AUC case keeps the second class like ovr_auc
+    order = np.argsort(np.asarray(names, dtype=object))
+    blocks = [valid.sum(axis=1)[:, None]]
+    for k in ks:
+        table = np.array([1.0 - comb(n - c, k) / comb(n, k) for c in range(n + 1)])
+        majority = (majority_votes(pred, k) == truth) & valid
+        blocks += [
+            first_hit[:, k - 1, :].sum(axis=1)[:, None],
+            (table[correct_per_line] * valid).sum(axis=1)[:, None],
+            majority.sum(axis=1)[:, None],
+            true_pos[k - 1][:, order],
+            predicted[k - 1][:, order],
+            k * support[:, order],
+        ]
+    stats = np.hstack(blocks).astype(float)
+
+    # Resample in batches: each batch is a (batch, questions) matrix of multinomial
+    # weights times the per-question statistics, so memory stays bounded
+    rng = np.random.default_rng(seed)
+    probs = np.full(num_questions, 1.0 / num_questions)
+    resampled = np.vstack([
+        rng.multinomial(num_questions, probs, size=min(batch_size, num_resamples - start)).astype(float) @ stats
+        for start in range(0, num_resamples, batch_size)
+    ])
+
+    bounds = [50 * (1 - level), 50 * (1 + level)]
+    total = resampled[:, 0]
+    results = {}
+    col = 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k in ks:
+            pass_b, unbiased_b, majority_b = (resampled[:, col + i] / total for i in range(3))
+            tp, pr, sup = (resampled[:, col + 3 + i * num_codes:col + 3 + (i + 1) * num_codes] for i in range(3))
+            col += 3 + 3 * num_codes
+
+            present = (sup > 0) | (pr > 0)
+            f1_b = np.where(present, 2 * tp / (pr + sup), 0.0).sum(axis=1) / present.sum(axis=1)
+
+            classes = sup > 0
+            num_classes = classes.sum(axis=1)
+            two = num_classes == 2
+            classes[two] &= np.cumsum(classes[two], axis=1) == 2
+            rows = sup.sum(axis=1, keepdims=True)
+            auc = 0.5 * (1 + tp / sup - (pr - tp) / (rows - sup))
+            auc_b = np.where(classes, auc, 0.0).sum(axis=1) / classes.sum(axis=1)
+            auc_b[num_classes < 2] = np.nan
+
+            results[k] = {
+                name: tuple(float(x) for x in np.nanpercentile(values, bounds))
+                for name, values in zip(METRIC_KEYS, (pass_b, f1_b, auc_b, majority_b, unbiased_b), strict=True)
+            }
+    return results
+
+
+def result_columns(k: int) -> list[str]:
+    """CSV columns of one k: the metrics, then ``_lo``/``_hi`` bounds of each."""
+    metrics = [column.format(k=k) for column in METRIC_COLUMNS]
+    return metrics + [f"{column}{suffix}" for column in metrics for suffix in CI_SUFFIXES]
+
+
+def new_results(ks: Sequence[int] = DEFAULT_KS) -> dict[str, list]:
+    """Empty results table (model, distinct runs, then the per-k columns) as used by the evaluation scripts."""
+    columns = ["model", "distinct_runs"] + [column for k in ks for column in result_columns(k)]
+    return {column: [] for column in columns}
+
+
+def append_results(
+    results: dict[str, list],
+    model: str,
+    metrics: Sequence[Sequence[float]],
+    ks: Sequence[int] = DEFAULT_KS,
+    distinct_runs: int | None = None,
+) -> None:
+    """Add one model's per-k metric tuples (as returned by ``eval_taskN``) to a results table.
+
+    ``distinct_runs`` is how many of the model's runs are not identical to
+    an earlier one (see ``run_dedup.distinct_runs``); pass@k for a k above
+    it counts duplicated samples.
+    """
+    results["model"].append(model)
+    results["distinct_runs"].append(distinct_runs)
+    for k, values in zip(ks, metrics, strict=True):
+        for column, value in zip(result_columns(k), values, strict=True):
+            results[column].append(value)
+
+
+def sklearn_metrics(y_true: list[str], y_pred: list[str]) -> tuple[float, float]:
+    """Macro-F1 and AUC computed the previous way, from string labels with sklearn."""
+    from sklearn.metrics import f1_score, roc_auc_score
+    from sklearn.preprocessing import label_binarize
+
+    f1 = f1_score(y_true, y_pred, average="macro")
+    classes = np.unique(y_true)
+    auc = roc_auc_score(
+        label_binarize(y_true, classes=classes),
+        label_binarize(y_pred, classes=classes),
+        average="macro",
+        multi_class="ovr",
+    )
+    return f1, auc
+
+
+def benchmark(questions: int, samples: int, lines: int, num_labels: int, seed: int) -> None:
+    """Time both paths on random Task 2-shaped predictions and check they agree."""
+    rng = np.random.default_rng(seed)
+    codes = LabelCodes([f"label{i}" for i in range(num_labels)])
+    truth = rng.integers(0, num_labels, size=(questions, lines))
+    truth[rng.random(truth.shape) < 0.3] = PAD
+    # Mostly correct predictions, some junk outside the label set
+    pred = np.where(rng.random((questions, samples, lines)) < 0.6, truth[:, None, :], rng.integers(0, num_labels, size=(questions, samples, lines)))
+    pred[rng.random(pred.shape) < 0.05] = codes.code("junk")
+    pred[pred == PAD] = codes.code("junk")
+
+    start = time.perf_counter()
+    _, _, y_true, y_pred = pass_at_k(pred, truth, samples)
+    cm = confusion_matrix(y_true, y_pred, len(codes))
+    fast = (macro_f1(cm, codes.names), ovr_auc(cm, codes.names))
+    fast_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    names = np.array(codes.names)
+    slow = sklearn_metrics(names[y_true].tolist(), names[y_pred].tolist())
+    slow_time = time.perf_counter() - start
+
+    print(f"{len(y_true)} (truth, prediction) pairs")
+    print(f"  sklearn: {slow_time * 1e3:.1f} ms  f1={slow[0]!r} auc={slow[1]!r}")
+    print(f"    numpy: {fast_time * 1e3:.1f} ms  f1={fast[0]!r} auc={fast[1]!r}")
+    print(f"  identical: {fast == tuple(slow)}, speedup {slow_time / fast_time:.0f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the vectorised metrics against sklearn")
+    parser.add_argument("--questions", type=int, default=2000, help="Number of questions (default: 2000)")
+    parser.add_argument("--samples", type=int, default=5, help="Samples per question (default: 5)")
+    parser.add_argument("--lines", type=int, default=10, help="Maximum lines per question (default: 10)")
+    parser.add_argument("--num-labels", type=int, default=14, help="Number of labels (default: 14)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+    benchmark(args.questions, args.samples, args.lines, args.num_labels, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,51 @@
-import re
-import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
-from sklearn.metrics import f1_score, roc_auc_score
-from sklearn.preprocessing import label_binarize
-
-def extract_answers(filepath):
-    with open(filepath, "r", encoding="utf-8") as f:
-        text = f.read()
-
-    # Split on === Prompt i ===
-    blocks = re.split(r"=== Prompt \d+ ===", text)
-
-    results = []
-
-    for block in blocks:
-        block = block.strip()
-        if not block:
-            results.append("")
-            continue
-
-        # Extract the first array object in the block
-        matches = re.findall(r"\{.*\}", block, re.DOTALL)
-        if not matches:
-            results.append("")
-            continue
-        json_str = matches[-1]
+import pandas as pd
+from answer_cache import cached_extract_files
+from answer_extraction import extract_answers as stream_extract_answers
+from completion_store import read_answers, store_path, uses_store
+from confusion_render import save_matrix
+from eval_metrics import (
+    DEFAULT_KS,
+    DEFAULT_RESAMPLES,
+    METRIC_KEYS,
+    LabelCodes,
+    bootstrap_ci,
+    confusion_dict,
+    evaluate_all_k,
+)
+from label_taxonomy import TASK1
+from run_dedup import check_run_diversity
 
-        try:
-            parsed = json.loads(json_str)
-            results.append(parsed['category'])
-        except (json.JSONDecodeError, KeyError):
-            results.append("")
-            continue
 
-    return results
+def extract_answers(filepath):
+    # Last JSON object with the answer key in each === Prompt i === block
+    return stream_extract_answers(filepath, "category", "")
+
+def load_runs(run_paths, workers=None, num_runs=5, answer_cache=None):
+    # One answer list per run, concatenated over run_paths in order.
+    # Text files are extracted across a process pool, one file per task;
+    # prefixes read from their Parquet store (see completion_store.uses_store)
+    # only need its pre-extracted answer column.
+    # With an answer_cache, files parsed before (by any script) are not parsed again.
+    stored = {rp: uses_store(rp) for rp in run_paths}
+    jobs = [(rp, run_num) for run_num in range(1, num_runs + 1) for rp in run_paths]
+    text_files = [f"{rp}_run{run_num}.txt" for rp, run_num in jobs if not stored[rp]]
+    print(f"Extracting {len(jobs)} runs ({len(text_files)} text files) from {', '.join(run_paths)}")
+    extracted = iter(cached_extract_files(text_files, "category", "", cache=answer_cache, workers=workers))
+
+    runs = [[] for _ in range(num_runs)]
+    for rp, run_num in jobs:
+        if stored[rp]:
+            runs[run_num - 1].extend(read_answers(store_path(rp), run_num - 1, 1))
+        else:
+            runs[run_num - 1].extend(next(extracted))
+    return runs
+
+def check_aligned(runs, truths):
+    # Answer i of every run must belong to dataset row i
+    for r, comp in enumerate(runs, start=1):
+        if len(comp) != len(truths):
+            raise ValueError(f"Run {r} has {len(comp)} answers for {len(truths)} labelled jokes")
 
 def insert_answers(output_list, completions):
     for i in range(len(completions)):
@@ -45,201 +54,83 @@ def insert_answers(output_list, completions):
         output_list[i].append(completions[i])
     return output_list
 
-def eval_pass_at_k(completions, ground_truths, k):
+LABELS = TASK1.labels
+
+def encode_answers(completions, ground_truths, num_samples):
     '''
-    completions: Should be of shape NUM_QUESTIONS x NUM_COMPLETIONS x NUM_LINES, type list[list[list[str]]]
+    completions: Should be of shape NUM_QUESTIONS x NUM_COMPLETIONS, type list[list[str]]
         NUM_QUESTIONS = number of jokes that we want to evaluate on
-        NUM_COMPLETIONS = number of completions per joke, >= k
-        NUM_LINES = number of lines per joke
-    ground_truths: Should be shape NUM_QUESTIONS x NUM_LINES, type list[list[str]]
-        NUM_QUESTIONS = number of jokes that we want to evaluate on
-        NUM_LINES = number of lines per joke
-    k: int
+        NUM_COMPLETIONS = number of completions per joke; missing ones count as unanswered
+    ground_truths: Should be shape NUM_QUESTIONS, type list[str]
+    num_samples: number of completions per joke to encode
+    Returns the label codes, predictions (NUM_QUESTIONS x num_samples x 1) and truths (NUM_QUESTIONS x 1)
     '''
 
-    total = 0
-    num_correct = 0
-    labels = [
-        'satire/parody/irony',
-        'aggressive',
-        'dry',
-        'self-deprecating',
-        'surreal/absurdism',
-        'wordplay',
-        'witty',
-        'topical',
-        'observational/anecdotal',
-        'dark',
-        'NA'
-    ]
-
-    y_true = []
-    y_pred = []
-
-    confusion_matrix = {}
-    for label in labels:
-        confusion_matrix[label] = {}
-        for l in labels:
-            confusion_matrix[label][l] = 0
-
-    for completion, truth in zip(completions, ground_truths):
-        truth = truth.strip().lower()
-        if truth == 'surreal' or truth == 'absurdism':
-            truth = 'surreal/absurdism'
-        if truth == 'observational' or truth == 'anecdotal':
-            truth = 'observational/anecdotal'
-
-        if "satire" in truth or "parody" in truth or "irony" in truth:
-            truth = 'satire/parody/irony'
-        correct = False
-        while len(completion) < k:
-            completion.append("")
-        for i in range(k):
-            if i < len(completion):
-                pred = completion[i].strip().lower()
-            else:
-                pred = 'NA'
-            if truth in confusion_matrix:
-                sub_matrix = confusion_matrix[truth]
-            else:
-                sub_matrix = confusion_matrix['NA']
-                truth = 'NA'
-            if pred == 'surreal' or pred == 'absurdism':
-                pred = 'surreal/absurdism'
-            if pred == 'observational' or pred == 'anecdotal':
-                pred = 'observational/anecdotal'
-            if "satire" in pred or "parody" in pred or "irony" in pred:
-                pred = 'satire/parody/irony'
-            if pred in sub_matrix:
-                sub_matrix[pred] += 1
-            else:
-                sub_matrix['NA'] += 1
-            y_true.append(truth)
-            y_pred.append(pred)
-            correct = correct or (truth == pred)
-        if correct:
-            num_correct += 1
-        total += 1
-    f1 = f1_score(y_true, y_pred, average="macro")
-
-    classes = np.unique(y_true)
-    y_true_bin = label_binarize(y_true, classes=classes)
-    y_pred_bin = label_binarize(y_pred, classes=classes)
-
-    auc = roc_auc_score(
-        y_true_bin,
-        y_pred_bin,
-        average="macro",
-        multi_class="ovr"
-    )
-
-    return num_correct, total, confusion_matrix, f1, auc
-
-def eval_task1(dataset_path, run_path, save_path, joke_col_name, model, run_paths=None, dataset=None):
-    if run_paths is not None:
-        all_comp1 = []
-        all_comp2 = []
-        all_comp3 = []
-        all_comp4 = []
-        all_comp5 = []
-        
+    codes = LabelCodes(LABELS)
+
+    # Unknown truths count as NA; unknown predictions keep their own code, so
+    # they are wrong, appear as NA in the confusion matrix and add a label to macro-F1
+    num_questions = min(len(completions), len(ground_truths))
+    truth = np.empty((num_questions, 1), dtype=np.int64)
+    pred = np.empty((num_questions, num_samples, 1), dtype=np.int64)
+    pred_codes = {}
+    for q in range(num_questions):
+        truth[q, 0] = codes.codes[TASK1.canonical(ground_truths[q])]
+        completion = completions[q]
+        for j in range(num_samples):
+            answer = completion[j] if j < len(completion) else ""
+            if not isinstance(answer, str):
+                # A "category" that is a list, object or null counts as unanswered
+                answer = ""
+            if answer not in pred_codes:
+                pred_codes[answer] = codes.code(TASK1.normalize(answer))
+            pred[q, j, 0] = pred_codes[answer]
+    return codes, pred, truth
+
+def eval_task1(dataset_path, run_path, save_path, joke_col_name, model, run_paths=None, dataset=None, workers=None, answer_cache=None, ks=DEFAULT_KS, bootstrap=DEFAULT_RESAMPLES, runs=None, fail_on_identical_runs=False):
+    # runs: answers already loaded by load_runs (e.g. by the experiment scheduler)
+    if runs is None:
+        if run_paths is None:
+            if run_path is None:
+                raise ValueError("Either run_paths or run_path must be provided")
+            run_paths = [run_path]
         for rp in run_paths:
-            print(f"Extracting Run 1 from {rp}")
-            all_comp1.extend(extract_answers(f"{rp}_run1.txt"))
-            print(f"Extracting Run 2 from {rp}")
-            all_comp2.extend(extract_answers(f"{rp}_run2.txt"))
-            print(f"Extracting Run 3 from {rp}")
-            all_comp3.extend(extract_answers(f"{rp}_run3.txt"))
-            print(f"Extracting Run 4 from {rp}")
-            all_comp4.extend(extract_answers(f"{rp}_run4.txt"))
-            print(f"Extracting Run 5 from {rp}")
-            all_comp5.extend(extract_answers(f"{rp}_run5.txt"))
-        
-        comp1 = all_comp1
-        comp2 = all_comp2
-        comp3 = all_comp3
-        comp4 = all_comp4
-        comp5 = all_comp5
-    else:
-        if run_path is None:
-            raise ValueError("Either run_paths or run_path must be provided")
-        print("Extracting Run 1")
-        comp1 = extract_answers(f"{run_path}_run1.txt")
-        print("Extracting Run 2")
-        comp2 = extract_answers(f"{run_path}_run2.txt")
-        print("Extracting Run 3")
-        comp3 = extract_answers(f"{run_path}_run3.txt")
-        print("Extracting Run 4")
-        comp4 = extract_answers(f"{run_path}_run4.txt")
-        print("Extracting Run 5")
-        comp5 = extract_answers(f"{run_path}_run5.txt")
-    
-    out = insert_answers([], comp1)
-    out = insert_answers(out, comp2)
-    out = insert_answers(out, comp3)
-    out = insert_answers(out, comp4)
-    out = insert_answers(out, comp5)
-    
+            check_run_diversity(rp, strict=fail_on_identical_runs)
+        runs = load_runs(run_paths, workers, answer_cache=answer_cache)
+    out = []
+    for comp in runs:
+        out = insert_answers(out, comp)
+
     if dataset is None:
         dataset = pd.read_csv(dataset_path, sep='\t')
     task1 = dataset[[joke_col_name, 'Task1 Label']].copy().dropna()
-    labels = task1['Task1 Label'].tolist()[:len(comp1)]
-    num_correct, total, cm, f1, auc = eval_pass_at_k(out, labels, 1)
-    print("===== Pass@1 =====")
-    print("Correct: ", num_correct)
-    print("Total: ", total)
-    print("Accuracy: ", num_correct / total)
-    print("F1 Score: ", f1)
-    print("AUC: ", auc)
-    pass_at_1_metrics = (num_correct / total, f1, auc)
-    cm_df = pd.DataFrame.from_dict(cm, orient="index")
-
-    ls = sorted(cm_df.columns)
-    cm_r = cm_df.reindex(index=ls, columns=ls, fill_value=0)
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(
-        cm_r,
-        annot=True,
-        fmt="d",
-        cmap="Blues",
-        xticklabels=ls,
-        yticklabels=ls
-    )
-
-    plt.xlabel("Predicted label")
-    plt.ylabel("True label")
-    plt.title(f"Task 1 Confusion Matrix {model} Pass@1")
-    plt.tight_layout()
-    plt.savefig(f"{save_path}_pass@1.png")
-    plt.close()
-
-    num_correct, total, cm, f1, auc = eval_pass_at_k(out, labels, 5)
-    print("===== Pass@5 =====")
-    print("Correct: ", num_correct)
-    print("Total: ", total)
-    print("Accuracy: ", num_correct / total)
-    print("F1: ", f1)
-    print("AUC: ", auc)
-    pass_at_5_metrics = (num_correct / total, f1, auc)
-    cm_df = pd.DataFrame.from_dict(cm, orient="index")
-
-    ls = sorted(cm_df.columns)
-    cm_r = cm_df.reindex(index=ls, columns=ls, fill_value=0)
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(
-        cm_r,
-        annot=True,
-        fmt="d",
-        cmap="Blues",
-        xticklabels=ls,
-        yticklabels=ls
-    )
-
-    plt.xlabel("Predicted label")
-    plt.ylabel("True label")
-    plt.title(f"Task 1 Confusion Matrix {model} Pass@5")
-    plt.tight_layout()
-    plt.savefig(f"{save_path}_pass@5.png")
-    plt.close()
-
-    return pass_at_1_metrics, pass_at_5_metrics
\ No newline at end of file
+    labels = task1['Task1 Label'].tolist()
+    check_aligned(runs, labels)
+    codes, pred, truth = encode_answers(out, labels, max(len(c) for c in out))
+    results = evaluate_all_k(pred, truth, codes.names, ks)
+    cis = bootstrap_ci(pred, truth, codes.names, ks, num_resamples=bootstrap) if bootstrap else None
+
+    metrics = []
+    for k in ks:
+        r = results[k]
+        print(f"===== Pass@{k} =====")
+        print("Correct: ", r["num_correct"])
+        print("Total: ", r["total"])
+        print("Accuracy: ", r["pass"])
+        print("Unbiased pass@k: ", r["unbiased"])
+        print("Majority@k accuracy: ", r["majority"])
+        print("F1 Score: ", r["f1"])
+        print("AUC: ", r["auc"])
+        point = tuple(r[name] for name in METRIC_KEYS)
+        bounds = [(float("nan"), float("nan"))] * len(point)
+        if cis is not None:
+            bounds = [cis[k][name] for name in METRIC_KEYS]
+            print(f"95% CIs ({bootstrap} bootstrap resamples): ", cis[k])
+        metrics.append(point + tuple(x for bound in bounds for x in bound))
+        cm_df = pd.DataFrame.from_dict(confusion_dict(r["cm"], codes, LABELS), orient="index")
+
+        ls = sorted(cm_df.columns)
+        cm_r = cm_df.reindex(index=ls, columns=ls, fill_value=0)
+        save_matrix(save_path, k, cm_r)
+
+    return tuple(metrics)
@@ -1,43 +1,52 @@
-import re
-import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
-from sklearn.metrics import f1_score, roc_auc_score
-from sklearn.preprocessing import label_binarize
-
-def extract_answers(filepath):
-    with open(filepath, "r", encoding="utf-8") as f:
-        text = f.read()
-
-    # Split on === Prompt i ===
-    blocks = re.split(r"=== Prompt \d+ ===", text)
-
-    results = []
-
-    for block in blocks:
-        block = block.strip()
-        if not block:
-            results.append([])
-            continue
-
-        # Extract the first array object in the block
-        matches = re.findall(r"\{.*\}", block, re.DOTALL)
-        if not matches:
-            results.append([])
-            continue
-
-        json_str = matches[-1]
+import pandas as pd
+from answer_cache import cached_extract_files
+from answer_extraction import extract_answers as stream_extract_answers
+from completion_store import read_answers, store_path, uses_store
+from confusion_render import save_matrix
+from eval_metrics import (
+    DEFAULT_KS,
+    DEFAULT_RESAMPLES,
+    METRIC_KEYS,
+    PAD,
+    LabelCodes,
+    bootstrap_ci,
+    confusion_dict,
+    evaluate_all_k,
+)
+from label_taxonomy import TASK2
+from run_dedup import check_run_diversity
 
-        try:
-            parsed = json.loads(json_str)
-            results.append(parsed['ANSWER'])
-        except (json.JSONDecodeError, KeyError):
-            results.append([])
-            continue
 
-    return results
+def extract_answers(filepath):
+    # Last JSON object with the answer key in each === Prompt i === block
+    return stream_extract_answers(filepath, "ANSWER", [])
+
+def load_runs(run_paths, workers=None, num_runs=5, answer_cache=None):
+    # One answer list per run, concatenated over run_paths in order.
+    # Text files are extracted across a process pool, one file per task;
+    # prefixes read from their Parquet store (see completion_store.uses_store)
+    # only need its pre-extracted answer column.
+    # With an answer_cache, files parsed before (by any script) are not parsed again.
+    stored = {rp: uses_store(rp) for rp in run_paths}
+    jobs = [(rp, run_num) for run_num in range(1, num_runs + 1) for rp in run_paths]
+    text_files = [f"{rp}_run{run_num}.txt" for rp, run_num in jobs if not stored[rp]]
+    print(f"Extracting {len(jobs)} runs ({len(text_files)} text files) from {', '.join(run_paths)}")
+    extracted = iter(cached_extract_files(text_files, "ANSWER", [], cache=answer_cache, workers=workers))
+
+    runs = [[] for _ in range(num_runs)]
+    for rp, run_num in jobs:
+        if stored[rp]:
+            runs[run_num - 1].extend(read_answers(store_path(rp), run_num - 1, 2))
+        else:
+            runs[run_num - 1].extend(next(extracted))
+    return runs
+
+def check_aligned(runs, truths):
+    # Answer i of every run must belong to dataset row i
+    for r, comp in enumerate(runs, start=1):
+        if len(comp) != len(truths):
+            raise ValueError(f"Run {r} has {len(comp)} answers for {len(truths)} labelled jokes")
 
 def insert_answers(output_list, completions):
     for i in range(len(completions)):
@@ -46,217 +55,97 @@ def insert_answers(output_list, completions):
         output_list[i].append(completions[i])
     return output_list
 
-def eval_pass_at_k(completions, ground_truths, k):
+LABELS = TASK2.labels
+
+def encode_answers(completions, ground_truths, num_samples):
     '''
     completions: Should be of shape NUM_QUESTIONS x NUM_COMPLETIONS x NUM_LINES, type list[list[list[str]]]
         NUM_QUESTIONS = number of jokes that we want to evaluate on
-        NUM_COMPLETIONS = number of completions per joke, >= k
+        NUM_COMPLETIONS = number of completions per joke; missing ones count as unanswered
         NUM_LINES = number of lines per joke
     ground_truths: Should be shape NUM_QUESTIONS x NUM_LINES, type list[list[str]]
         NUM_QUESTIONS = number of jokes that we want to evaluate on
         NUM_LINES = number of lines per joke
-    k: int
+    num_samples: number of completions per joke to encode
+    Returns the label codes, predictions (NUM_QUESTIONS x num_samples x MAX_LINES) and truths
+    (NUM_QUESTIONS x MAX_LINES), padded with PAD
     '''
 
-    total = 0
-    num_correct = 0
-    labels = [
-        'establishing context',
-        'escalation',
-        'subversion',
-        'callback',
-        'misdirection',
-        'timing',
-        'meta-humor',
-        'punchline',
-        'redirection',
-        'non-line',
-        'wrap-up',
-        'repetition',
-        'setup',
-        'NA'
-    ]
-    y_true = []
-    y_pred = []
-
-    confusion_matrix = {}
-    for label in labels:
-        confusion_matrix[label] = {}
-        for l in labels:
-            confusion_matrix[label][l] = 0
-
-    for completion, truths in zip(completions, ground_truths):
+    codes = LabelCodes(LABELS)
+    na = codes.codes['NA']
+
+    # Truths and predictions share the Task 2 alias rules; unknown labels
+    # (and missing lines) count as NA
+    num_questions = min(len(completions), len(ground_truths))
+    num_lines = max((len(truths) for truths in ground_truths[:num_questions]), default=0)
+    truth = np.full((num_questions, num_lines), PAD, dtype=np.int64)
+    pred = np.full((num_questions, num_samples, num_lines), PAD, dtype=np.int64)
+    pred_codes = {}
+    for q in range(num_questions):
+        truths = ground_truths[q]
+        completion = completions[q]
         for i in range(len(truths)):
-            truth = truths[i]
-            truth = truth.strip().lower()
-            if truth == 'surreal' or truth == 'absurdism':
-                truth = 'surreal/absurdism'
-            if truth == 'observational' or truth == 'anecdotal':
-                truth = 'observational/anecdotal'
-            if 'escalation' in truth or 'counter-escalation' in truth:
-                truth = 'escalation'
-            if "context" in truth or 'establishing' in truth:
-                truth = 'establishing context'
-            if "setup" in truth or 'continuation' in truth:
-                truth = 'setup'
-            if 'reaction' in truth or 'interruption' in truth or 'interaction' in truth:
-                truth = 'timing'
-            if "punchline" in truth:
-                truth = 'punchline'
-            if "transition" in truth or 'reflection' in truth:
-                truth = 'redirection'
-            correct = False
-            while len(completion) < k:
-                completion.append([])
-            for j in range(k):
-                if j < len(completion):
-                    comp = completion[j]
-                else:
-                    comp = []
-                if i < len(comp):
-                    pred = comp[i].strip().lower()
-                else:
-                    pred = 'NA'
-                if pred == 'surreal' or pred == 'absurdism':
-                    pred = 'surreal/absurdism'
-                if pred == 'observational' or pred == 'anecdotal':
-                    pred = 'observational/anecdotal'
-                if truth in confusion_matrix:
-                    sub_matrix = confusion_matrix[truth]
-                else:
-                    sub_matrix = confusion_matrix['NA']
-                    truth = 'NA'
-                if pred in sub_matrix:
-                    sub_matrix[pred] += 1
-                else:
-                    sub_matrix['NA'] += 1
-                    pred = 'NA'
-                y_true.append(truth)
-                y_pred.append(pred)
-                correct = correct or (truth == pred)
-            if correct:
-                num_correct += 1
-            total += 1
-    f1 = f1_score(y_true, y_pred, average="macro")
-
-    classes = np.unique(y_true)
-    y_true_bin = label_binarize(y_true, classes=classes)
-    y_pred_bin = label_binarize(y_pred, classes=classes)
-
-    auc = roc_auc_score(
-        y_true_bin,
-        y_pred_bin,
-        average="macro",
-        multi_class="ovr"
-    )
-
-    return num_correct, total, confusion_matrix, f1, auc
-
-def eval_task2(dataset_path, run_path, save_path, joke_col_name, model, run_paths=None, dataset=None):
-    if run_paths is not None:
-        all_comp1 = []
-        all_comp2 = []
-        all_comp3 = []
-        all_comp4 = []
-        all_comp5 = []
-        
+            truth[q, i] = codes.codes[TASK2.canonical(truths[i])]
+        for j in range(num_samples):
+            comp = completion[j] if j < len(completion) else []
+            if not isinstance(comp, list):
+                # An "ANSWER" that is not a list counts as unanswered
+                comp = []
+            for i in range(len(truths)):
+                if i >= len(comp) or not isinstance(comp[i], str):
+                    pred[q, j, i] = na
+                    continue
+                answer = comp[i]
+                if answer not in pred_codes:
+                    pred_codes[answer] = codes.codes[TASK2.canonical(answer)]
+                pred[q, j, i] = pred_codes[answer]
+    return codes, pred, truth
+
+def eval_task2(dataset_path, run_path, save_path, joke_col_name, model, run_paths=None, dataset=None, workers=None, answer_cache=None, ks=DEFAULT_KS, bootstrap=DEFAULT_RESAMPLES, runs=None, fail_on_identical_runs=False):
+    # runs: answers already loaded by load_runs (e.g. by the experiment scheduler)
+    if runs is None:
+        if run_paths is None:
+            if run_path is None:
+                raise ValueError("Either run_paths or run_path must be provided")
+            run_paths = [run_path]
         for rp in run_paths:
-            print(f"Extracting Run 1 from {rp}")
-            all_comp1.extend(extract_answers(f"{rp}_run1.txt"))
-            print(f"Extracting Run 2 from {rp}")
-            all_comp2.extend(extract_answers(f"{rp}_run2.txt"))
-            print(f"Extracting Run 3 from {rp}")
-            all_comp3.extend(extract_answers(f"{rp}_run3.txt"))
-            print(f"Extracting Run 4 from {rp}")
-            all_comp4.extend(extract_answers(f"{rp}_run4.txt"))
-            print(f"Extracting Run 5 from {rp}")
-            all_comp5.extend(extract_answers(f"{rp}_run5.txt"))
-        
-        comp1 = all_comp1
-        comp2 = all_comp2
-        comp3 = all_comp3
-        comp4 = all_comp4
-        comp5 = all_comp5
-    else:
-        if run_path is None:
-            raise ValueError("Either run_paths or run_path must be provided")
-        print("Extracting Run 1")
-        comp1 = extract_answers(f"{run_path}_run1.txt")
-        print("Extracting Run 2")
-        comp2 = extract_answers(f"{run_path}_run2.txt")
-        print("Extracting Run 3")
-        comp3 = extract_answers(f"{run_path}_run3.txt")
-        print("Extracting Run 4")
-        comp4 = extract_answers(f"{run_path}_run4.txt")
-        print("Extracting Run 5")
-        comp5 = extract_answers(f"{run_path}_run5.txt")
-    
-    out = insert_answers([], comp1)
-    out = insert_answers(out, comp2)
-    out = insert_answers(out, comp3)
-    out = insert_answers(out, comp4)
-    out = insert_answers(out, comp5)
-    
+            check_run_diversity(rp, strict=fail_on_identical_runs)
+        runs = load_runs(run_paths, workers, answer_cache=answer_cache)
+    out = []
+    for comp in runs:
+        out = insert_answers(out, comp)
+
     if dataset is None:
         dataset = pd.read_csv(dataset_path, sep='\t')
     task2 = dataset[[joke_col_name, 'Task2 Label']].copy().dropna()
-    truths = task2['Task2 Label'].apply(lambda x: x.split("\\n")).tolist()[:len(comp1)]
-
-    num_correct, total, cm, f1, auc = eval_pass_at_k(out, truths, 1)
-    print("===== Pass@1 =====")
-    print("Correct: ", num_correct)
-    print("Total: ", total)
-    print("Accuracy: ", num_correct / total)
-    print("F1 Score: ", f1)
-    print("AUC: ", auc)
-    pass_at_1_metrics = (num_correct / total, f1, auc)
-    cm_df = pd.DataFrame.from_dict(cm, orient="index")
-
-    ls = sorted(cm_df.columns)
-    cm_r = cm_df.reindex(index=ls, columns=ls, fill_value=0)
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(
-        cm_r,
-        annot=True,
-        fmt="d",
-        cmap="Blues",
-        xticklabels=ls,
-        yticklabels=ls
-    )
-
-    plt.xlabel("Predicted label")
-    plt.ylabel("True label")
-    plt.title(f"Task 2 Confusion Matrix {model} Pass@1")
-    plt.tight_layout()
-    plt.savefig(f"{save_path}_pass@1.png")
-    plt.close()
-
-    num_correct, total, cm, f1, auc = eval_pass_at_k(out, truths, 5)
-    print("===== Pass@5 =====")
-    print("Correct: ", num_correct)
-    print("Total: ", total)
-    print("Accuracy: ", num_correct / total)
-    print("F1 Score: ", f1)
-    print("AUC: ", auc)
-    pass_at_5_metrics = (num_correct / total, f1, auc)
-    cm_df = pd.DataFrame.from_dict(cm, orient="index")
-
-    ls = sorted(cm_df.columns)
-    cm_r = cm_df.reindex(index=ls, columns=ls, fill_value=0)
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(
-        cm_r,
-        annot=True,
-        fmt="d",
-        cmap="Blues",
-        xticklabels=ls,
-        yticklabels=ls
-    )
-
-    plt.xlabel("Predicted label")
-    plt.ylabel("True label")
-    plt.title(f"Task 2 Confusion Matrix {model} Pass@5")
-    plt.tight_layout()
-    plt.savefig(f"{save_path}_pass@5.png")
-    plt.close()
-    return pass_at_1_metrics, pass_at_5_metrics
\ No newline at end of file
+    truths = task2['Task2 Label'].apply(lambda x: x.split("\\n")).tolist()
+    check_aligned(runs, truths)
+
+    codes, pred, truth = encode_answers(out, truths, max(len(c) for c in out))
+    results = evaluate_all_k(pred, truth, codes.names, ks)
+    cis = bootstrap_ci(pred, truth, codes.names, ks, num_resamples=bootstrap) if bootstrap else None
+
+    metrics = []
+    for k in ks:
+        r = results[k]
+        print(f"===== Pass@{k} =====")
+        print("Correct: ", r["num_correct"])
+        print("Total: ", r["total"])
+        print("Accuracy: ", r["pass"])
+        print("Unbiased pass@k: ", r["unbiased"])
+        print("Majority@k accuracy: ", r["majority"])
+        print("F1 Score: ", r["f1"])
+        print("AUC: ", r["auc"])
+        point = tuple(r[name] for name in METRIC_KEYS)
+        bounds = [(float("nan"), float("nan"))] * len(point)
+        if cis is not None:
+            bounds = [cis[k][name] for name in METRIC_KEYS]
+            print(f"95% CIs ({bootstrap} bootstrap resamples): ", cis[k])
+        metrics.append(point + tuple(x for bound in bounds for x in bound))
+        cm_df = pd.DataFrame.from_dict(confusion_dict(r["cm"], codes, LABELS), orient="index")
+
+        ls = sorted(cm_df.columns)
+        cm_r = cm_df.reindex(index=ls, columns=ls, fill_value=0)
+        save_matrix(save_path, k, cm_r)
+
+    return tuple(metrics)
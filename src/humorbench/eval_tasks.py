@@ -1,119 +1,8 @@
-from eval_task1 import eval_task1
-from eval_task2 import eval_task2
-import pandas as pd
-import os
+# Runs the combined English and Spanish experiment ("combined") of experiments.toml
+# through experiment.py; accepts the same flags, e.g. --workers, --ks, --force.
+import sys
 
-if __name__ == "__main__":
-
-    task_1_results_dict = {
-        "model": [],
-        "pass@1_acc": [],
-        "pass@1_f1": [],
-        "pass@1_auc": [],
-        "pass@5_acc": [],
-        "pass@5_f1": [],
-        "pass@5_auc": [],
-    }
-
-    task_2_results_dict = {
-        "model": [],
-        "pass@1_acc": [],
-        "pass@1_f1": [],
-        "pass@1_auc": [],
-        "pass@5_acc": [],
-        "pass@5_f1": [],
-        "pass@5_auc": [],
-    }
-
-    models = [
-        "qwen3-8b", 
-        "qwen3-32b", 
-        "olmo3-7b",
-        "olmo3-1-32b",
-        "falcon3-10b",
-        "apertus-8b",
-        "ministral-8b"
-    ]
-    
-    # Load and combine English and Spanish datasets
-    en_dataset_path = "../../datasets/labeled/en_task1&2.tsv"
-    es_dataset_path = "../../datasets/labeled/es_labelled.tsv"
-    
-    print("Loading English dataset...")
-    en_dataset = pd.read_csv(en_dataset_path, sep='\t')
-    print("Loading Spanish dataset...")
-    es_dataset = pd.read_csv(es_dataset_path, sep='\t')
-    
-    # Combine datasets
-    print("Combining English and Spanish datasets...")
-    combined_dataset = pd.concat([en_dataset, es_dataset], ignore_index=True)
-    print(f"Combined dataset size: {len(combined_dataset)} (EN: {len(en_dataset)}, ES: {len(es_dataset)})")
-    
-    # Paths for completions
-    en_run_path_pref = "/fs/clip-projects/rlab/atrey/humorbench/completions/en/"
-    es_run_path_pref = "/fs/clip-projects/rlab/atrey/humorbench/completions/es/"
-    
-    # Output paths for combined results
-    out_path = "/fs/clip-projects/rlab/atrey/humorbench/results/combined/csvs/combined"
-    cm_save_path = "/fs/clip-projects/rlab/atrey/humorbench/results/combined/confusion_matrices/"
-    joke_col_name = "Joke"
-    
-    # Create output directories if they don't exist
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    os.makedirs(cm_save_path, exist_ok=True)
-
-    for model in models:
-        print("Evaluating model: ", model)
-        
-        # Create paths for both languages
-        en_task1_run_path = en_run_path_pref + f"{model}/en_task1_{model}"
-        es_task1_run_path = es_run_path_pref + f"{model}/es_task1_{model}"
-        task1_run_paths = [en_task1_run_path, es_task1_run_path]
-        task1_cm_save_path = cm_save_path + f"task1_confusion_matrix_{model}"
-        
-        en_task2_run_path = en_run_path_pref + f"{model}/en_task2_{model}"
-        es_task2_run_path = es_run_path_pref + f"{model}/es_task2_{model}"
-        task2_run_paths = [en_task2_run_path, es_task2_run_path]
-        task2_cm_save_path = cm_save_path + f"task2_confusion_matrix_{model}"
-    
-        pass_at_1_task1, pass_at_5_task1 = eval_task1(
-            None,
-            None,
-            task1_cm_save_path, 
-            joke_col_name, 
-            model,
-            run_paths=task1_run_paths,
-            dataset=combined_dataset
-        )
+from experiment import main
 
-        task_1_results_dict['model'].append(model)
-        task_1_results_dict['pass@1_acc'].append(pass_at_1_task1[0])
-        task_1_results_dict['pass@1_f1'].append(pass_at_1_task1[1])
-        task_1_results_dict['pass@1_auc'].append(pass_at_1_task1[2])
-        task_1_results_dict['pass@5_acc'].append(pass_at_5_task1[0])
-        task_1_results_dict['pass@5_f1'].append(pass_at_5_task1[1])
-        task_1_results_dict['pass@5_auc'].append(pass_at_5_task1[2])
-
-        pass_at_1_task2, pass_at_5_task2 = eval_task2(
-            None,
-            None,
-            task2_cm_save_path, 
-            joke_col_name, 
-            model,
-            run_paths=task2_run_paths,
-            dataset=combined_dataset
-        )
-
-        task_2_results_dict['model'].append(model)
-        task_2_results_dict['pass@1_acc'].append(pass_at_1_task2[0])
-        task_2_results_dict['pass@1_f1'].append(pass_at_1_task2[1])
-        task_2_results_dict['pass@1_auc'].append(pass_at_1_task2[2])
-        task_2_results_dict['pass@5_acc'].append(pass_at_5_task2[0])
-        task_2_results_dict['pass@5_f1'].append(pass_at_5_task2[1])
-        task_2_results_dict['pass@5_auc'].append(pass_at_5_task2[2])
-
-    task1_res_df = pd.DataFrame(task_1_results_dict)
-    task2_res_df = pd.DataFrame(task_2_results_dict)
-
-    task1_res_df.to_csv(f"{out_path}_task1_res.csv", index=False)
-    task2_res_df.to_csv(f"{out_path}_task2_res.csv", index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main(["--experiments", "combined"] + sys.argv[1:])
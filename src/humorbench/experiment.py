@@ -0,0 +1,348 @@
+"""Evaluation of the experiment grid declared in ``experiments.toml``.
+
+The spec declares the models, tasks, ks and bootstrap resamples, the
+completion sources (one per language and perturbation: the dataset TSV
+and joke column the prompts came from, named after their completions
+subdirectory, and for a perturbed source the source of its original
+jokes) and the experiments (one or more sources whose datasets
+and runs are concatenated, named after their results subdirectory).
+``build_graph`` expands it into a ``task_graph``:
+
+- ``extract/<source>/<model>/task<N>`` checks the five runs for identical
+  ones (a failure with ``--fail-on-identical-runs``, else a warning) and
+  loads their answers through the answer cache. Every experiment using a
+  source shares the node, so combined EN+ES cells reuse the per-language
+  extractions;
+- ``metrics/<experiment>/<model>/task<N>`` checks that each source's runs
+  hold one answer per labelled row of its dataset, runs ``eval_taskN`` on
+  the concatenated runs and saves the confusion matrices. A cell whose inputs
+  are unchanged since the last run takes its metrics from the experiment's
+  manifest and needs no extraction;
+- ``render/<experiment>/<model>/task<N>`` renders the stale heatmaps;
+- ``aggregate/<experiment>/task<N>`` writes the results CSV, with each
+  cell's number of distinct runs next to its metrics.
+
+Independent nodes run concurrently on one process pool. Run as::
+
+    python experiment.py --spec ../../experiments.toml --experiments "perturbed_es/*"
+"""
+
+import argparse
+import fnmatch
+import os
+import time
+from collections.abc import Sequence
+from typing import Any
+
+import pandas as pd
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+import eval_task1
+import eval_task2
+from answer_cache import DEFAULT_CACHE_DIR, AnswerCache
+from confusion_render import render_jobs, render_matrices
+from eval_manifest import EvalManifest, cm_outputs, run_inputs
+from eval_metrics import DEFAULT_KS, DEFAULT_RESAMPLES, append_results, new_results
+from run_dedup import DigestCache, check_run_diversity, distinct_runs
+from task_graph import Node, run_graph
+
+TASKS = {1: eval_task1, 2: eval_task2}
+
+
+def load_spec(path: str) -> dict:
+    """Read an experiment spec and resolve its directories relative to the spec file."""
+    with open(path, "rb") as f:
+        spec = tomllib.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for key in ("datasets_dir", "completions_dir", "results_dir"):
+        spec[key] = os.path.join(base, spec.get(key, "."))
+    spec.setdefault("tasks", list(TASKS))
+    spec.setdefault("ks", list(DEFAULT_KS))
+    spec.setdefault("bootstrap", DEFAULT_RESAMPLES)
+    for name, source in spec.get("sources", {}).items():
+        if "original" in source and source["original"] not in spec["sources"]:
+            raise ValueError(f"Source {name} has undeclared original {source['original']}")
+    for name, experiment in spec.get("experiments", {}).items():
+        unknown = [source for source in experiment["sources"] if source not in spec.get("sources", {})]
+        if unknown:
+            raise ValueError(f"Experiment {name} uses undeclared sources {unknown}")
+    return spec
+
+
+def source_run_path(spec: dict, source: str, model: str, task: int) -> str:
+    """Run path of a model's completions of one source."""
+    name = os.path.basename(source)
+    return os.path.join(spec["completions_dir"], source, model, f"{name}_task{task}_{model}")
+
+
+def source_dataset(spec: dict, source: str) -> tuple[str, str]:
+    """Dataset path and joke column of one source."""
+    entry = spec["sources"][source]
+    return os.path.join(spec["datasets_dir"], entry["dataset"]), entry["joke_col"]
+
+
+def experiment_paths(spec: dict, experiment: str) -> tuple[str, str]:
+    """Results CSV prefix and confusion-matrix directory of one experiment."""
+    out_dir = os.path.join(spec["results_dir"], experiment)
+    return os.path.join(out_dir, "csvs", os.path.basename(experiment)), os.path.join(out_dir, "confusion_matrices")
+
+
+def extract_runs(task: int, run_path: str, answer_cache_dir: str | None, fail_on_identical_runs: bool = False) -> list[list]:
+    """Extract node: answers of the five runs of one run path."""
+    check_run_diversity(run_path, strict=fail_on_identical_runs)
+    answer_cache = AnswerCache(answer_cache_dir) if answer_cache_dir else None
+    return TASKS[task].load_runs([run_path], workers=1, answer_cache=answer_cache)
+
+
+def aligned_cell(task: int, datasets: list[tuple[str, str]], source_runs: Sequence[list[list]]) -> tuple[pd.DataFrame, list[list]]:
+    """Concatenate the datasets and runs of a cell's sources, checking that rows and answers line up.
+
+    Every run of a source must hold one answer per labelled row of the
+    source's dataset, so answer ``i`` of the concatenated runs belongs to
+    labelled row ``i`` of the concatenated dataset.
+    """
+    module = TASKS[task]
+    label_col = f"Task{task} Label"
+    frames = []
+    runs: list[list] = []
+    for (path, joke_col), source in zip(datasets, source_runs, strict=True):
+        frame = pd.read_csv(path, sep="\t").rename(columns={joke_col: "Joke"})
+        if runs and len(source) != len(runs):
+            raise ValueError(f"{path} has {len(source)} runs, the previous sources {len(runs)}")
+        try:
+            module.check_aligned(source, frame[["Joke", label_col]].dropna())
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from None
+        frames.append(frame)
+        runs = [list(run) for run in source] if not runs else [run + more for run, more in zip(runs, source, strict=True)]
+    dataset = pd.concat(frames, ignore_index=True)
+    module.check_aligned(runs, dataset[["Joke", label_col]].dropna())
+    return dataset, runs
+
+
+def evaluate_cell(
+    task: int,
+    datasets: list[tuple[str, str]],
+    save_path: str,
+    model: str,
+    ks: Sequence[int],
+    bootstrap: int,
+    *source_runs: list[list],
+) -> tuple[Any, ...]:
+    """Metrics node: ``eval_taskN`` on the datasets and runs of all sources, in order."""
+    dataset, runs = aligned_cell(task, datasets, source_runs)
+    evaluate = getattr(TASKS[task], f"eval_task{task}")
+    return evaluate(None, None, save_path, "Joke", model, dataset=dataset, ks=ks, bootstrap=bootstrap, runs=runs)
+
+
+def render_cell(jobs: list, _metrics: Any) -> int:
+    """Render node: heatmaps of one cell's stale matrices."""
+    return render_matrices(jobs, workers=1)
+
+
+def write_results(
+    path: str,
+    models: list[str],
+    run_paths: list[list[str]],
+    ks: Sequence[int],
+    *results: tuple[Any, ...] | None,
+) -> str:
+    """Aggregate node: results CSV of one experiment and task, skipping failed cells.
+
+    ``run_paths`` holds the run paths of each model's sources, from which
+    the cell's ``distinct_runs`` are counted.
+    """
+    table = new_results(ks)
+    digests = DigestCache()
+    for model, paths, result in zip(models, run_paths, results, strict=True):
+        if result is not None:
+            append_results(table, model, result, ks, distinct_runs=distinct_runs(paths, digests=digests))
+    digests.save()
+    pd.DataFrame(table).to_csv(path, index=False)
+    print(f"Saved {path}")
+    return path
+
+
+def build_graph(
+    spec: dict,
+    experiments: list[str],
+    models: list[str],
+    tasks: list[int],
+    ks: Sequence[int],
+    bootstrap: int,
+    answer_cache_dir: str | None = DEFAULT_CACHE_DIR,
+    force: bool = False,
+    render: bool = True,
+    fail_on_identical_runs: bool = False,
+) -> tuple[dict[str, Node], dict[str, tuple]]:
+    """Expand experiments x models x tasks into a task graph.
+
+    With ``fail_on_identical_runs``, which is then part of the cells'
+    parameters, cells with identical runs fail in their extract nodes.
+
+    Returns:
+        The nodes, and for every metrics node that must be evaluated the
+        ``(manifest, cell, inputs, outputs, params)`` to record its result with.
+    """
+    extract: dict[str, Node] = {}
+    nodes: dict[str, Node] = {}
+    records: dict[str, tuple] = {}
+    for experiment in experiments:
+        sources = spec["experiments"][experiment]["sources"]
+        datasets = [source_dataset(spec, source) for source in sources]
+        out_path, cm_dir = experiment_paths(spec, experiment)
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        os.makedirs(cm_dir, exist_ok=True)
+        manifest = EvalManifest(f"{out_path}_manifest.json", force=force)
+
+        for task in tasks:
+            cells = []
+            for model in models:
+                run_paths = [source_run_path(spec, source, model, task) for source in sources]
+                inputs = [path for path, _ in datasets] + [p for rp in run_paths for p in run_inputs(rp)]
+                missing = [path for path in inputs if not os.path.exists(path)]
+                if missing:
+                    print(f"Warning: skipping {experiment}/{model}/task{task}, missing {missing[0]}")
+                    continue
+
+                save_path = os.path.join(cm_dir, f"task{task}_confusion_matrix_{model}")
+                cell = f"task{task}/{model}"
+                params = {
+                    "ks": list(ks),
+                    "bootstrap": bootstrap,
+                    "sources": sources,
+                    "datasets": [[path, joke_col] for path, joke_col in datasets],
+                }
+                if fail_on_identical_runs:
+                    params["fail_on_identical_runs"] = True
+                outputs = cm_outputs(save_path, ks)
+                metrics = f"metrics/{experiment}/{model}/task{task}"
+                stored = manifest.lookup(cell, inputs, params)
+                if stored is not None:
+                    nodes[metrics] = Node(lambda result: result, (stored,), local=True)
+                else:
+                    deps = []
+                    for source, run_path in zip(sources, run_paths, strict=True):
+                        name = f"extract/{source}/{model}/task{task}"
+                        extract.setdefault(name, Node(extract_runs, (task, run_path, answer_cache_dir, fail_on_identical_runs)))
+                        deps.append(name)
+                    nodes[metrics] = Node(evaluate_cell, (task, datasets, save_path, model, list(ks), bootstrap), deps)
+                    records[metrics] = (manifest, cell, inputs, outputs, params)
+                if render:
+                    title = f"Task {task} Confusion Matrix {model}"
+                    nodes[f"render/{experiment}/{model}/task{task}"] = Node(
+                        render_cell, (render_jobs(save_path, title, ks),), [metrics]
+                    )
+                cells.append((model, run_paths, metrics))
+
+            nodes[f"aggregate/{experiment}/task{task}"] = Node(
+                write_results,
+                (
+                    f"{out_path}_task{task}_res.csv",
+                    [model for model, _, _ in cells],
+                    [run_paths for _, run_paths, _ in cells],
+                    list(ks),
+                ),
+                [metrics for _, _, metrics in cells],
+                local=True,
+                partial=True,
+            )
+    # Extraction first, so the pool starts on it while cells are still being planned
+    return {**extract, **nodes}, records
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Evaluate the experiment grid of an experiment spec")
+    parser.add_argument(
+        "--spec",
+        type=str,
+        default="../../experiments.toml",
+        help="Experiment spec (default: ../../experiments.toml)",
+    )
+    parser.add_argument(
+        "--experiments",
+        type=str,
+        nargs="+",
+        default=["*"],
+        help="Experiments to run, as names or glob patterns (default: all)",
+    )
+    parser.add_argument("--models", type=str, nargs="+", default=None, help="Models to run (default: the spec's)")
+    parser.add_argument("--tasks", type=int, nargs="+", default=None, help="Tasks to run (default: the spec's)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Processes running independent nodes (default: number of cores)",
+    )
+    parser.add_argument(
+        "--answer-cache-dir",
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help=f"Cache of extracted answers shared by the evaluation scripts (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument("--no-answer-cache", action="store_true", help="Re-extract every run file")
+    parser.add_argument("--ks", type=int, nargs="+", default=None, help="Values of k (default: the spec's)")
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=None,
+        help="Bootstrap resamples for the 95%% CIs of each metric, 0 to skip (default: the spec's)",
+    )
+    parser.add_argument("--no-render", action="store_true", help="Only save confusion matrices as CSV/.npy, without PNGs")
+    parser.add_argument("--force", action="store_true", help="Re-evaluate cells whose inputs are unchanged")
+    parser.add_argument(
+        "--fail-on-identical-runs",
+        action="store_true",
+        help="Fail the cells whose runs include identical ones instead of evaluating them with a warning",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Print the task graph without running it")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    experiments = [
+        name for name in spec["experiments"] if any(fnmatch.fnmatchcase(name, pattern) for pattern in args.experiments)
+    ]
+    if not experiments:
+        parser.error(f"No experiment of {args.spec} matches {args.experiments}")
+
+    nodes, records = build_graph(
+        spec,
+        experiments,
+        models=args.models or spec["models"],
+        tasks=args.tasks or spec["tasks"],
+        ks=args.ks or spec["ks"],
+        bootstrap=spec["bootstrap"] if args.bootstrap is None else args.bootstrap,
+        answer_cache_dir=None if args.no_answer_cache else args.answer_cache_dir,
+        force=args.force,
+        render=not args.no_render,
+        fail_on_identical_runs=args.fail_on_identical_runs,
+    )
+    stages = {}
+    for name in nodes:
+        stage = name.split("/", 1)[0]
+        stages[stage] = stages.get(stage, 0) + 1
+    print(f"{len(experiments)} experiments, {len(nodes)} nodes: {stages}")
+    if args.dry_run:
+        for name, node in nodes.items():
+            print(name, "<-", ", ".join(node.deps) if node.deps else "-")
+        return
+
+    def record(name: str, result: Any) -> None:
+        if name in records:
+            manifest, cell, inputs, outputs, params = records[name]
+            manifest.record(cell, inputs, outputs, result, params)
+
+    start = time.perf_counter()
+    results = run_graph(nodes, workers=args.workers, on_result=record)
+    failed = [name for name in nodes if name not in results]
+    print(f"Ran {len(results)} of {len(nodes)} nodes in {time.perf_counter() - start:.1f}s")
+    if failed:
+        print(f"Failed or skipped: {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,55 @@
+import argparse
+
 import pandas as pd
+from prompt_templates import LAYOUTS, get_template
 
 joke_key = 'Joke'
+lang = 'es'
+layout = 'legacy'
 
 def make_prompt_task1(row):
     joke = row[joke_key]
-    prompt = 'Classify the following joke in spanish into one of these types: satire, parody, irony, aggressive, dry, self-deprecating, surreal/absurdism, wordplay, witty, topical, observational, anecdotal, dark. Output valid JSON of the form {"category": "<one type>", "reasoning": "<1–2 sentence explanation>"}### END for the joke: ' + joke + 'Your final answer should take the form {"category": "<one type>", "reasoning": "<1–2 sentence explanation>"}### END If you do not output your final answer in this format, you will not receive any credit.'
-    row['prompt'] = prompt
+    row['prompt'] = get_template(1, lang, layout).render(joke)
     return row
 
 def make_prompt_task2(row):
     joke = row[joke_key]
-    prompt = 'Here is a joke in spanish: ' + joke + ' END OF JOKE. Classify each newline-separated line in this multi-line joke by its role, assigning exactly one label from establishing context, setup, escalation, subversion, callback, misdirection, timing, meta-humor, punchline, redirection, non-line, wrap-up, repetition. Your final answer should take the form {"ANSWER":["label1", "label2",...]}### END. If you do not output your final answer in this format, you will not receive any credit.' 
-    row['prompt'] = prompt
+    row['prompt'] = get_template(2, lang, layout).render(joke)
     return row
 
-dataset = pd.read_csv('../../datasets/labeled/es_labelled.tsv', sep='\t')
-task1 = dataset[[joke_key, 'Task1 Label']].copy().dropna()
-task2 = dataset[[joke_key, 'Task2 Label']].copy().dropna()
-
-task1_prompts = task1.apply(make_prompt_task1, axis=1)
-prompts = task1_prompts['prompt']
-with open('prompts_task1_es.txt', 'w') as f:
-    for prompt in prompts:
-        f.write(prompt + "\n")
-
-task2_prompts = task2.apply(make_prompt_task2, axis=1)
-prompts = task2_prompts['prompt']
-with open('prompts_task2_es.txt', 'w') as f:
-    for prompt in prompts:
-        f.write(prompt + "\n")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Task 1 and Task 2 prompt files from a labeled TSV")
+    parser.add_argument("--dataset", default='../../datasets/labeled/es_labelled.tsv', help="Labeled TSV to build prompts from")
+    parser.add_argument("--joke-col", default=joke_key, help="Column holding the joke text (default: Joke)")
+    parser.add_argument("--lang", default=lang, choices=["en", "es"], help="Language of the jokes (default: es)")
+    parser.add_argument(
+        "--layout",
+        default=layout,
+        choices=LAYOUTS,
+        help="'legacy' reproduces the published prompt files; 'prefix' puts the shared instructions first so engines can prefix-cache them",
+    )
+    parser.add_argument("--output-task1", default=None, help="Output file for Task 1 prompts (default: prompts_task1_<lang>.txt)")
+    parser.add_argument("--output-task2", default=None, help="Output file for Task 2 prompts (default: prompts_task2_<lang>.txt)")
+    args = parser.parse_args()
+    args.output_task1 = args.output_task1 or f"prompts_task1_{args.lang}.txt"
+    args.output_task2 = args.output_task2 or f"prompts_task2_{args.lang}.txt"
+
+    joke_key = args.joke_col
+    lang = args.lang
+    layout = args.layout
+
+    dataset = pd.read_csv(args.dataset, sep='\t')
+    task1 = dataset[[joke_key, 'Task1 Label']].copy().dropna()
+    task2 = dataset[[joke_key, 'Task2 Label']].copy().dropna()
+
+    task1_prompts = task1.apply(make_prompt_task1, axis=1)
+    prompts = task1_prompts['prompt']
+    with open(args.output_task1, 'w') as f:
+        for prompt in prompts:
+            f.write(prompt + "\n")
+
+    task2_prompts = task2.apply(make_prompt_task2, axis=1)
+    prompts = task2_prompts['prompt']
+    with open(args.output_task2, 'w') as f:
+        for prompt in prompts:
+            f.write(prompt + "\n")
@@ -0,0 +1,181 @@
+"""Structured JSONL telemetry for inference jobs.
+
+One record is appended per event:
+
+- ``model_load``: seconds spent loading the engine.
+- ``request``: one per sample, with prompt/generated token counts, finish
+  reason (``stop`` vs ``length``), time to first token and latency.
+- ``run_summary``: per run, token totals, throughput and latency
+  percentiles, finish-reason counts and GPU-hours.
+- ``experiment_summary``: totals for the whole job, model load included.
+
+Every record carries the model name so files from several jobs (or a
+sweep over many models) can be concatenated and grouped.
+"""
+
+import json
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentiles(values: list[float]) -> dict[str, float | None]:
+    """Return ``{"p50": ..., "p90": ..., "p99": ...}``, ignoring missing values."""
+    values = [v for v in values if v is not None]
+    if not values:
+        return {f"p{q}": None for q in PERCENTILES}
+    return {f"p{q}": float(v) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES), strict=True)}
+
+
+def prompt_token_count(output) -> int | None:
+    """Prompt length of a finished ``RequestOutput`` (or HTTP ``CompletionResponse``)."""
+    count = getattr(output, "num_prompt_tokens", None)
+    if count is None and output.prompt_token_ids is not None:
+        count = len(output.prompt_token_ids)
+    return count
+
+
+def generated_token_count(output, sample) -> int | None:
+    """Generated length of one sample of a finished request."""
+    token_ids = getattr(sample, "token_ids", None)
+    if token_ids is not None:
+        return len(token_ids)
+    # The HTTP backend only reports a total over all samples of the request.
+    if len(output.outputs) == 1:
+        return getattr(output, "num_generated_tokens", None)
+    return None
+
+
+class MetricsLog:
+    """Append-only JSONL metrics file for one job."""
+
+    def __init__(self, path: str, model: str, tensor_parallel_size: int = 1) -> None:
+        """Open the log.
+
+        Args:
+            path: JSONL file to append to.
+            model: Model name recorded with every event.
+            tensor_parallel_size: GPUs used by the engine, for GPU-hours.
+        """
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        self.model = model
+        self.tensor_parallel_size = tensor_parallel_size
+        self.started = time.time()
+        self.load_seconds = 0.0
+        self.run_summaries: list[dict] = []
+        self._file = open(path, "a", encoding="utf-8")
+
+    def log(self, event: str, **fields) -> None:
+        record = {"event": event, "model": self.model, "time": time.time(), **fields}
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def model_load(self, seconds: float) -> None:
+        self.load_seconds += seconds
+        self.log("model_load", seconds=seconds, tensor_parallel_size=self.tensor_parallel_size)
+
+    def gpu_hours(self, seconds: float) -> float:
+        return seconds * self.tensor_parallel_size / 3600
+
+    def run(self, run: str) -> "RunMetrics":
+        """Start collecting the metrics of one run."""
+        return RunMetrics(self, run)
+
+    def close(self) -> None:
+        """Write the experiment summary and close the file."""
+        if self._file.closed:
+            return
+        wall = time.time() - self.started
+        self.log(
+            "experiment_summary",
+            runs=len(self.run_summaries),
+            wall_seconds=wall,
+            model_load_seconds=self.load_seconds,
+            generated_tokens=sum(s["generated_tokens"] for s in self.run_summaries),
+            gpu_hours=self.gpu_hours(wall),
+        )
+        self._file.close()
+
+
+class RunMetrics:
+    """Per-request records and the summary of one run (or one n-way sampling pass)."""
+
+    def __init__(self, log: MetricsLog, run: str) -> None:
+        self.log = log
+        self.run = run
+        self.started = time.time()
+        self.prompt_tokens: list[int | None] = []
+        self.generated_tokens: list[int | None] = []
+        self.ttfts: list[float | None] = []
+        self.latencies: list[float | None] = []
+        self.decode_rates: list[float | None] = []
+        self.finish_reasons: Counter = Counter()
+
+    def update(self, index: int, output, timing: dict | None = None) -> None:
+        """Record every sample of a finished request.
+
+        Args:
+            index: Prompt index.
+            output: Finished ``RequestOutput``.
+            timing: ``{"submitted", "first_token", "finished"}`` timestamps
+                filled in by ``vllm_inference.stream_generate``.
+        """
+        timing = timing or {}
+        submitted = timing.get("submitted")
+        first_token = timing.get("first_token")
+        finished = timing.get("finished")
+        ttft = first_token - submitted if submitted and first_token else None
+        latency = finished - submitted if submitted and finished else None
+        prompt_tokens = prompt_token_count(output)
+        self.prompt_tokens.append(prompt_tokens)
+        self.ttfts.append(ttft)
+        self.latencies.append(latency)
+
+        for sample in output.outputs:
+            generated = generated_token_count(output, sample)
+            decode_seconds = finished - first_token if first_token and finished else None
+            decode_rate = generated / decode_seconds if generated and decode_seconds else None
+            self.generated_tokens.append(generated)
+            self.decode_rates.append(decode_rate)
+            self.finish_reasons[sample.finish_reason] += 1
+            self.log.log(
+                "request",
+                run=self.run,
+                index=index,
+                sample=getattr(sample, "index", 0),
+                prompt_tokens=prompt_tokens,
+                generated_tokens=generated,
+                finish_reason=sample.finish_reason,
+                ttft_seconds=ttft,
+                latency_seconds=latency,
+                decode_tokens_per_s=decode_rate,
+            )
+
+    def finish(self) -> dict:
+        """Write and return the run summary."""
+        wall = time.time() - self.started
+        generated = sum(t for t in self.generated_tokens if t)
+        summary = {
+            "run": self.run,
+            "requests": len(self.latencies),
+            "samples": len(self.generated_tokens),
+            "prompt_tokens": sum(t for t in self.prompt_tokens if t),
+            "generated_tokens": generated,
+            "wall_seconds": wall,
+            "tokens_per_s": generated / wall if wall else None,
+            "decode_tokens_per_s": percentiles(self.decode_rates),
+            "ttft_seconds": percentiles(self.ttfts),
+            "latency_seconds": percentiles(self.latencies),
+            "generated_tokens_per_sample": percentiles(self.generated_tokens),
+            "finish_reasons": dict(self.finish_reasons),
+            "gpu_hours": self.log.gpu_hours(wall),
+        }
+        self.log.run_summaries.append(summary)
+        self.log.log("run_summary", **summary)
+        return summary
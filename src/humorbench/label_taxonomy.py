@@ -0,0 +1,216 @@
+"""Canonical labels of both tasks and the alias rules that map raw labels onto them.
+
+Each task's taxonomy is declared once (``TASK1`` and ``TASK2``) and used for
+ground truths and predictions alike. The rules are compiled into an
+exact-match dict (canonical labels and exact aliases) plus an ordered list
+of substring rules, where the first matching rule wins. Normalisation is
+memoised per distinct raw string, so every distinct label is only matched
+once per process.
+
+Run as a script to benchmark against the original if-chains on every raw
+label in a completions tree::
+
+    python label_taxonomy.py --completions-dir ../../completions
+"""
+
+import argparse
+import re
+import time
+from collections.abc import Sequence
+
+
+class _Memo(dict):
+    """Dict that fills in missing keys with ``fn(key)``."""
+
+    def __init__(self, fn) -> None:
+        super().__init__()
+        self.fn = fn
+
+    def __missing__(self, key):
+        value = self[key] = self.fn(key)
+        return value
+
+
+class Taxonomy:
+    """Canonical labels plus exact and substring aliases of one task.
+
+    Args:
+        labels: Canonical labels, including the ``"NA"`` fallback.
+        exact: Raw label (after strip/lower) to canonical label.
+        contains: Ordered ``(substrings, canonical)`` rules; a label that
+            contains any of the substrings maps to ``canonical``, and the
+            first matching rule wins.
+    """
+
+    def __init__(
+        self,
+        labels: Sequence[str],
+        exact: dict[str, str],
+        contains: Sequence[tuple[Sequence[str], str]],
+    ) -> None:
+        self.labels: list[str] = list(labels)
+        self.label_set = set(self.labels)
+        self.exact = {label: label for label in self.labels}
+        self.exact.update(exact)
+        self.contains = [
+            (re.compile("|".join(re.escape(s) for s in substrings)), canonical)
+            for substrings, canonical in contains
+        ]
+        # normalize(raw): canonical label of raw, or raw stripped and lowercased
+        # if no rule applies. A dict lookup, so repeated labels cost no Python call.
+        self.normalize = _Memo(lambda raw: self._match(raw.strip().lower())).__getitem__
+
+    def canonical(self, raw: str, default: str | None = "NA") -> str | None:
+        """Canonical label of ``raw``, or ``default`` if it is not one of ``labels``."""
+        label = self.normalize(raw)
+        return label if label in self.label_set else default
+
+    def _match(self, label: str) -> str:
+        exact = self.exact.get(label)
+        if exact is not None:
+            return exact
+        for pattern, canonical in self.contains:
+            if pattern.search(label):
+                return canonical
+        return label
+
+
+TASK1 = Taxonomy(
+    labels=[
+        'satire/parody/irony',
+        'aggressive',
+        'dry',
+        'self-deprecating',
+        'surreal/absurdism',
+        'wordplay',
+        'witty',
+        'topical',
+        'observational/anecdotal',
+        'dark',
+        'NA',
+    ],
+    exact={
+        'surreal': 'surreal/absurdism',
+        'absurdism': 'surreal/absurdism',
+        'observational': 'observational/anecdotal',
+        'anecdotal': 'observational/anecdotal',
+    },
+    contains=[
+        (['satire', 'parody', 'irony'], 'satire/parody/irony'),
+    ],
+)
+
+TASK2 = Taxonomy(
+    labels=[
+        'establishing context',
+        'escalation',
+        'subversion',
+        'callback',
+        'misdirection',
+        'timing',
+        'meta-humor',
+        'punchline',
+        'redirection',
+        'non-line',
+        'wrap-up',
+        'repetition',
+        'setup',
+        'NA',
+    ],
+    exact={},
+    contains=[
+        (['escalation'], 'escalation'),
+        (['context', 'establishing'], 'establishing context'),
+        (['setup', 'continuation'], 'setup'),
+        (['reaction', 'interruption', 'interaction'], 'timing'),
+        (['punchline'], 'punchline'),
+        (['transition', 'reflection'], 'redirection'),
+    ],
+)
+
+
+def legacy_normalize_task1(label: str) -> str:
+    """The original Task 1 if-chain, kept for benchmarking."""
+    label = label.strip().lower()
+    if label == 'surreal' or label == 'absurdism':
+        label = 'surreal/absurdism'
+    if label == 'observational' or label == 'anecdotal':
+        label = 'observational/anecdotal'
+    if "satire" in label or "parody" in label or "irony" in label:
+        label = 'satire/parody/irony'
+    return label
+
+
+def legacy_normalize_task2(truth: str) -> str:
+    """The original Task 2 ground-truth if-chain, kept for benchmarking."""
+    truth = truth.strip().lower()
+    if truth == 'surreal' or truth == 'absurdism':
+        truth = 'surreal/absurdism'
+    if truth == 'observational' or truth == 'anecdotal':
+        truth = 'observational/anecdotal'
+    if 'escalation' in truth or 'counter-escalation' in truth:
+        truth = 'escalation'
+    if "context" in truth or 'establishing' in truth:
+        truth = 'establishing context'
+    if "setup" in truth or 'continuation' in truth:
+        truth = 'setup'
+    if 'reaction' in truth or 'interruption' in truth or 'interaction' in truth:
+        truth = 'timing'
+    if "punchline" in truth:
+        truth = 'punchline'
+    if "transition" in truth or 'reflection' in truth:
+        truth = 'redirection'
+    return truth
+
+
+def raw_labels(completions_dir: str) -> dict[int, list[str]]:
+    """Every raw label occurrence in the run files under ``completions_dir``, per task."""
+    from answer_extraction import TASK_KEYS, extract_answers
+    from answer_schemas import task_from_prompt_file
+    from completion_store import find_run_files
+
+    labels: dict[int, list[str]] = {1: [], 2: []}
+    for prefix, run_files in sorted(find_run_files(completions_dir).items()):
+        task = task_from_prompt_file(prefix)
+        if task is None:
+            continue
+        for path in run_files.values():
+            for answer in extract_answers(path, TASK_KEYS[task], None):
+                values = answer if isinstance(answer, list) else [answer]
+                labels[task].extend(v for v in values if isinstance(v, str))
+    return labels
+
+
+def benchmark(completions_dir: str) -> None:
+    """Time the compiled, memoised taxonomies against the if-chains and compare results."""
+    labels = raw_labels(completions_dir)
+    for task, taxonomy, legacy in [(1, TASK1, legacy_normalize_task1), (2, TASK2, legacy_normalize_task2)]:
+        raw = labels[task]
+        start = time.perf_counter()
+        old = [legacy(label) for label in raw]
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        new = [taxonomy.normalize(label) for label in raw]
+        new_time = time.perf_counter() - start
+        changed = sum(1 for a, b in zip(old, new, strict=True) if a != b)
+        print(
+            f"Task {task}: {len(raw)} labels ({len(set(raw))} distinct), "
+            f"if-chain {old_time * 1e3:.1f} ms, taxonomy {new_time * 1e3:.1f} ms "
+            f"({old_time / new_time:.1f}x), {changed} normalised differently"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark label normalisation on a completions tree")
+    parser.add_argument(
+        "--completions-dir",
+        type=str,
+        default="../../completions",
+        help="Root of the completions tree (default: ../../completions)",
+    )
+    args = parser.parse_args()
+    benchmark(args.completions_dir)
+
+
+if __name__ == "__main__":
+    main()
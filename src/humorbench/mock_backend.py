@@ -0,0 +1,172 @@
+"""Deterministic CPU stand-in for the inference engine.
+
+``MockBackend`` implements the same ``stream`` interface as
+``OpenAICompletionsClient``, so the whole pipeline (prompt generation,
+orchestration, file writing, extraction and metrics) can be exercised and
+load-tested without a GPU. Every completion is a schema-valid answer for
+the prompt's task, preceded by filler "reasoning" of configurable length,
+and requests finish at a simulated decode speed with a bounded number in
+flight. Outputs depend only on the seed, request tag, prompt text and
+sample index, not on where the prompt sits in the list, so repeated runs
+are identical and a prompt file split into shards gets the same
+completions as when it is run whole.
+"""
+
+import hashlib
+import heapq
+import json
+import random
+import time
+from collections.abc import Iterator, Sequence
+
+from answer_schemas import answer_schema
+
+FILLER_WORDS = ["the", "joke", "line", "sets", "up", "a", "twist", "so", "this", "is", "funny", "because"]
+
+
+class MockSample:
+    """One sampled completion, shaped like vLLM's ``CompletionOutput``."""
+
+    def __init__(self, index: int, text: str, num_tokens: int, finish_reason: str) -> None:
+        self.index = index
+        self.text = text
+        self.token_ids = list(range(num_tokens))
+        self.finish_reason = finish_reason
+
+
+class MockRequestOutput:
+    """A finished request, shaped like vLLM's ``RequestOutput``."""
+
+    def __init__(self, request_id: str, prompt: str, outputs: list[MockSample]) -> None:
+        self.request_id = request_id
+        self.prompt_token_ids = list(range(len(prompt.split())))
+        self.num_cached_tokens = 0
+        self.outputs = outputs
+        self.finished = True
+
+
+class _WhitespaceTokenizer:
+    def encode(self, text: str) -> list[int]:
+        return list(range(len(text.split())))
+
+
+def _schema_instance(schema: dict, rng: random.Random, filler: str):
+    """Build a value that validates against the (small) answer schemas."""
+    if schema.get("type") == "object":
+        return {k: _schema_instance(v, rng, filler) for k, v in schema["properties"].items()}
+    if schema.get("type") == "array":
+        return [_schema_instance(schema["items"], rng, filler) for _ in range(schema.get("minItems", 1))]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    return filler[: schema.get("maxLength", len(filler))].rstrip()
+
+
+class MockBackend:
+    """Simulated engine that answers every prompt of one task."""
+
+    def __init__(
+        self,
+        task: int,
+        output_tokens: int = 64,
+        tokens_per_s: float = 0.0,
+        ttft: float = 0.0,
+        max_num_seqs: int = 256,
+        seed: int = 0,
+    ) -> None:
+        """Configure the simulation.
+
+        Args:
+            task: Task (1 or 2) whose answer format to emit.
+            output_tokens: Mean completion length in tokens (words); each
+                sample draws uniformly from 0.5x to 1.5x this value.
+                Samples longer than ``max_tokens`` are cut off with finish
+                reason ``length``.
+            tokens_per_s: Simulated decode speed per sequence; 0 finishes
+                every request instantly.
+            ttft: Simulated time to first token in seconds.
+            max_num_seqs: Maximum number of requests decoded concurrently.
+            seed: Base seed for the generated text.
+        """
+        self.task = task
+        self.output_tokens = output_tokens
+        self.tokens_per_s = tokens_per_s
+        self.ttft = ttft
+        self.max_num_seqs = max_num_seqs
+        self.seed = seed
+
+    def get_tokenizer(self) -> _WhitespaceTokenizer:
+        return _WhitespaceTokenizer()
+
+    def _rng(self, request_tag: str, prompt: str, sample_index: int) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}|{request_tag}|{sample_index}|{prompt}".encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def complete(self, request_id: str, prompt: str, params: dict, request_tag: str = "req") -> MockRequestOutput:
+        """Generate every sample of one request, seeded by ``request_tag`` and the prompt text."""
+        guided = params.get("structured_outputs")
+        schema = guided["json"] if guided else answer_schema(self.task, prompt)
+        max_tokens = params.get("max_tokens") or self.output_tokens * 2
+        samples = []
+        for j in range(params.get("n", 1)):
+            rng = self._rng(request_tag, prompt, j)
+            length = max(1, int(self.output_tokens * rng.uniform(0.5, 1.5)))
+            filler = " ".join(rng.choice(FILLER_WORDS) for _ in range(length))
+            answer = json.dumps(_schema_instance(schema, rng, filler))
+            words = answer.split() if guided else filler.split() + answer.split()
+            finish_reason = "stop"
+            if len(words) > max_tokens:
+                words = words[:max_tokens]
+                finish_reason = "length"
+            samples.append(MockSample(j, " ".join(words), len(words), finish_reason))
+        return MockRequestOutput(request_id, prompt, samples)
+
+    def stream(
+        self,
+        prompts: list[str],
+        params,
+        indices: Sequence[int] | None = None,
+        request_tag: str = "req",
+        timings: dict | None = None,
+        max_in_flight: int | None = None,
+    ) -> Iterator[tuple[int, MockRequestOutput]]:
+        """Yield ``(index, output)`` in simulated completion order.
+
+        Takes the same arguments as ``OpenAICompletionsClient.stream``;
+        ``params`` is a request-field dict or one dict per prompt, and
+        ``max_in_flight`` caps the running requests below ``max_num_seqs``.
+        """
+        if indices is None:
+            indices = range(len(prompts))
+        per_prompt = isinstance(params, list)
+        waiting = list(indices)[::-1]
+        running: list = []
+        limit = min(self.max_num_seqs, max_in_flight or self.max_num_seqs)
+        start = time.time()
+        clock = 0.0
+
+        def admit() -> None:
+            while waiting and len(running) < limit:
+                index = waiting.pop()
+                request_id = f"{request_tag}-{index}"
+                prompt_params = params[index] if per_prompt else params
+                output = self.complete(request_id, prompts[index], prompt_params, request_tag)
+                decode = 0.0
+                if self.tokens_per_s:
+                    decode = max(len(s.token_ids) for s in output.outputs) / self.tokens_per_s
+                finish = clock + self.ttft + decode
+                if timings is not None:
+                    timings[index] = {
+                        "submitted": start + clock,
+                        "first_token": start + clock + self.ttft,
+                        "finished": start + finish,
+                    }
+                heapq.heappush(running, (finish, index, output))
+
+        admit()
+        while running:
+            clock, index, output = heapq.heappop(running)
+            delay = start + clock - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            yield index, output
+            admit()
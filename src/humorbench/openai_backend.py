@@ -0,0 +1,212 @@
+"""Async client for an already-running OpenAI-compatible ``/v1/completions`` server.
+
+Lets many benchmark jobs share one resident model (e.g. ``vllm serve``)
+instead of each job loading its own copy. Requests go out over a pooled
+aiohttp session with a bounded number in flight, and transient failures
+(connection errors, timeouts, 429 and 5xx responses) are retried with
+exponential backoff.
+"""
+
+import asyncio
+import queue
+import random
+import threading
+import time
+from collections.abc import Iterator, Sequence
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CompletionChoice:
+    """One sampled completion, shaped like vLLM's ``CompletionOutput``."""
+
+    def __init__(self, index: int, text: str, finish_reason: str | None) -> None:
+        self.index = index
+        self.text = text
+        self.finish_reason = finish_reason
+
+
+class CompletionResponse:
+    """A finished request, shaped like vLLM's ``RequestOutput``."""
+
+    def __init__(self, request_id: str, body: dict) -> None:
+        usage = body.get("usage") or {}
+        details = usage.get("prompt_tokens_details") or {}
+        self.request_id = request_id
+        self.finished = True
+        self.outputs = sorted(
+            (
+                CompletionChoice(c.get("index", i), c.get("text", ""), c.get("finish_reason"))
+                for i, c in enumerate(body.get("choices", []))
+            ),
+            key=lambda c: c.index,
+        )
+        self.prompt_token_ids = None
+        self.num_prompt_tokens = usage.get("prompt_tokens")
+        self.num_generated_tokens = usage.get("completion_tokens")
+        self.num_cached_tokens = details.get("cached_tokens")
+
+
+class OpenAICompletionsClient:
+    """Send prompts to ``<base_url>/completions`` with bounded concurrency."""
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        max_concurrency: int = 64,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        timeout: float = 600.0,
+        api_key: str | None = None,
+    ) -> None:
+        """Initialize the client.
+
+        Args:
+            base_url: Server root including the API version, e.g. ``http://host:8000/v1``.
+            model: Model name the server was started with.
+            max_concurrency: Maximum number of requests in flight.
+            max_retries: Retries per request before giving up.
+            backoff: Base delay in seconds; doubled after every failed attempt.
+            timeout: Total timeout in seconds for a single request.
+            api_key: Optional bearer token.
+        """
+        self.url = base_url.rstrip("/") + "/completions"
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.api_key = api_key
+
+    async def _post(self, session, payload: dict) -> dict:
+        import aiohttp
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.post(self.url, json=payload) as resp:
+                    if resp.status == 200:
+                        return await resp.json()
+                    body = await resp.text()
+                    if resp.status not in RETRY_STATUSES:
+                        raise RuntimeError(f"Server returned {resp.status}: {body[:500]}")
+                    error = f"HTTP {resp.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if attempt == self.max_retries:
+                raise RuntimeError(f"Request failed after {self.max_retries + 1} attempts: {error}")
+            await asyncio.sleep(self.backoff * 2**attempt * (1 + random.random()))
+
+    async def _produce(
+        self,
+        prompts: list[str],
+        indices: Sequence[int],
+        params,
+        request_tag: str,
+        results: queue.Queue,
+        timings: dict | None,
+        max_in_flight: int | None = None,
+    ) -> None:
+        import aiohttp
+
+        limit = min(self.max_concurrency, max_in_flight or self.max_concurrency)
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else None
+        connector = aiohttp.TCPConnector(limit=limit)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        semaphore = asyncio.Semaphore(limit)
+
+        per_prompt = isinstance(params, list)
+
+        async def one(index: int) -> tuple[int, CompletionResponse]:
+            request_params = params[index] if per_prompt else params
+            payload = dict(request_params, model=self.model, prompt=prompts[index])
+            async with semaphore:
+                if timings is not None:
+                    timings[index] = {"submitted": time.time()}
+                body = await self._post(session, payload)
+                if timings is not None:
+                    timings[index]["finished"] = time.time()
+            return index, CompletionResponse(f"{request_tag}-{index}", body)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers) as session:
+            tasks = [asyncio.create_task(one(index)) for index in indices]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    results.put(await next_done)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    def stream(
+        self,
+        prompts: list[str],
+        params,
+        indices: Sequence[int] | None = None,
+        request_tag: str = "req",
+        timings: dict | None = None,
+        max_in_flight: int | None = None,
+    ) -> Iterator[tuple[int, CompletionResponse]]:
+        """Yield ``(index, CompletionResponse)`` for each prompt as its request finishes.
+
+        The event loop runs on a background thread so callers can consume
+        results synchronously, exactly like ``vllm_inference.stream_generate``.
+        Closing the generator early cancels the requests still in flight and
+        waits for the thread to finish.
+
+        Args:
+            prompts: All prompts of the job.
+            params: Request fields (``max_tokens``, ``n``, ...) shared by every
+                prompt, or a list with one dict per prompt.
+            indices: Indices of ``prompts`` to submit (default: all).
+            request_tag: Prefix for request ids.
+            timings: If given, filled with ``{index: {"submitted", "finished"}}``
+                timestamps (responses are not streamed, so there is no
+                first-token time).
+            max_in_flight: Maximum number of requests in flight for this
+                call, below ``max_concurrency`` (default: ``max_concurrency``).
+        """
+        if indices is None:
+            indices = range(len(prompts))
+        results: queue.Queue = queue.Queue()
+        done = object()
+        # Event loop and task of the worker, so closing the generator can cancel them
+        control: dict = {"closed": False}
+        lock = threading.Lock()
+
+        async def produce() -> None:
+            with lock:
+                if control["closed"]:
+                    return
+                control["loop"] = asyncio.get_running_loop()
+                control["task"] = asyncio.current_task()
+            await self._produce(prompts, indices, params, request_tag, results, timings, max_in_flight)
+
+        def worker() -> None:
+            try:
+                asyncio.run(produce())
+            except BaseException as e:  # surfaced to the consuming thread
+                results.put(e)
+            results.put(done)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Reached early when the consumer closes the generator or fails:
+            # cancel the requests still in flight instead of leaving them running
+            with lock:
+                control["closed"] = True
+                loop, task = control.get("loop"), control.get("task")
+            if loop is not None and thread.is_alive():
+                try:
+                    loop.call_soon_threadsafe(task.cancel)
+                except RuntimeError:  # the loop finished in the meantime
+                    pass
+            thread.join()
@@ -0,0 +1,138 @@
+"""Prompt templates for Task 1 and Task 2.
+
+Every template is split into a fixed ``prefix`` that is identical for all
+jokes and a per-joke ``suffix``. With the ``prefix`` layout the long
+instruction text comes first, so an engine with automatic prefix caching
+only prefills it once per model. The ``legacy`` layout reproduces the
+prompt files the published results were generated with.
+"""
+
+
+TASK1_TYPES = [
+    "satire",
+    "parody",
+    "irony",
+    "aggressive",
+    "dry",
+    "self-deprecating",
+    "surreal/absurdism",
+    "wordplay",
+    "witty",
+    "topical",
+    "observational",
+    "anecdotal",
+    "dark",
+]
+
+TASK2_ROLES = [
+    "establishing context",
+    "setup",
+    "escalation",
+    "subversion",
+    "callback",
+    "misdirection",
+    "timing",
+    "meta-humor",
+    "punchline",
+    "redirection",
+    "non-line",
+    "wrap-up",
+    "repetition",
+]
+
+LAYOUTS = ["legacy", "prefix"]
+
+_TASK1_FORMAT = '{"category": "<one type>", "reasoning": "<1–2 sentence explanation>"}### END'
+_TASK2_FORMAT = '{"ANSWER":["label1", "label2",...]}### END'
+_NO_CREDIT = "If you do not output your final answer in this format, you will not receive any credit."
+_LANG_NAMES = {"en": "", "es": " in spanish"}
+
+
+class PromptTemplate:
+    """A prompt split into a shared prefix and a per-joke suffix."""
+
+    def __init__(self, prefix: str, suffix: str) -> None:
+        """Initialize the template.
+
+        Args:
+            prefix: Text shared verbatim by every prompt built from this template.
+            suffix: Per-joke text containing a ``{joke}`` placeholder.
+        """
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def render(self, joke: str) -> str:
+        """Build the prompt for one joke."""
+        return self.prefix + self.suffix.replace("{joke}", joke)
+
+
+def _task1_legacy(lang: str) -> PromptTemplate:
+    prefix = (
+        f"Classify the following joke{_LANG_NAMES[lang]} into one of these types: "
+        f"{', '.join(TASK1_TYPES)}. Output valid JSON of the form {_TASK1_FORMAT} "
+        "for the joke: "
+    )
+    return PromptTemplate(
+        prefix, "{joke}Your final answer should take the form " + f"{_TASK1_FORMAT} {_NO_CREDIT}"
+    )
+
+
+def _task2_legacy(lang: str) -> PromptTemplate:
+    # The joke comes first, so the only shared prefix is a handful of tokens.
+    prefix = f"Here is a joke{_LANG_NAMES[lang]}: "
+    which = "in this" if lang == "es" else "of a"
+    suffix = (
+        f"{{joke}} END OF JOKE. Classify each newline-separated line {which} multi-line "
+        f"joke by its role, assigning exactly one label from {', '.join(TASK2_ROLES)}. "
+        f"Your final answer should take the form {_TASK2_FORMAT}. {_NO_CREDIT}"
+    )
+    return PromptTemplate(prefix, suffix)
+
+
+def _task1_prefix(lang: str) -> PromptTemplate:
+    prefix = (
+        f"Classify a joke{_LANG_NAMES[lang]} into one of these types: "
+        f"{', '.join(TASK1_TYPES)}. Your final answer should take the form "
+        f"{_TASK1_FORMAT} {_NO_CREDIT} The joke is given after JOKE: and ends at "
+        "END OF JOKE. "
+    )
+    return PromptTemplate(prefix, "JOKE: {joke} END OF JOKE.")
+
+
+def _task2_prefix(lang: str) -> PromptTemplate:
+    prefix = (
+        f"Classify each newline-separated line in a multi-line joke{_LANG_NAMES[lang]} "
+        "by its role, assigning exactly one label per line, in order, from "
+        f"{', '.join(TASK2_ROLES)}. Your final answer should take the form "
+        f"{_TASK2_FORMAT}. {_NO_CREDIT} The joke is "
+        "given after JOKE: and ends at END OF JOKE. "
+    )
+    return PromptTemplate(prefix, "JOKE: {joke} END OF JOKE.")
+
+
+_BUILDERS = {
+    (1, "legacy"): _task1_legacy,
+    (2, "legacy"): _task2_legacy,
+    (1, "prefix"): _task1_prefix,
+    (2, "prefix"): _task2_prefix,
+}
+
+_CACHE: dict[tuple[int, str, str], PromptTemplate] = {}
+
+
+def get_template(task: int, lang: str = "en", layout: str = "legacy") -> PromptTemplate:
+    """Return the prompt template for a task, language and layout.
+
+    Args:
+        task: 1 (joke classification) or 2 (line roles).
+        lang: ``"en"`` or ``"es"``.
+        layout: ``"legacy"`` or ``"prefix"`` (shared instructions first).
+    """
+    key = (task, lang, layout)
+    if key not in _CACHE:
+        if (task, layout) not in _BUILDERS:
+            raise ValueError(f"Unknown template: task={task}, layout={layout}")
+        if lang not in _LANG_NAMES:
+            raise ValueError(f"Unknown language: {lang}")
+        _CACHE[key] = _BUILDERS[(task, layout)](lang)
+    return _CACHE[key]
@@ -0,0 +1,381 @@
+"""Per-joke robustness of every model to every perturbation.
+
+The aggregate CSVs of ``eval_perturbed_es`` and ``eval_perturbed_combined``
+say how much a metric drops under a perturbation, not which jokes flip.
+This script joins each perturbed joke to its original and compares the
+model's answers on the pair:
+
+- ``align_jokes`` indexes every row of a perturbed TSV
+  (``jokes_en/*.tsv``, ``jokes_es/*.tsv``) by its row in the original TSV
+  (``en_task1&2.tsv``, ``es_labelled.tsv``). The same row is kept if its
+  labels agree and the texts share most of their words; otherwise the
+  most similar original with the same labels is used.
+- Each joke is scored as ``evaluate_all_k`` would see it: the mean over
+  its lines of the fraction of samples that are correct (expected
+  pass@1), and per line whether the majority vote over all samples is
+  correct.
+- ``flip_matrices`` counts correct/wrong before x after per (cell, line)
+  with one ``bincount`` over the whole grid, and
+  ``paired_permutation_test`` tests the mean per-joke score change of
+  every cell at once by multiplying one matrix of random signs with the
+  stacked per-joke differences.
+
+The grid comes from ``experiments.toml``: every source with an
+``original`` is compared with that source, for every model and task of the
+spec. Completions of the original jokes are loaded once per model and task
+and shared by all of its perturbations. Run as a script::
+
+    python robustness.py --spec ../../experiments.toml --out-path ../../results/robustness/robustness
+"""
+
+import argparse
+import os
+import re
+import time
+
+import eval_task1
+import eval_task2
+import numpy as np
+import pandas as pd
+from answer_cache import DEFAULT_CACHE_DIR, AnswerCache
+from eval_manifest import run_inputs
+from eval_metrics import PAD, majority_votes
+from experiment import load_spec, source_dataset, source_run_path
+
+DEFAULT_PERMUTATIONS = 10000
+LABEL_COLUMNS = ["Task1 Label", "Task2 Label"]
+TASKS = {1: (eval_task1, "Task1 Label"), 2: (eval_task2, "Task2 Label")}
+
+SUMMARY_COLUMNS = [
+    "language", "perturbation", "model", "task", "jokes", "items",
+    "correct_to_correct", "correct_to_wrong", "wrong_to_correct", "wrong_to_wrong",
+    "flip_rate", "original_score", "perturbed_score", "score_diff", "p_value",
+]
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", str(text).lower()))
+
+
+def _similarity(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def align_jokes(
+    original: pd.DataFrame,
+    perturbed: pd.DataFrame,
+    joke_col: str,
+    original_joke_col: str = "Joke",
+    min_similarity: float = 0.5,
+) -> np.ndarray:
+    """Row of ``original`` that each row of ``perturbed`` is a perturbation of.
+
+    Args:
+        original: Original dataset.
+        perturbed: Perturbed dataset.
+        joke_col: Joke column of ``perturbed``.
+        original_joke_col: Joke column of ``original``.
+        min_similarity: Minimum word-set Jaccard similarity of a pair.
+
+    Returns:
+        An int array with one entry per row of ``perturbed``, ``-1`` where no
+        original with the same labels is similar enough.
+    """
+    labels = [col for col in LABEL_COLUMNS if col in original.columns and col in perturbed.columns]
+    original_keys = original[labels].fillna("").astype(str).agg("\t".join, axis=1).tolist()
+    perturbed_keys = perturbed[labels].fillna("").astype(str).agg("\t".join, axis=1).tolist()
+    original_words = [_words(text) for text in original[original_joke_col]]
+
+    by_key: dict[str, list[int]] = {}
+    for row, key in enumerate(original_keys):
+        by_key.setdefault(key, []).append(row)
+
+    index = np.full(len(perturbed), -1, dtype=np.int64)
+    for row, (key, text) in enumerate(zip(perturbed_keys, perturbed[joke_col], strict=True)):
+        words = _words(text)
+        # Perturbed TSVs keep the row order of the original, so try that row first
+        if row < len(original_keys) and original_keys[row] == key:
+            if _similarity(words, original_words[row]) >= min_similarity:
+                index[row] = row
+                continue
+        best, best_similarity = -1, min_similarity
+        for candidate in by_key.get(key, []):
+            similarity = _similarity(words, original_words[candidate])
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        index[row] = best
+    return index
+
+
+def item_positions(dataset: pd.DataFrame, joke_col: str, label_col: str) -> np.ndarray:
+    """Position of each row among the rows ``eval_taskN`` evaluates, ``-1`` if dropped."""
+    keep = dataset[[joke_col, label_col]].notna().all(axis=1).to_numpy()
+    return np.where(keep, np.cumsum(keep) - 1, -1)
+
+
+def joke_correctness(
+    run_path: str,
+    dataset: pd.DataFrame,
+    joke_col: str,
+    task: int,
+    workers: int | None = None,
+    answer_cache: AnswerCache | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-row correctness of a model on one dataset, encoded like ``eval_taskN``.
+
+    Args:
+        run_path: Run path prefix of the completions.
+        dataset: Dataset the completions answer.
+        joke_col: Joke column of ``dataset``.
+        task: 1 or 2.
+        workers: Worker processes for answer extraction.
+        answer_cache: Cache of extracted answers.
+
+    Returns:
+        ``(score, majority, valid)`` indexed by dataset row: the expected
+        pass@1 of each joke (NaN for rows without a label), and per
+        line whether the majority vote over all samples is correct and
+        whether the line exists.
+    """
+    module, label_col = TASKS[task]
+    runs = module.load_runs([run_path], workers, answer_cache=answer_cache)
+    out = []
+    for run in runs:
+        out = module.insert_answers(out, run)
+    labels = dataset[[joke_col, label_col]].dropna()[label_col].tolist()
+    if task == 2:
+        labels = [label.split("\\n") for label in labels]
+    module.check_aligned(runs, labels)
+    _, pred, truth = module.encode_answers(out, labels, max(len(c) for c in out))
+
+    _, n, num_lines = pred.shape
+    valid = truth != PAD
+    num_correct = ((pred == truth[:, None, :]) & valid[:, None, :]).sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        score = (num_correct / n).sum(axis=1, where=valid) / valid.sum(axis=1)
+    majority = (majority_votes(pred, n) == truth) & valid
+
+    # Scatter from evaluated positions back to dataset rows
+    positions = item_positions(dataset, joke_col, label_col)
+    rows = np.flatnonzero(positions >= 0)
+    row_score = np.full(len(dataset), np.nan)
+    row_majority = np.zeros((len(dataset), num_lines), dtype=bool)
+    row_valid = np.zeros((len(dataset), num_lines), dtype=bool)
+    row_score[rows] = score[positions[rows]]
+    row_majority[rows] = majority[positions[rows]]
+    row_valid[rows] = valid[positions[rows]]
+    return row_score, row_majority, row_valid
+
+
+def flip_matrices(cell: np.ndarray, before: np.ndarray, after: np.ndarray, num_cells: int) -> np.ndarray:
+    """(cells, 2, 2) counts of items by correctness before (rows) and after (columns).
+
+    Index 0 is wrong and 1 is correct, so ``[c, 1, 0]`` counts the items of
+    cell ``c`` that went from correct to wrong.
+    """
+    codes = cell * 4 + before.astype(np.int64) * 2 + after.astype(np.int64)
+    return np.bincount(codes, minlength=num_cells * 4).reshape(num_cells, 2, 2)
+
+
+def paired_permutation_test(
+    diffs: np.ndarray,
+    num_permutations: int = DEFAULT_PERMUTATIONS,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Two-sided sign-flip permutation test of the mean paired difference of each row.
+
+    Args:
+        diffs: (cells, jokes) per-joke differences, NaN-padded.
+        num_permutations: Random sign assignments.
+        seed: Seed of the permutations.
+
+    Returns:
+        The observed mean difference and the p-value of each cell.
+    """
+    present = ~np.isnan(diffs)
+    counts = present.sum(axis=1)
+    filled = np.where(present, diffs, 0.0)
+    with np.errstate(invalid="ignore"):
+        observed = filled.sum(axis=1) / counts
+    rng = np.random.default_rng(seed)
+    signs = rng.integers(0, 2, size=(num_permutations, diffs.shape[1]), dtype=np.int8) * 2 - 1
+    permuted = (signs @ filled.T) / counts
+    exceed = (np.abs(permuted) >= np.abs(observed) - 1e-12).sum(axis=0)
+    p_values = (1 + exceed) / (1 + num_permutations)
+    p_values[counts == 0] = np.nan
+    return observed, p_values
+
+
+def perturbations(spec: dict) -> dict[str, list[str]]:
+    """Perturbed sources of an experiment spec, by the source of their original jokes."""
+    by_original: dict[str, list[str]] = {}
+    for name, source in spec["sources"].items():
+        if "original" in source:
+            by_original.setdefault(source["original"], []).append(name)
+    return by_original
+
+
+def analyse(
+    spec: dict,
+    models: list[str] | None = None,
+    workers: int | None = None,
+    answer_cache: AnswerCache | None = None,
+    num_permutations: int = DEFAULT_PERMUTATIONS,
+    seed: int = 0,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Flip matrices and permutation tests of every (language, perturbation, model, task).
+
+    The language of a cell is the name of the original source, and the
+    perturbation the last component of the perturbed source's name.
+
+    Returns:
+        A summary with one row per cell (``SUMMARY_COLUMNS``) and a per-joke
+        table with one row per aligned joke of every cell.
+    """
+    cells = []
+    joke_frames = []
+    cell_ids, befores, afters = [], [], []
+    diffs = []
+    for language, sources in perturbations(spec).items():
+        original_file, original_col = source_dataset(spec, language)
+        original = pd.read_csv(original_file, sep="\t")
+        originals = {}
+        for perturbed_source in sources:
+            perturbation = os.path.basename(perturbed_source)
+            perturbed_file, joke_col = source_dataset(spec, perturbed_source)
+            perturbed = pd.read_csv(perturbed_file, sep="\t")
+            index = align_jokes(original, perturbed, joke_col, original_col)
+            unaligned = int((index < 0).sum())
+            if unaligned:
+                print(f"Warning: {unaligned} rows of {perturbed_file} have no original")
+            for model in models or spec["models"]:
+                for task in spec["tasks"]:
+                    original_path = source_run_path(spec, language, model, task)
+                    perturbed_path = source_run_path(spec, perturbed_source, model, task)
+                    missing = [p for p in run_inputs(original_path) + run_inputs(perturbed_path) if not os.path.exists(p)]
+                    if missing:
+                        print(f"Warning: skipping {language}/{perturbation}/{model}/task{task}, missing {missing[0]}")
+                        continue
+                    if (model, task) not in originals:
+                        originals[model, task] = joke_correctness(
+                            original_path, original, original_col, task, workers, answer_cache
+                        )
+                    before_score, before_majority, before_valid = originals[model, task]
+                    after_score, after_majority, after_valid = joke_correctness(
+                        perturbed_path, perturbed, joke_col, task, workers, answer_cache
+                    )
+
+                    # Pairs of (perturbed row, original row) that both have completions
+                    rows = np.flatnonzero(index >= 0)
+                    rows = rows[~np.isnan(after_score[rows]) & ~np.isnan(before_score[index[rows]])]
+                    source = index[rows]
+                    lines = min(before_valid.shape[1], after_valid.shape[1])
+                    valid = before_valid[source, :lines] & after_valid[rows, :lines]
+                    before = before_majority[source, :lines]
+                    after = after_majority[rows, :lines]
+
+                    cell = len(cells)
+                    cells.append((language, perturbation, model, task, len(rows), int(valid.sum())))
+                    cell_ids.append(np.full(int(valid.sum()), cell))
+                    befores.append(before[valid])
+                    afters.append(after[valid])
+                    diffs.append(after_score[rows] - before_score[source])
+                    joke_frames.append(pd.DataFrame({
+                        "language": language,
+                        "perturbation": perturbation,
+                        "model": model,
+                        "task": task,
+                        "original_row": source,
+                        "perturbed_row": rows,
+                        "lines": valid.sum(axis=1),
+                        "original_correct": (before & valid).sum(axis=1),
+                        "perturbed_correct": (after & valid).sum(axis=1),
+                        "correct_to_wrong": (before & ~after & valid).sum(axis=1),
+                        "wrong_to_correct": (~before & after & valid).sum(axis=1),
+                        "original_score": before_score[source],
+                        "perturbed_score": after_score[rows],
+                    }))
+
+    if not cells:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS), pd.DataFrame()
+
+    # The whole grid at once: one bincount for the flip matrices, one matrix
+    # product of random signs for the permutation tests
+    flips = flip_matrices(np.concatenate(cell_ids), np.concatenate(befores), np.concatenate(afters), len(cells))
+    stacked = np.full((len(cells), max(len(d) for d in diffs)), np.nan)
+    for cell, d in enumerate(diffs):
+        stacked[cell, :len(d)] = d
+    observed, p_values = paired_permutation_test(stacked, num_permutations, seed)
+
+    jokes = pd.concat(joke_frames, ignore_index=True)
+    means = jokes.groupby(["language", "perturbation", "model", "task"], sort=False)[
+        ["original_score", "perturbed_score"]
+    ].mean()
+    summary = []
+    for cell, (language, perturbation, model, task, num_jokes, num_items) in enumerate(cells):
+        (ww, wc), (cw, cc) = flips[cell]
+        original_score, perturbed_score = means.loc[(language, perturbation, model, task)]
+        summary.append([
+            language, perturbation, model, task, num_jokes, num_items,
+            cc, cw, wc, ww, (cw + wc) / num_items if num_items else np.nan,
+            original_score, perturbed_score, observed[cell], p_values[cell],
+        ])
+    return pd.DataFrame(summary, columns=SUMMARY_COLUMNS), jokes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-joke robustness of each model to each perturbation")
+    parser.add_argument(
+        "--spec",
+        type=str,
+        default="../../experiments.toml",
+        help="Experiment spec declaring the sources, models and tasks (default: ../../experiments.toml)",
+    )
+    parser.add_argument(
+        "--out-path",
+        type=str,
+        default="../../results/robustness/robustness",
+        help="Prefix of the <out-path>_summary.csv and <out-path>_jokes.csv outputs",
+    )
+    parser.add_argument("--models", type=str, nargs="+", default=None, help="Models to analyse (default: the spec's)")
+    parser.add_argument(
+        "--permutations",
+        type=int,
+        default=DEFAULT_PERMUTATIONS,
+        help=f"Random sign assignments of the paired permutation test (default: {DEFAULT_PERMUTATIONS})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Processes used to extract answers from run files (default: number of cores)",
+    )
+    parser.add_argument(
+        "--answer-cache-dir",
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help=f"Cache of extracted answers shared by the evaluation scripts (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument("--no-answer-cache", action="store_true", help="Re-extract every run file")
+    args = parser.parse_args()
+    answer_cache = None if args.no_answer_cache else AnswerCache(args.answer_cache_dir)
+
+    start = time.perf_counter()
+    summary, jokes = analyse(
+        load_spec(args.spec),
+        models=args.models,
+        workers=args.workers,
+        answer_cache=answer_cache,
+        num_permutations=args.permutations,
+    )
+    out_dir = os.path.dirname(args.out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    summary.to_csv(f"{args.out_path}_summary.csv", index=False)
+    jokes.to_csv(f"{args.out_path}_jokes.csv", index=False)
+    print(f"Analysed {len(summary)} cells in {time.perf_counter() - start:.1f}s")
+    print(f"Saved {args.out_path}_summary.csv and {args.out_path}_jokes.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Store identical run files once and detect runs that collapsed onto each other.
+
+Run files are hashed and every unique payload is kept once under
+``<completions_dir>/.objects/<sha[:2]>/<sha>``; each run file becomes a hard
+link to its object (or a relative symlink where hard links are not
+possible), so readers see the same paths and bytes as before.
+
+Duplicate runs also silently turn pass@k into pass@1, so
+``check_run_diversity`` reports how many of the k samples of each prompt
+are actually distinct and warns (or, if strict, raises) when whole runs
+are identical. ``eval_task1``, ``eval_task2`` and ``experiment.py`` call
+it before scoring, and ``experiment.py`` writes each cell's
+``distinct_runs`` into its results CSV. Reports are memoised in a
+``DigestCache`` by the digests of the run files, which are in turn
+memoised by (size, mtime) like ``EvalManifest`` does, so an unchanged run
+is not re-read.
+
+Usage::
+
+    python run_dedup.py --completions-dir ../../completions [--dry-run]
+    python run_dedup.py --completions-dir ../../completions --check
+"""
+
+import argparse
+import errno
+import hashlib
+import json
+import os
+import sys
+import uuid
+from collections import defaultdict
+
+from completion_store import find_run_files, read_texts, store_path, uses_store
+from completion_writer import read_completion_file
+
+OBJECTS_DIR = ".objects"
+DEFAULT_DIGEST_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "humorbench", "digests.json")
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(objects_dir: str, digest: str) -> str:
+    return os.path.join(objects_dir, digest[:2], digest)
+
+
+def _link(target: str, path: str) -> None:
+    """Atomically replace ``path`` with a link to ``target``."""
+    tmp_path = f"{path}.link.{os.getpid()}"
+    try:
+        os.link(target, tmp_path)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        os.symlink(os.path.relpath(target, os.path.dirname(path)), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def dedup_files(paths: list[str], objects_dir: str, dry_run: bool = False) -> dict[str, int]:
+    """Move each unique payload into the object store and link the run files to it.
+
+    Returns:
+        Counts of ``files``, ``unique`` payloads and ``bytes_saved``.
+    """
+    by_digest: dict[str, list[str]] = defaultdict(list)
+    for path in paths:
+        by_digest[file_digest(path)].append(path)
+
+    bytes_saved = 0
+    for digest, same in by_digest.items():
+        bytes_saved += sum(os.path.getsize(p) for p in same[1:] if not os.path.samefile(p, same[0]))
+        if dry_run:
+            continue
+        target = object_path(objects_dir, digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(same[0], target)
+            except OSError:
+                _copy(same[0], target)
+        for path in same:
+            if not os.path.samefile(path, target):
+                _link(target, path)
+    return {"files": len(paths), "unique": len(by_digest), "bytes_saved": bytes_saved}
+
+
+def _copy(src: str, dst: str) -> None:
+    tmp_path = f"{dst}.tmp.{os.getpid()}"
+    with open(src, "rb") as fin, open(tmp_path, "wb") as fout:
+        for chunk in iter(lambda: fin.read(1 << 20), b""):
+            fout.write(chunk)
+    os.replace(tmp_path, dst)
+
+
+class DigestCache:
+    """File digests memoised by (size, mtime), and reports derived from them.
+
+    Processes sharing the cache file merge their entries into it on
+    ``save``, which replaces the file atomically.
+    """
+
+    def __init__(self, path: str = DEFAULT_DIGEST_CACHE) -> None:
+        self.path = path
+        self.files: dict[str, list] = {}
+        self.reports: dict[str, dict] = {}
+        self.changed = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        self.files = {**data.get("files", {}), **self.files}
+        self.reports = {**data.get("reports", {}), **self.reports}
+
+    def digest(self, path: str) -> str:
+        """SHA-256 of a file, only re-read when its size or mtime changed."""
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        cached = self.files.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_digest(path)
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self.changed = True
+        return digest
+
+    def report(self, key: str) -> dict | None:
+        """Stored report for a key, or None."""
+        return self.reports.get(key)
+
+    def put_report(self, key: str, report: dict) -> None:
+        """Store a report; it is written on ``save``."""
+        self.reports[key] = report
+        self.changed = True
+
+    def save(self) -> None:
+        """Merge the new entries into the cache file."""
+        if not self.changed:
+            return
+        self._load()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{uuid.uuid4().hex}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "reports": self.reports}, f)
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
+def run_files(run_path: str, num_runs: int) -> list[str]:
+    """Files holding the runs of a prefix: its Parquet store, or one text file per run."""
+    if uses_store(run_path):
+        return [store_path(run_path)]
+    return [f"{run_path}_run{r}.txt" for r in range(1, num_runs + 1)]
+
+
+def load_run_texts(run_path: str, num_runs: int) -> list[list[str]]:
+    """Raw completion texts of every run of a prefix (Parquet store or text files)."""
+    if uses_store(run_path):
+        return [read_texts(store_path(run_path), r) for r in range(num_runs)]
+    return [read_completion_file(f"{run_path}_run{r}.txt") for r in range(1, num_runs + 1)]
+
+
+def _diversity(run_path: str, num_runs: int) -> dict:
+    runs = [[hashlib.sha1(t.encode("utf-8")).digest() for t in texts] for texts in load_run_texts(run_path, num_runs)]
+
+    groups: dict[tuple, list[int]] = defaultdict(list)
+    for run_num, hashes in enumerate(runs, 1):
+        groups[tuple(hashes)].append(run_num)
+    identical_runs = [g for g in groups.values() if len(g) > 1]
+
+    num_prompts = min(len(hashes) for hashes in runs)
+    distinct = [len({hashes[i] for hashes in runs}) for i in range(num_prompts)]
+    return {
+        "identical_runs": identical_runs,
+        "distinct_runs": len(groups),
+        "mean_distinct": sum(distinct) / num_prompts if num_prompts else 0.0,
+        "single_sample_fraction": sum(1 for d in distinct if d == 1) / num_prompts if num_prompts else 0.0,
+    }
+
+
+def diversity_report(run_path: str, num_runs: int = 5, digests: DigestCache | None = None) -> dict:
+    """Sample diversity of a prefix's runs, memoised by the digests of its files.
+
+    Args:
+        run_path: Run prefix.
+        num_runs: Number of runs.
+        digests: Cache of file digests and reports (default: the shared
+            ``DEFAULT_DIGEST_CACHE``, saved before returning).
+
+    Returns:
+        ``identical_runs`` (groups of 1-based run numbers with identical
+        outputs), ``distinct_runs``, ``mean_distinct`` samples per prompt,
+        and ``single_sample_fraction`` (prompts whose samples are all identical).
+    """
+    cache = digests or DigestCache()
+    record = {"files": [cache.digest(path) for path in run_files(run_path, num_runs)], "num_runs": num_runs}
+    key = hashlib.sha256(json.dumps(record, sort_keys=True).encode("utf-8")).hexdigest()
+    report = cache.report(key)
+    if report is None:
+        report = _diversity(run_path, num_runs)
+        cache.put_report(key, report)
+    if digests is None:
+        cache.save()
+    return report
+
+
+def distinct_runs(run_paths: list[str], num_runs: int = 5, digests: DigestCache | None = None) -> int:
+    """Number of distinct runs once the runs of several prefixes are concatenated in order.
+
+    Concatenated runs ``a`` and ``b`` are identical only if ``a`` and ``b``
+    are identical in every prefix.
+    """
+    cache = digests or DigestCache()
+    signatures = [[] for _ in range(num_runs)]
+    for run_path in run_paths:
+        group_of = {r: i for i, group in enumerate(diversity_report(run_path, num_runs, cache)["identical_runs"]) for r in group}
+        for run_num, signature in enumerate(signatures, 1):
+            signature.append(group_of.get(run_num, -run_num))
+    if digests is None:
+        cache.save()
+    return len({tuple(signature) for signature in signatures})
+
+
+def check_run_diversity(
+    run_path: str,
+    num_runs: int = 5,
+    label: str | None = None,
+    strict: bool = False,
+    digests: DigestCache | None = None,
+) -> dict:
+    """Print the ``diversity_report`` of a prefix and warn, or fail, if runs collapsed.
+
+    Args:
+        run_path: Run prefix.
+        num_runs: Number of runs.
+        label: Name of the prefix in messages (default: ``run_path``).
+        strict: Raise instead of warning when some runs are identical.
+        digests: Cache of file digests and reports (default: the shared one).
+
+    Returns:
+        The report.
+
+    Raises:
+        ValueError: If some runs are identical and ``strict`` is set.
+    """
+    label = label or run_path
+    report = diversity_report(run_path, num_runs, digests)
+    print(
+        f"{label}: {report['mean_distinct']:.2f}/{num_runs} distinct samples per prompt on average, "
+        f"{report['single_sample_fraction']:.1%} of prompts with a single distinct sample"
+    )
+    if report["identical_runs"]:
+        message = (
+            f"{label}: identical runs {report['identical_runs']}; pass@{num_runs} effectively "
+            f"uses {report['distinct_runs']} distinct runs"
+        )
+        if strict:
+            raise ValueError(message)
+        print(f"Warning: {message}")
+    elif report["single_sample_fraction"] > 0.5:
+        print(f"Warning: {label}: most prompts have identical samples across runs")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deduplicate identical run files and check run diversity")
+    parser.add_argument(
+        "--completions-dir",
+        type=str,
+        default="../../completions",
+        help="Root of the completions tree (default: ../../completions)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be deduplicated")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Report sample diversity per prefix instead; exits with status 1 if any prefix has identical runs",
+    )
+    parser.add_argument(
+        "--digest-cache",
+        type=str,
+        default=DEFAULT_DIGEST_CACHE,
+        help=f"Memo of run file digests and diversity reports (default: {DEFAULT_DIGEST_CACHE})",
+    )
+    args = parser.parse_args()
+
+    prefixes = find_run_files(args.completions_dir)
+    if args.check:
+        digests = DigestCache(args.digest_cache)
+        collapsed = []
+        for prefix, files in sorted(prefixes.items()):
+            label = os.path.relpath(prefix, args.completions_dir)
+            report = check_run_diversity(prefix, len(files), label, digests=digests)
+            if report["identical_runs"]:
+                collapsed.append(label)
+        digests.save()
+        if collapsed:
+            print(f"{len(collapsed)} of {len(prefixes)} prefixes have identical runs")
+            sys.exit(1)
+        return
+
+    paths = [p for files in prefixes.values() for p in files.values()]
+    objects_dir = os.path.join(args.completions_dir, OBJECTS_DIR)
+    stats = dedup_files(paths, objects_dir, dry_run=args.dry_run)
+    action = "Would save" if args.dry_run else "Saved"
+    print(
+        f"{stats['files']} run files, {stats['unique']} unique payloads. "
+        f"{action} {stats['bytes_saved'] / 1e6:.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -96,4 +96,4 @@ else
     TENSOR_PARALLEL=1
 fi
 
-python vllm_inference.py --model $MODEL --prompt-file $PROMPT_FILE --max-tokens 512 --temperature 0.6 --top-p 0.95 --tensor-parallel-size $TENSOR_PARALLEL --num-runs 5 --output-prefix ${OUTPUT_DIR}/${OUT_PREFIX}
\ No newline at end of file
+python vllm_inference.py --model $MODEL --prompt-file $PROMPT_FILE --max-tokens 512 --temperature 0.6 --top-p 0.95 --tensor-parallel-size $TENSOR_PARALLEL --num-runs 5 --parallel-sampling --output-prefix ${OUTPUT_DIR}/${OUT_PREFIX}
\ No newline at end of file
@@ -0,0 +1,359 @@
+"""Data-parallel inference: one model replica per GPU (or endpoint), merged in order.
+
+The prompt file is split into contiguous shards, and a pool of workers
+(one per GPU in ``--devices`` or per server in ``--server-urls``) pulls
+shards from a queue and runs ``vllm_inference.py`` on each in its own
+process. Workers that exit with an error or exceed ``--shard-timeout``
+are retried with ``--resume``, so completions already written survive.
+Once every shard is done, the shard outputs are merged into the usual
+``=== Prompt i ===`` files in the original prompt order (and, with
+``--output-format parquet``/``both``, the shard stores into one
+``<prefix>.parquet``).
+
+Every shard has a ``shardNNN.json`` manifest in the shard directory
+recording the prompt file digest, the shard layout and the worker
+arguments. A rerun only skips a shard whose manifest still matches;
+otherwise its old outputs are deleted and it runs again.
+
+Arguments not recognised here (``--model``, ``--max-tokens``,
+``--backend mock``, ...) are passed through to every worker.
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+
+from answer_schemas import task_from_prompt_file
+from completion_store import read_rows, store_path, write_store
+from completion_writer import progress_path, read_completion_file, write_completion_file
+from run_dedup import file_digest
+from vllm_inference import get_output_file, load_prompts_from_file
+
+INFERENCE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vllm_inference.py")
+
+
+def shard_bounds(num_prompts: int, num_shards: int) -> list[tuple[int, int]]:
+    """Split ``range(num_prompts)`` into ``num_shards`` contiguous, near-equal ranges."""
+    num_shards = max(1, min(num_shards, num_prompts))
+    size, extra = divmod(num_prompts, num_shards)
+    bounds = []
+    start = 0
+    for k in range(num_shards):
+        end = start + size + (1 if k < extra else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def shard_output_file(shard_dir: str, shard: int, run_num: int) -> str:
+    return os.path.join(shard_dir, f"shard{shard:03d}_run{run_num}.txt")
+
+
+def shard_prefix(shard_dir: str, shard: int) -> str:
+    return os.path.join(shard_dir, f"shard{shard:03d}")
+
+
+def manifest_path(shard_dir: str, shard: int) -> str:
+    return f"{shard_prefix(shard_dir, shard)}.json"
+
+
+def read_manifest(shard_dir: str, shard: int) -> dict | None:
+    try:
+        with open(manifest_path(shard_dir, shard), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def prepare_shard(shard_dir: str, shard: int, prompts: list[str], manifest: dict) -> None:
+    """Write a shard's prompt file and manifest, deleting its outputs if they came from other inputs."""
+    prefix = shard_prefix(shard_dir, shard)
+    with open(f"{prefix}.txt", "w", encoding="utf-8") as f:
+        f.writelines(f"{prompt}\n" for prompt in prompts)
+    if read_manifest(shard_dir, shard) != manifest:
+        for path in glob.glob(f"{glob.escape(prefix)}_run*") + glob.glob(f"{glob.escape(prefix)}.parquet"):
+            os.remove(path)
+        with open(manifest_path(shard_dir, shard), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+
+
+def shard_done(shard_dir: str, shard: int, num_runs: int, manifest: dict, stored: bool = False) -> bool:
+    """True if the shard's manifest matches and every run has a finalized output (and store, if ``stored``)."""
+    if read_manifest(shard_dir, shard) != manifest:
+        return False
+    if stored and not os.path.exists(store_path(shard_prefix(shard_dir, shard))):
+        return False
+    for run_num in range(1, num_runs + 1):
+        output_file = shard_output_file(shard_dir, shard, run_num)
+        if not os.path.exists(output_file) or os.path.exists(progress_path(output_file)):
+            return False
+    return True
+
+
+class Slot:
+    """One worker slot: a GPU, an endpoint, or a plain CPU process."""
+
+    def __init__(self, name: str, env: dict | None = None, extra_args: list[str] | None = None) -> None:
+        self.name = name
+        self.env = env or {}
+        self.extra_args = extra_args or []
+        self.process: subprocess.Popen | None = None
+        self.shard: int | None = None
+        self.started = 0.0
+        self.log = None
+
+
+def make_slots(args) -> list[Slot]:
+    if args.devices:
+        return [Slot(f"gpu{d}", env={"CUDA_VISIBLE_DEVICES": d}) for d in args.devices]
+    if args.server_urls:
+        return [
+            Slot(url, extra_args=["--backend", "openai", "--server-url", url])
+            for url in args.server_urls
+        ]
+    return [Slot(f"worker{k}") for k in range(args.num_workers)]
+
+
+def start_shard(slot: Slot, shard: int, args, passthrough: list[str]) -> None:
+    prefix = shard_prefix(args.shard_dir, shard)
+    command = [
+        sys.executable,
+        INFERENCE_SCRIPT,
+        "--prompt-file", f"{prefix}.txt",
+        "--output-prefix", prefix,
+        "--num-runs", str(args.num_runs),
+        "--resume",
+        *slot.extra_args,
+        *passthrough,
+    ]
+    slot.log = open(f"{prefix}.log", "a", encoding="utf-8")
+    slot.process = subprocess.Popen(
+        command,
+        env={**os.environ, **slot.env},
+        stdout=slot.log,
+        stderr=subprocess.STDOUT,
+        # Own process group, so stop_shard also kills the engine's workers
+        start_new_session=True,
+    )
+    slot.shard = shard
+    slot.started = time.time()
+
+
+def stop_shard(slot: Slot) -> None:
+    """Kill the worker's whole process group (left-over engine processes included) and reap it."""
+    try:
+        os.killpg(slot.process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    slot.process.wait()
+    slot.log.close()
+    slot.process = None
+    slot.shard = None
+
+
+def run_shards(
+    shards: list[int], slots: list[Slot], args, passthrough: list[str], manifests: list[dict]
+) -> list[int]:
+    """Run every shard on the worker pool; return the shards that kept failing."""
+    queue = deque(shards)
+    attempts = dict.fromkeys(shards, 0)
+    failed = []
+    while queue or any(slot.process for slot in slots):
+        for slot in slots:
+            if slot.process is None:
+                if queue:
+                    shard = queue.popleft()
+                    attempts[shard] += 1
+                    print(f"[{slot.name}] shard {shard} (attempt {attempts[shard]}/{args.max_attempts})")
+                    start_shard(slot, shard, args, passthrough)
+                continue
+
+            shard = slot.shard
+            returncode = slot.process.poll()
+            timed_out = args.shard_timeout and time.time() - slot.started > args.shard_timeout
+            if returncode is None and not timed_out:
+                continue
+            stop_shard(slot)
+            if returncode == 0 and shard_done(
+                args.shard_dir, shard, args.num_runs, manifests[shard], args.output_format != "text"
+            ):
+                print(f"[{slot.name}] shard {shard} done")
+                continue
+            reason = "timed out" if returncode is None else f"exited with code {returncode}"
+            if attempts[shard] < args.max_attempts:
+                print(f"[{slot.name}] shard {shard} {reason}, requeueing")
+                queue.append(shard)
+            else:
+                print(f"[{slot.name}] shard {shard} {reason}, giving up")
+                failed.append(shard)
+        time.sleep(args.poll_interval)
+    return failed
+
+
+def merge_stores(args, bounds: list[tuple[int, int]], task: int) -> str:
+    """Merge the shard stores into ``<prefix>.parquet``, renumbering prompts to the full file."""
+    rows = []
+    for shard, (start, end) in enumerate(bounds):
+        shard_rows = read_rows(store_path(shard_prefix(args.shard_dir, shard)), task)
+        if len(shard_rows) != (end - start) * args.num_runs:
+            raise ValueError(
+                f"Shard {shard} store has {len(shard_rows)} rows, expected {(end - start) * args.num_runs}"
+            )
+        for row in shard_rows:
+            row["prompt_id"] += start
+        rows.extend(shard_rows)
+    path = store_path(args.output_prefix or os.path.splitext(args.output)[0])
+    write_store(path, rows)
+    return path
+
+
+def merge_shards(args, bounds: list[tuple[int, int]]) -> None:
+    """Concatenate the shard outputs of every run in the original prompt order."""
+    for run_num in range(1, args.num_runs + 1):
+        responses = []
+        for shard, (start, end) in enumerate(bounds):
+            shard_responses = read_completion_file(shard_output_file(args.shard_dir, shard, run_num))
+            if len(shard_responses) != end - start:
+                raise ValueError(
+                    f"Shard {shard} run {run_num} has {len(shard_responses)} completions, "
+                    f"expected {end - start}"
+                )
+            responses.extend(shard_responses)
+        output_file = get_output_file(args, run_num)
+        out_dir = os.path.dirname(output_file)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        write_completion_file(output_file, responses)
+        print(f"Results saved to: {output_file}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Split a prompt file into shards, run one inference worker per GPU or "
+        "endpoint, and merge the outputs in order. Unrecognised arguments are passed to "
+        "vllm_inference.py."
+    )
+    parser.add_argument("--prompt-file", type=str, required=True, help="Path to the prompt file")
+    parser.add_argument("--output", type=str, help="Output file (as in vllm_inference.py)")
+    parser.add_argument("--output-prefix", type=str, help="Output prefix (as in vllm_inference.py)")
+    parser.add_argument("--num-runs", type=int, default=1, help="Number of runs to generate (default: 1)")
+    parser.add_argument(
+        "--task",
+        type=int,
+        choices=[1, 2],
+        default=None,
+        help="Task of the prompt file (default: inferred from 'task1'/'task2' in the file name)",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["text", "parquet", "both"],
+        default="text",
+        help="As in vllm_inference.py; the shard stores are merged into one <prefix>.parquet "
+        "(default: text)",
+    )
+    parser.add_argument("--devices", nargs="+", help="GPU ids; one worker per GPU via CUDA_VISIBLE_DEVICES")
+    parser.add_argument(
+        "--server-urls",
+        nargs="+",
+        help="OpenAI-compatible server URLs; one worker per endpoint",
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="Number of workers when neither --devices nor --server-urls is given (default: 1)",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=None,
+        help="Number of shards; more shards than workers lets fast workers pick up the slack "
+        "of slow ones (default: one per worker)",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        type=str,
+        default=None,
+        help="Directory for shard prompts, outputs and logs (default: <output>.shards)",
+    )
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per shard (default: 3)")
+    parser.add_argument(
+        "--shard-timeout",
+        type=float,
+        default=None,
+        help="Kill and retry a shard that runs longer than this many seconds (default: no limit)",
+    )
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between status checks")
+    parser.add_argument("--keep-shards", action="store_true", help="Keep the shard directory after merging")
+
+    args, passthrough = parser.parse_known_args()
+
+    if not (args.output or args.output_prefix):
+        print("Error: --output or --output-prefix is required.")
+        sys.exit(1)
+
+    prompts = load_prompts_from_file(args.prompt_file)
+    if not prompts:
+        print("Error: No prompts found in file.")
+        sys.exit(1)
+
+    slots = make_slots(args)
+    bounds = shard_bounds(len(prompts), args.num_shards or len(slots))
+    if args.shard_dir is None:
+        args.shard_dir = f"{args.output_prefix or os.path.splitext(args.output)[0]}.shards"
+    os.makedirs(args.shard_dir, exist_ok=True)
+
+    # Shard file names no longer say task1/task2, so tell the workers.
+    task = args.task or task_from_prompt_file(args.prompt_file)
+    if task is not None:
+        passthrough += ["--task", str(task)]
+    stored = args.output_format != "text"
+    if stored:
+        if task is None:
+            print("Error: Could not determine the task from the prompt file name; pass --task.")
+            sys.exit(1)
+        # Workers keep their text files too: the merge reads both.
+        passthrough += ["--output-format", "both"]
+
+    prompt_digest = file_digest(args.prompt_file)
+    manifests = []
+    todo = []
+    for shard, (start, end) in enumerate(bounds):
+        manifest = {
+            "prompt_file_digest": prompt_digest,
+            "num_shards": len(bounds),
+            "start": start,
+            "end": end,
+            "worker_args": passthrough,
+        }
+        manifests.append(manifest)
+        prepare_shard(args.shard_dir, shard, prompts[start:end], manifest)
+        if not shard_done(args.shard_dir, shard, args.num_runs, manifest, stored):
+            todo.append(shard)
+    print(
+        f"{len(prompts)} prompts in {len(bounds)} shards on {len(slots)} workers "
+        f"({len(bounds) - len(todo)} shards already done)"
+    )
+
+    failed = run_shards(todo, slots, args, passthrough, manifests)
+    if failed:
+        print(f"Error: shards {failed} failed; see the logs in {args.shard_dir}. Rerun to retry them.")
+        sys.exit(1)
+
+    if args.output_format != "parquet":
+        merge_shards(args, bounds)
+    if stored:
+        print(f"Completion store saved to: {merge_stores(args, bounds, task)}")
+    if not args.keep_shards:
+        shutil.rmtree(args.shard_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Dependency-ordered execution of a graph of named nodes on a process pool.
+
+A node runs as ``fn(*args, *dependency_results)`` once every node it
+depends on has finished. Ready nodes are submitted to one
+``ProcessPoolExecutor`` as soon as they become ready, so independent
+branches run concurrently. Nodes marked ``local`` run in the calling
+process instead, for cheap steps that touch state the caller owns (a
+manifest, a results CSV). A failing node is reported and the nodes that
+depend on it are skipped, except ``partial`` nodes, which get ``None`` in
+place of the failed result.
+"""
+
+import os
+import traceback
+from collections.abc import Callable, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any
+
+
+class Node:
+    """One unit of work of a task graph.
+
+    Args:
+        fn: Function to call; must be picklable unless ``local``.
+        args: Leading arguments; the results of ``deps`` follow them.
+        deps: Names of the nodes whose results ``fn`` takes.
+        local: Run in the calling process rather than on the pool.
+        partial: Run even if some dependencies failed, with ``None`` for them.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[..., Any],
+        args: Sequence[Any] = (),
+        deps: Sequence[str] = (),
+        local: bool = False,
+        partial: bool = False,
+    ) -> None:
+        self.fn = fn
+        self.args = tuple(args)
+        self.deps = list(deps)
+        self.local = local
+        self.partial = partial
+
+
+def run_graph(
+    nodes: dict[str, Node],
+    workers: int | None = None,
+    on_result: Callable[[str, Any], None] | None = None,
+) -> dict[str, Any]:
+    """Run every node of a graph after its dependencies.
+
+    Args:
+        nodes: Nodes by name; ready nodes start in this order.
+        workers: Number of worker processes (default: number of cores).
+            With one worker every node runs in the calling process.
+        on_result: Called in the calling process with the name and result
+            of every node that succeeds.
+
+    Returns:
+        The result of every node that ran successfully, by name.
+    """
+    for name, node in nodes.items():
+        unknown = [dep for dep in node.deps if dep not in nodes]
+        if unknown:
+            raise ValueError(f"Node {name} depends on unknown nodes {unknown}")
+
+    results: dict[str, Any] = {}
+    failed = set()
+    waiting = list(nodes)
+    running: dict[Future, str] = {}
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def finish(name: str, call: Callable[[], Any]) -> None:
+        try:
+            results[name] = call()
+        except Exception:
+            print(f"Error in {name}:")
+            traceback.print_exc()
+            failed.add(name)
+            return
+        if on_result is not None:
+            on_result(name, results[name])
+
+    try:
+        while waiting or running:
+            started = False
+            for name in list(waiting):
+                node = nodes[name]
+                if any(dep not in results and dep not in failed for dep in node.deps):
+                    continue
+                waiting.remove(name)
+                started = True
+                if not node.partial and any(dep in failed for dep in node.deps):
+                    print(f"Skipping {name}: a dependency failed")
+                    failed.add(name)
+                    continue
+                inputs = [results.get(dep) for dep in node.deps]
+                if node.local or pool is None:
+                    finish(name, lambda node=node, inputs=inputs: node.fn(*node.args, *inputs))
+                else:
+                    running[pool.submit(node.fn, *node.args, *inputs)] = name
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), future.result)
+            elif waiting and not started:
+                raise ValueError(f"Dependency cycle among {waiting}")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return results
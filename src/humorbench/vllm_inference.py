@@ -1,9 +1,30 @@
 """VLLM inference script with batching support for Qwen models."""
 
 import argparse
+import gc
+import json
 import os
+import random
 import sys
-from typing import List
+import tempfile
+import time
+from collections import deque
+from collections.abc import Iterator, Sequence
+
+from answer_schemas import answer_schema, gold_line_counts, task_from_prompt_file
+from autotune import (
+    CALIBRATION_MAX_TOKENS,
+    DEFAULT_GRID,
+    resolve_engine_settings,
+    run_trial_process,
+    save_tuned_settings,
+)
+from completion_cache import CompletionCache, wrap_writers
+from completion_store import num_samples, store_path, write_run_store
+from completion_writer import CompletionWriter, StdoutWriter
+from inference_metrics import MetricsLog, generated_token_count, prompt_token_count
+from mock_backend import MockBackend
+from openai_backend import OpenAICompletionsClient
 
 # Set HuggingFace cache directory
 HF_HOME = "/fs/nexus-scratch/adesai10"
@@ -11,9 +32,9 @@ os.environ["HF_HOME"] = HF_HOME
 os.environ["HUGGINGFACE_HUB_CACHE"] = os.path.join(HF_HOME, "hub")
 
 
-def load_prompts_from_file(prompt_file: str) -> List[str]:
+def load_prompts_from_file(prompt_file: str) -> list[str]:
     """Load prompts from a text file."""
-    with open(prompt_file, "r", encoding="utf-8") as f:
+    with open(prompt_file, encoding="utf-8") as f:
         prompts = [line.strip() for line in f if line.strip()]
     return prompts
 
@@ -30,23 +51,142 @@ def check_model_cache(model_name: str) -> None:
         print(f"Model not found in cache, will download to: {HF_HOME}/hub")
 
 
+class PrefixCacheStats:
+    """Accumulate how many prompt tokens were served from the prefix cache."""
+
+    def __init__(self) -> None:
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def update(self, output) -> None:
+        """Add the token counts of one finished ``RequestOutput``."""
+        prompt_tokens = getattr(output, "num_prompt_tokens", None)
+        if prompt_tokens is None:
+            prompt_tokens = len(output.prompt_token_ids or [])
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += getattr(output, "num_cached_tokens", None) or 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of prompt tokens that did not need to be prefilled."""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def report(self) -> None:
+        print(
+            f"Prefix cache: {self.cached_tokens}/{self.prompt_tokens} prompt tokens "
+            f"cached (hit rate {self.hit_rate:.1%})"
+        )
+
+
+def stream_generate(
+    llm,
+    prompts: list[str],
+    sampling_params,
+    indices: Sequence[int] | None = None,
+    request_tag: str = "req",
+    prompt_lengths: list[int] | None = None,
+    max_in_flight: int | None = None,
+    timings: dict | None = None,
+) -> Iterator[tuple[int, object]]:
+    """Submit prompts to the engine and yield ``(index, RequestOutput)`` as each finishes.
+
+    Unlike ``llm.generate``, which returns only after the whole batch is done,
+    this drives the engine step by step so callers can persist every
+    completion the moment it is available. ``sampling_params`` is either
+    shared by all prompts or a list with one entry per prompt.
+
+    ``llm`` is a ``vllm.LLM`` or a backend that drives its own requests
+    through a ``stream(prompts, params, indices, request_tag, timings=...)``
+    method (``OpenAICompletionsClient``, ``MockBackend``); for those the
+    params are the request fields built by ``make_request_params``.
+
+    Args:
+        prompt_lengths: Token length of every prompt. When given, prompts are
+            submitted longest first so the slowest requests do not straggle
+            at the end of the batch. Output order is unaffected because
+            results are keyed by prompt index.
+        max_in_flight: Maximum number of requests handed to the engine at
+            once; the rest are added as earlier ones finish (default: all).
+        timings: If given, filled with ``{index: {"submitted", "first_token",
+            "finished"}}`` wall-clock timestamps. The first token is seen at
+            engine-step granularity.
+    """
+    if indices is None:
+        indices = range(len(prompts))
+    if prompt_lengths is not None:
+        indices = sorted(indices, key=lambda i: prompt_lengths[i], reverse=True)
+
+    if isinstance(llm, (OpenAICompletionsClient, MockBackend)):
+        yield from llm.stream(
+            prompts, sampling_params, indices, request_tag, timings=timings, max_in_flight=max_in_flight
+        )
+        return
+
+    per_prompt = isinstance(sampling_params, list)
+    engine = llm.llm_engine
+    waiting = deque(indices)
+    limit = max_in_flight or len(waiting)
+    in_flight = 0
+
+    def submit() -> None:
+        nonlocal in_flight
+        while waiting and in_flight < limit:
+            index = waiting.popleft()
+            params = sampling_params[index] if per_prompt else sampling_params
+            engine.add_request(f"{request_tag}-{index}", prompts[index], params)
+            if timings is not None:
+                timings[index] = {"submitted": time.time()}
+            in_flight += 1
+
+    submit()
+    while engine.has_unfinished_requests():
+        for output in engine.step():
+            index = int(output.request_id.rsplit("-", 1)[1])
+            if timings is not None:
+                now = time.time()
+                timings[index].setdefault("first_token", now)
+                if output.finished:
+                    timings[index]["finished"] = now
+            if output.finished:
+                in_flight -= 1
+                yield index, output
+        submit()
+
+
+def completion_meta(output, sample) -> dict:
+    """Token counts and finish reason of one sample, stored in the Parquet output."""
+    return {
+        "prompt_tokens": prompt_token_count(output),
+        "generated_tokens": generated_token_count(output, sample),
+        "finish_reason": sample.finish_reason,
+    }
+
+
+def measure_prompt_lengths(llm, prompts: list[str]) -> list[int] | None:
+    """Tokenize every prompt with the backend's tokenizer (None for the HTTP backend)."""
+    if not hasattr(llm, "get_tokenizer"):
+        return None
+    tokenizer = llm.get_tokenizer()
+    return [len(tokenizer.encode(prompt)) for prompt in prompts]
+
+
 def run_inference(
     model_name: str,
-    prompts: List[str],
+    prompts: list[str],
     max_tokens: int = 2048,
     temperature: float = 0.7,
     top_p: float = 0.9,
     batch_size: int = 4,
     tensor_parallel_size: int = 1,
     max_model_len: int = None,
-) -> List[str]:
+) -> list[str]:
     """Run inference using VLLM with batching."""
     from vllm import LLM, SamplingParams
 
     check_model_cache(model_name)
 
     print(f"Loading model: {model_name}")
-    
+
     llm = LLM(
         model=model_name,
         trust_remote_code=True,
@@ -72,6 +212,385 @@ def run_inference(
     return responses
 
 
+def get_output_file(args, run_num: int) -> str | None:
+    """Return the output path for a run, or None if no output was requested."""
+    if args.output_prefix:
+        return f"{args.output_prefix}_run{run_num}.txt"
+    if args.output:
+        if args.num_runs > 1:
+            base_name, ext = os.path.splitext(args.output)
+            return f"{base_name}_run{run_num}{ext}"
+        return args.output
+    return None
+
+
+def run_sequential(
+    llm, prompts: list[str], sampling_params, run_writers: list, metrics=None, **stream_options
+) -> None:
+    """Generate one sample per prompt per run, calling the engine once per run.
+
+    ``run_writers`` holds one writer per run; a writer exposes ``pending``,
+    ``write``, ``close``, ``finalize`` and ``output_files``. ``metrics`` is an
+    optional ``inference_metrics.MetricsLog``. ``stream_options`` are passed
+    through to ``stream_generate``.
+    """
+    num_runs = len(run_writers)
+    for run_num, writer in enumerate(run_writers, 1):
+        print(f"\n{'='*80}")
+        print(f"Run {run_num}/{num_runs}")
+        print(f"{'='*80}")
+
+        pending = writer.pending
+        if not pending:
+            writer.finalize()
+            print(f"All {len(prompts)} prompts already completed for run {run_num}, skipping")
+            continue
+        if len(pending) < len(prompts):
+            print(f"Resuming: {len(prompts) - len(pending)} prompts already completed")
+
+        print(f"Running inference on {len(pending)} prompts...")
+        cache_stats = PrefixCacheStats()
+        run_metrics = metrics.run(f"run{run_num}") if metrics else None
+        timings = {} if metrics else None
+        try:
+            for index, output in stream_generate(
+                llm, prompts, sampling_params, pending, request_tag=f"run{run_num}",
+                timings=timings, **stream_options
+            ):
+                writer.write(index, output.outputs[0].text, completion_meta(output, output.outputs[0]))
+                cache_stats.update(output)
+                if run_metrics:
+                    run_metrics.update(index, output, timings.pop(index))
+        finally:
+            writer.close()
+        writer.finalize()
+        cache_stats.report()
+        if run_metrics:
+            run_metrics.finish()
+        for output_file in writer.output_files:
+            print(f"Results saved to: {output_file}")
+
+
+def run_parallel_sampling(
+    llm, prompts: list[str], sampling_params, run_writers: list, metrics=None, **stream_options
+) -> None:
+    """Generate all runs in one engine pass using ``SamplingParams(n=num_runs)``.
+
+    The k samples of a prompt share its prefill and KV blocks. Sample j is
+    written to the run j+1 writer, so the ``_run1.._runK`` layout is unchanged.
+    """
+    num_runs = len(run_writers)
+    pending_per_run = [set(w.pending) for w in run_writers]
+    pending = sorted(set().union(*pending_per_run))
+    if not pending:
+        for writer in run_writers:
+            writer.finalize()
+        print(f"All {len(prompts)} prompts already completed for every run, skipping")
+        return
+    if len(pending) < len(prompts):
+        print(f"Resuming: {len(prompts) - len(pending)} prompts already completed")
+
+    print(f"Running inference on {len(pending)} prompts x {num_runs} samples...")
+    cache_stats = PrefixCacheStats()
+    run_metrics = metrics.run("sample") if metrics else None
+    timings = {} if metrics else None
+    try:
+        for index, output in stream_generate(
+            llm, prompts, sampling_params, pending, request_tag="sample", timings=timings, **stream_options
+        ):
+            samples = sorted(output.outputs, key=lambda o: o.index)
+            for writer, run_pending, sample in zip(run_writers, pending_per_run, samples, strict=False):
+                if index in run_pending:
+                    writer.write(index, sample.text, completion_meta(output, sample))
+            cache_stats.update(output)
+            if run_metrics:
+                run_metrics.update(index, output, timings.pop(index))
+    finally:
+        for writer in run_writers:
+            writer.close()
+    cache_stats.report()
+    if run_metrics:
+        run_metrics.finish()
+
+    for writer in run_writers:
+        writer.finalize()
+        for output_file in writer.output_files:
+            print(f"Results saved to: {output_file}")
+
+
+def load_llm(
+    model_name: str,
+    tensor_parallel_size: int = 1,
+    max_model_len: int = None,
+    max_num_batched_tokens: int = None,
+    max_num_seqs: int = None,
+    enable_prefix_caching: bool | None = None,
+    seed: int | None = None,
+):
+    """Load a model into a VLLM engine."""
+    from vllm import LLM
+
+    check_model_cache(model_name)
+
+    print(f"Loading model: {model_name}")
+
+    engine_kwargs = {}
+    if enable_prefix_caching is not None:
+        engine_kwargs["enable_prefix_caching"] = enable_prefix_caching
+    if seed is not None:
+        engine_kwargs["seed"] = seed
+
+    return LLM(
+        model=model_name,
+        trust_remote_code=True,
+        max_model_len=max_model_len,
+        tensor_parallel_size=tensor_parallel_size,
+        max_num_batched_tokens=max_num_batched_tokens,
+        max_num_seqs=max_num_seqs,
+        **engine_kwargs,
+    )
+
+
+def free_gpu_memory() -> None:
+    """Release GPU memory after the last reference to an engine is dropped."""
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            torch.cuda.synchronize()
+    except ImportError:
+        pass
+
+
+def autotune_engine(
+    args,
+    prompts: list[str],
+    num_samples: int = 256,
+    timeout: float | None = None,
+    max_tokens: int = CALIBRATION_MAX_TOKENS,
+) -> dict | None:
+    """Time a calibration sample under each candidate batch setting and keep the fastest.
+
+    Each candidate runs in its own process (``autotune.run_trial_process``),
+    which loads a fresh engine with the given ``max_num_seqs`` and
+    ``max_num_batched_tokens`` and generates the sample with the job's
+    sampling parameters: the same ``n`` under ``--parallel-sampling``, and
+    at most ``max_tokens`` tokens per sample to keep each trial short. The best setting is saved with
+    ``autotune.save_tuned_settings`` so later runs reuse it automatically,
+    together with every candidate's result, failures and their errors
+    included. If every candidate fails, only the candidates are saved and
+    later runs keep the engine defaults.
+    """
+    sample = random.Random(0).sample(prompts, min(num_samples, len(prompts)))
+    base = {
+        "model": args.model,
+        "tensor_parallel_size": args.tensor_parallel_size,
+        "max_model_len": args.max_model_len,
+        "enable_prefix_caching": args.enable_prefix_caching,
+        "temperature": args.temperature,
+        "top_p": args.top_p,
+        "max_tokens": min(args.max_tokens, max_tokens),
+        "n": args.num_runs if args.parallel_sampling else 1,
+        "prompts": sample,
+    }
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="autotune-") as work_dir:
+        for max_num_seqs, max_num_batched_tokens in DEFAULT_GRID:
+            print(f"Autotune: max_num_seqs={max_num_seqs}, max_num_batched_tokens={max_num_batched_tokens}")
+            setting = {"max_num_seqs": max_num_seqs, "max_num_batched_tokens": max_num_batched_tokens}
+            result = run_trial_process(dict(base, **setting), work_dir, timeout)
+            if result["status"] == "ok":
+                print(f"Autotune: {result['tokens_per_s']:.0f} generated tok/s")
+            else:
+                print(f"Autotune: setting failed: {result['error']}")
+            results.append(dict(setting, **result))
+
+    succeeded = [r for r in results if r["status"] == "ok"]
+    summary = {"num_samples": len(sample), "max_tokens": base["max_tokens"], "n": base["n"], "candidates": results}
+    if not succeeded:
+        save_tuned_settings(
+            args.model,
+            args.tensor_parallel_size,
+            args.max_model_len,
+            dict(summary, max_num_seqs=None, max_num_batched_tokens=None, tokens_per_s=None),
+        )
+        print("Autotune: every setting failed, keeping engine defaults")
+        return None
+    best = max(succeeded, key=lambda r: r["tokens_per_s"])
+    best = dict(summary, **{key: best[key] for key in ("max_num_seqs", "max_num_batched_tokens", "tokens_per_s")})
+    save_tuned_settings(args.model, args.tensor_parallel_size, args.max_model_len, best)
+    print(
+        f"Autotune: best max_num_seqs={best['max_num_seqs']}, "
+        f"max_num_batched_tokens={best['max_num_batched_tokens']} ({best['tokens_per_s']:.0f} tok/s)"
+    )
+    return best
+
+
+def _structured_output_kwargs(schema: dict) -> dict:
+    """``SamplingParams`` keyword that constrains output to a JSON schema."""
+    try:
+        from vllm.sampling_params import StructuredOutputsParams
+        return {"structured_outputs": StructuredOutputsParams(json=schema)}
+    except ImportError:
+        # vLLM releases before structured outputs replaced guided decoding.
+        from vllm.sampling_params import GuidedDecodingParams
+        return {"guided_decoding": GuidedDecodingParams(json=schema)}
+
+
+def _per_prompt_params(args, prompts: list[str], tasks: list[int], build) -> list:
+    """Build one params object per prompt for guided decoding.
+
+    Prompts with the same schema (every Task 1 prompt, or Task 2 jokes with
+    the same number of lines) share a single params object. Task 2 answer
+    lengths come from the gold labels of ``--line-counts-dataset`` if given.
+    """
+    line_counts = None
+    if getattr(args, "line_counts_dataset", None):
+        line_counts = gold_line_counts(args.line_counts_dataset, args.joke_col)
+    by_schema = {}
+    params = []
+    for prompt, task in zip(prompts, tasks, strict=True):
+        if task is None:
+            raise ValueError("--guided-decoding needs the task; pass --task 1 or --task 2")
+        schema = answer_schema(task, prompt, args.guided_reasoning_chars, line_counts)
+        key = json.dumps(schema, sort_keys=True)
+        if key not in by_schema:
+            by_schema[key] = build(schema)
+        params.append(by_schema[key])
+    return params
+
+
+def make_sampling_params(args, prompts: list[str] | None = None, tasks: list[int] | None = None):
+    """Build the ``SamplingParams`` for a job.
+
+    Returns a single object shared by every prompt, or with
+    ``--guided-decoding`` a list with one JSON-schema-constrained entry per
+    prompt (``tasks`` gives the task number of each prompt).
+    """
+    from vllm import SamplingParams
+
+    kwargs = {
+        "n": args.num_runs if args.parallel_sampling else 1,
+        "temperature": args.temperature,
+        "top_p": args.top_p,
+        "max_tokens": args.max_tokens,
+        "stop": ["### END"],
+    }
+    if not getattr(args, "guided_decoding", False):
+        return SamplingParams(**kwargs)
+    return _per_prompt_params(
+        args, prompts, tasks, lambda schema: SamplingParams(**kwargs, **_structured_output_kwargs(schema))
+    )
+
+
+def make_request_params(args, prompts: list[str] | None = None, tasks: list[int] | None = None):
+    """Build the ``/v1/completions`` request fields for a job (see ``make_sampling_params``)."""
+    fields = {
+        "n": args.num_runs if args.parallel_sampling else 1,
+        "temperature": args.temperature,
+        "top_p": args.top_p,
+        "max_tokens": args.max_tokens,
+        "stop": ["### END"],
+    }
+    if not getattr(args, "guided_decoding", False):
+        return fields
+    return _per_prompt_params(
+        args, prompts, tasks, lambda schema: dict(fields, structured_outputs={"json": schema})
+    )
+
+
+def generate_runs(
+    llm,
+    prompts: list[str],
+    sampling_params,
+    run_writers: list,
+    parallel_sampling: bool,
+    length_sort: bool = True,
+    batch_size: int | None = None,
+    metrics=None,
+) -> None:
+    """Fill one writer per run, with either n-way or run-by-run sampling.
+
+    Args:
+        length_sort: Submit prompts longest first (by token count).
+        batch_size: Maximum number of prompts in the engine at once.
+        metrics: Optional ``inference_metrics.MetricsLog`` for per-request telemetry.
+    """
+    prompt_lengths = measure_prompt_lengths(llm, prompts) if length_sort else None
+    stream_options = {"prompt_lengths": prompt_lengths, "max_in_flight": batch_size}
+    if parallel_sampling:
+        run_parallel_sampling(llm, prompts, sampling_params, run_writers, metrics, **stream_options)
+    else:
+        run_sequential(llm, prompts, sampling_params, run_writers, metrics, **stream_options)
+
+
+def make_backend(args, prompts: list[str], task: int | None, metrics=None):
+    """Start the backend of a job and build its sampling parameters.
+
+    For the vLLM backend this runs ``--autotune`` and loads the model, so
+    ``main`` only calls it when some completion is still missing.
+
+    Returns:
+        ``(llm, sampling_params)``.
+    """
+    if args.backend == "openai":
+        print(f"Sending requests to {args.server_url} (model: {args.model})")
+        llm = OpenAICompletionsClient(
+            args.server_url,
+            args.model,
+            max_concurrency=args.max_concurrency,
+            max_retries=args.max_retries,
+            timeout=args.request_timeout,
+            api_key=os.environ.get("OPENAI_API_KEY"),
+        )
+        sampling_params = make_request_params(args, prompts, [task] * len(prompts))
+    elif args.backend == "mock":
+        print(f"Using the mock backend (task {task}, {args.mock_tokens_per_s or 'instant'} tok/s)")
+        llm = MockBackend(
+            task,
+            output_tokens=args.mock_output_tokens,
+            tokens_per_s=args.mock_tokens_per_s,
+            ttft=args.mock_ttft,
+            max_num_seqs=args.max_num_seqs or 256,
+            seed=args.seed or 0,
+        )
+        sampling_params = make_request_params(args, prompts, [task] * len(prompts))
+    else:
+        if args.autotune:
+            autotune_engine(
+                args,
+                prompts,
+                num_samples=args.autotune_samples,
+                timeout=args.autotune_timeout,
+                max_tokens=args.autotune_max_tokens,
+            )
+        max_num_seqs, max_num_batched_tokens = resolve_engine_settings(
+            args.model,
+            args.tensor_parallel_size,
+            args.max_model_len,
+            args.max_num_seqs,
+            args.max_num_batched_tokens,
+        )
+
+        # Load model once and reuse for all runs
+        load_start = time.time()
+        llm = load_llm(
+            args.model,
+            tensor_parallel_size=args.tensor_parallel_size,
+            max_model_len=args.max_model_len,
+            max_num_batched_tokens=max_num_batched_tokens,
+            max_num_seqs=max_num_seqs,
+            enable_prefix_caching=args.enable_prefix_caching,
+            seed=args.seed,
+        )
+        if metrics:
+            metrics.model_load(time.time() - load_start)
+        sampling_params = make_sampling_params(args, prompts, [task] * len(prompts))
+    return llm, sampling_params
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Run inference using VLLM with batching on Qwen models"
@@ -109,8 +628,15 @@ def main() -> None:
     parser.add_argument(
         "--batch-size",
         type=int,
-        default=4,
-        help="Batch size for inference (default: 4)",
+        default=None,
+        help="Maximum number of prompts submitted to the engine at once; the rest are "
+        "added as earlier ones finish (default: all)",
+    )
+    parser.add_argument(
+        "--length-sort",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Submit prompts longest first by token count; output order is unchanged (default: on)",
     )
     parser.add_argument(
         "--output",
@@ -133,13 +659,46 @@ def main() -> None:
         "--max-num-batched-tokens",
         type=int,
         default=None,
-        help="Maximum number of batched tokens per iteration (default: auto-detect)",
+        help="Maximum number of batched tokens per iteration (default: autotuned value, else auto-detect)",
     )
     parser.add_argument(
         "--max-num-seqs",
         type=int,
         default=None,
-        help="Maximum number of sequences per batch (default: auto-detect)",
+        help="Maximum number of sequences per batch (default: autotuned value, else auto-detect)",
+    )
+    parser.add_argument(
+        "--autotune",
+        action="store_true",
+        help="Calibrate max-num-seqs/max-num-batched-tokens on a prompt sample before the run "
+        "and save the fastest setting for this model; later runs reuse it automatically",
+    )
+    parser.add_argument(
+        "--autotune-samples",
+        type=int,
+        default=256,
+        help="Number of prompts in the autotune calibration sample (default: 256)",
+    )
+    parser.add_argument(
+        "--autotune-max-tokens",
+        type=int,
+        default=CALIBRATION_MAX_TOKENS,
+        help="Maximum tokens generated per calibration sample, capped by --max-tokens "
+        f"(default: {CALIBRATION_MAX_TOKENS})",
+    )
+    parser.add_argument(
+        "--autotune-timeout",
+        type=float,
+        default=None,
+        help="Kill an autotune trial (engine load and calibration) after this many seconds and "
+        "record it as failed (default: no limit)",
+    )
+    parser.add_argument(
+        "--enable-prefix-caching",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Turn automatic prefix caching on or off (default: engine default). "
+        "Pair with prompts built using generate_prompts.py --layout prefix",
     )
     parser.add_argument(
         "--num-runs",
@@ -152,6 +711,128 @@ def main() -> None:
         type=str,
         help="Output file prefix for multiple runs (e.g., 'output/prefix' creates 'output/prefix_run1.txt', etc.)",
     )
+    parser.add_argument(
+        "--parallel-sampling",
+        action="store_true",
+        help="Draw all --num-runs samples per prompt in one engine call (SamplingParams(n=num_runs)) "
+        "so prefill and KV blocks are shared; still writes one file per run",
+    )
+    parser.add_argument(
+        "--guided-decoding",
+        action="store_true",
+        help="Constrain output to the task's answer JSON schema (Task 1 category enum, "
+        "Task 2 label array with one entry per gold line, see --line-counts-dataset)",
+    )
+    parser.add_argument(
+        "--line-counts-dataset",
+        type=str,
+        default=None,
+        help="With --guided-decoding, labelled TSV the prompts were generated from; Task 2 "
+        "answers get exactly its number of labels per joke (default: 1 to 2 labels per "
+        "\\n-separated joke line)",
+    )
+    parser.add_argument(
+        "--joke-col",
+        type=str,
+        default="Joke",
+        help="Joke column of --line-counts-dataset (default: Joke)",
+    )
+    parser.add_argument(
+        "--guided-reasoning-chars",
+        type=int,
+        default=None,
+        help="With --guided-decoding, add a reasoning field of at most this many characters "
+        "before the answer (default: no reasoning field)",
+    )
+    parser.add_argument(
+        "--task",
+        type=int,
+        choices=[1, 2],
+        default=None,
+        help="Task of the prompt file (default: inferred from 'task1'/'task2' in the file name)",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["text", "parquet", "both"],
+        default="text",
+        help="'text' writes === Prompt i === run files; 'parquet' writes one <prefix>.parquet "
+        "with a row per prompt and sample (text, extracted answer, token counts, finish "
+        "reason); 'both' keeps the text files too (default: text)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Append JSONL telemetry (model load time, per-request tokens, finish reason and "
+        "time to first token, per-run summaries with GPU-hours) to this file",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory of a completion cache shared between jobs; cached samples are "
+        "reused and only the misses are generated (default: no cache)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Engine random seed for the vllm backend; also part of the cache key (default: unseeded)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["vllm", "openai", "mock"],
+        default="vllm",
+        help="'vllm' loads the model in-process; 'openai' sends requests to a running "
+        "OpenAI-compatible server; 'mock' simulates an engine on CPU (default: vllm)",
+    )
+    parser.add_argument(
+        "--server-url",
+        type=str,
+        default="http://localhost:8000/v1",
+        help="Base URL of the OpenAI-compatible server (default: http://localhost:8000/v1)",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=64,
+        help="Maximum in-flight requests for the openai backend (default: 64)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=5,
+        help="Retries per request for the openai backend (default: 5)",
+    )
+    parser.add_argument(
+        "--request-timeout",
+        type=float,
+        default=600.0,
+        help="Per-request timeout in seconds for the openai backend (default: 600)",
+    )
+    parser.add_argument(
+        "--mock-output-tokens",
+        type=int,
+        default=64,
+        help="Mean completion length in tokens for the mock backend (default: 64)",
+    )
+    parser.add_argument(
+        "--mock-tokens-per-s",
+        type=float,
+        default=0.0,
+        help="Simulated per-sequence decode speed for the mock backend; 0 is instant (default: 0)",
+    )
+    parser.add_argument(
+        "--mock-ttft",
+        type=float,
+        default=0.0,
+        help="Simulated time to first token in seconds for the mock backend (default: 0)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted job, re-submitting only prompts without saved output",
+    )
 
     args = parser.parse_args()
 
@@ -166,59 +847,70 @@ def main() -> None:
         print("Error: No prompts found in file.")
         sys.exit(1)
 
-    # Load model once and reuse for all runs
-    from vllm import LLM, SamplingParams
+    if args.resume and not (args.output or args.output_prefix):
+        print("Error: --resume requires --output or --output-prefix.")
+        sys.exit(1)
 
-    check_model_cache(args.model)
+    task = args.task or task_from_prompt_file(args.prompt_file)
+    if (args.guided_decoding or args.backend == "mock" or args.output_format != "text") and task is None:
+        print("Error: Could not determine the task from the prompt file name; pass --task.")
+        sys.exit(1)
 
-    print(f"Loading model: {args.model}")
-    
-    llm = LLM(
-        model=args.model,
-        trust_remote_code=True,
-        max_model_len=args.max_model_len,
-        tensor_parallel_size=args.tensor_parallel_size,
-        max_num_batched_tokens=args.max_num_batched_tokens,
-        max_num_seqs=args.max_num_seqs,
-    )
-    
-    sampling_params = SamplingParams(
-        temperature=args.temperature,
-        top_p=args.top_p,
-        max_tokens=args.max_tokens,
-        stop=["### END"]
-    )
+    store_prefix = None
+    if args.output_format != "text":
+        if not (args.output or args.output_prefix):
+            print("Error: --output-format parquet/both requires --output or --output-prefix.")
+            sys.exit(1)
+        store_prefix = args.output_prefix or os.path.splitext(args.output)[0]
+        store_file = store_path(store_prefix)
+        if args.resume and os.path.exists(store_file) and num_samples(store_file) >= args.num_runs:
+            print(f"All runs already stored in {store_file}, skipping")
+            return
 
+    run_writers = []
     for run_num in range(1, args.num_runs + 1):
-        print(f"\n{'='*80}")
-        print(f"Run {run_num}/{args.num_runs}")
-        print(f"{'='*80}")
-        
-        print(f"Running inference on {len(prompts)} prompts...")
-        outputs = llm.generate(prompts, sampling_params)
-
-        responses = []
-        for output in outputs:
-            generated_text = output.outputs[0].text
-            responses.append(generated_text)
-
-        if args.output_prefix:
-            output_file = f"{args.output_prefix}_run{run_num}.txt"
-        elif args.output:
-            if args.num_runs > 1:
-                base_name, ext = os.path.splitext(args.output)
-                output_file = f"{base_name}_run{run_num}{ext}"
-            else:
-                output_file = args.output
+        output_file = get_output_file(args, run_num)
+        if output_file:
+            run_writers.append(CompletionWriter(output_file, len(prompts), resume=args.resume))
         else:
-            output_file = None
+            run_writers.append(StdoutWriter(len(prompts)))
+    if args.cache_dir:
+        run_writers = wrap_writers(
+            run_writers,
+            CompletionCache(args.cache_dir),
+            args.model,
+            prompts,
+            make_request_params(args, prompts, [task] * len(prompts)),
+            args.seed,
+        )
 
-        if output_file:
-            with open(output_file, "w", encoding="utf-8") as f:
-                for i, (prompt, response) in enumerate(zip(prompts, responses), 1):
-                    f.write(f"=== Prompt {i} ===\n")
-                    f.write(f"{response}\n\n")
-            print(f"Results saved to: {output_file}")
+    if not any(writer.pending for writer in run_writers):
+        for writer in run_writers:
+            writer.finalize()
+        print("Every completion is already written or cached, skipping engine setup")
+    else:
+        metrics = MetricsLog(args.metrics_file, args.model, args.tensor_parallel_size) if args.metrics_file else None
+        llm, sampling_params = make_backend(args, prompts, task, metrics)
+        try:
+            generate_runs(
+                llm,
+                prompts,
+                sampling_params,
+                run_writers,
+                args.parallel_sampling,
+                length_sort=args.length_sort,
+                batch_size=args.batch_size,
+                metrics=metrics,
+            )
+        finally:
+            if metrics:
+                metrics.close()
+
+    if store_prefix and all(writer.finalize() for writer in run_writers):
+        path = write_run_store(
+            store_prefix, run_writers, task, remove_text=args.output_format == "parquet"
+        )
+        print(f"Completion store saved to: {path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,302 @@
+"""Run every prompt file through every model, loading each model exactly once.
+
+All prompt files matched for a model are merged into one large generate
+batch, and each file's completions are written back to the same
+``completions/<lang>/<model>/`` (or perturbed) layout that ``run_task.sh``
+produces.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+from answer_schemas import task_from_prompt_file
+from autotune import resolve_engine_settings
+from completion_cache import CompletionCache, wrap_writers
+from completion_writer import CompletionWriter, WriterGroup
+from download_models import MODELS
+from inference_metrics import MetricsLog
+from vllm_inference import (
+    free_gpu_memory,
+    generate_runs,
+    load_llm,
+    load_prompts_from_file,
+    make_request_params,
+    make_sampling_params,
+)
+
+
+def model_short_name(model_name: str) -> str:
+    """Directory name used for a model under ``completions/`` (mirrors run_task.sh)."""
+    short = model_name.split("/")[-1].lower().replace(".", "-")
+    short = re.sub(r"-instruct-[0-9]*$", "", short)
+    short = re.sub(r"-instruct$", "", short)
+    short = short.replace("olmo-3-7b", "olmo3-7b").replace("olmo-3-1-32b", "olmo3-1-32b")
+    return short
+
+
+def resolve_output_prefix(prompt_file: str, model_short: str, completions_dir: str) -> str:
+    """Map a prompt file to its completion prefix (mirrors run_task.sh).
+
+    Raises:
+        ValueError: If the language, task or perturbation type cannot be
+            determined from the prompt file path.
+    """
+    path = os.path.abspath(prompt_file)
+    name = os.path.basename(path)
+
+    if "task1" in name:
+        task = "1"
+    elif "task2" in name:
+        task = "2"
+    else:
+        raise ValueError(f"Could not determine task number from prompt file name: {prompt_file}")
+
+    if "/peturbed_es/" in path:
+        for perturb_type in ["ortho_typo", "semantic_drift", "semantic_preserving"]:
+            if perturb_type in name:
+                break
+        else:
+            raise ValueError(f"Could not determine perturbation type from prompt file name: {prompt_file}")
+        out_dir = os.path.join(completions_dir, "perturbed_es", perturb_type, model_short)
+        return os.path.join(out_dir, f"{perturb_type}_task{task}_{model_short}")
+
+    if "/perturbed/" in path:
+        for perturb_type in ["cultural", "ortho", "sem_drift", "sem_pres"]:
+            if perturb_type in name:
+                break
+        else:
+            raise ValueError(f"Could not determine perturbation type from prompt file name: {prompt_file}")
+        out_dir = os.path.join(completions_dir, "perturbed", perturb_type, model_short)
+        return os.path.join(out_dir, f"{perturb_type}_task{task}_{model_short}")
+
+    if "/es_prompts/" in path:
+        lang = "es"
+    elif "/en_prompts/" in path:
+        lang = "en"
+    else:
+        raise ValueError(f"Could not determine language from prompt file path: {prompt_file}")
+    out_dir = os.path.join(completions_dir, lang, model_short)
+    return os.path.join(out_dir, f"{lang}_task{task}_{model_short}")
+
+
+def default_tensor_parallel_size(model_name: str) -> int:
+    """Use two GPUs for 32B models, as run_task.sh does."""
+    return 2 if "32b" in model_name.lower() else 1
+
+
+def expand_prompt_globs(patterns: list[str]) -> list[str]:
+    """Expand glob patterns into a sorted, de-duplicated list of prompt files."""
+    files = set()
+    for pattern in patterns:
+        files.update(glob.glob(pattern, recursive=True))
+    return sorted(files)
+
+
+def plan_model(model_name: str, prompt_files: list[str], completions_dir: str) -> list[tuple[str, str, list[str]]]:
+    """Return ``(prompt_file, output_prefix, prompts)`` for every prompt file of a model."""
+    model_short = model_short_name(model_name)
+    plan = []
+    for prompt_file in prompt_files:
+        prompts = load_prompts_from_file(prompt_file)
+        if not prompts:
+            print(f"Warning: No prompts found in {prompt_file}, skipping")
+            continue
+        plan.append((prompt_file, resolve_output_prefix(prompt_file, model_short, completions_dir), prompts))
+    return plan
+
+
+def run_model(model_name: str, plan: list[tuple[str, str, list[str]]], args) -> None:
+    """Load one model and generate every run of every prompt file in one batch."""
+    prompts = [p for _, _, file_prompts in plan for p in file_prompts]
+    tasks = [task_from_prompt_file(f) for f, _, file_prompts in plan for _ in file_prompts]
+    run_writers = []
+    for run_num in range(1, args.num_runs + 1):
+        run_writers.append(WriterGroup([
+            CompletionWriter(f"{prefix}_run{run_num}.txt", len(file_prompts), resume=args.resume)
+            for _, prefix, file_prompts in plan
+        ]))
+    if args.cache_dir:
+        run_writers = wrap_writers(
+            run_writers,
+            CompletionCache(args.cache_dir),
+            model_name,
+            prompts,
+            make_request_params(args, prompts, tasks),
+            args.seed,
+        )
+
+    if not any(writer.pending for writer in run_writers):
+        for writer in run_writers:
+            writer.finalize()
+        print(f"All prompt files already completed for {model_name}, skipping model load")
+        return
+
+    tensor_parallel_size = args.tensor_parallel_size or default_tensor_parallel_size(model_name)
+    max_num_seqs, max_num_batched_tokens = resolve_engine_settings(
+        model_name,
+        tensor_parallel_size,
+        args.max_model_len,
+        args.max_num_seqs,
+        args.max_num_batched_tokens,
+    )
+    metrics = MetricsLog(args.metrics_file, model_name, tensor_parallel_size) if args.metrics_file else None
+    load_start = time.time()
+    llm = load_llm(
+        model_name,
+        tensor_parallel_size=tensor_parallel_size,
+        max_model_len=args.max_model_len,
+        max_num_batched_tokens=max_num_batched_tokens,
+        max_num_seqs=max_num_seqs,
+        enable_prefix_caching=args.enable_prefix_caching,
+        seed=args.seed,
+    )
+    if metrics:
+        metrics.model_load(time.time() - load_start)
+    try:
+        generate_runs(
+            llm,
+            prompts,
+            make_sampling_params(args, prompts, tasks),
+            run_writers,
+            args.parallel_sampling,
+            length_sort=args.length_sort,
+            batch_size=args.batch_size,
+            metrics=metrics,
+        )
+    finally:
+        if metrics:
+            metrics.close()
+        del llm
+        free_gpu_memory()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run a sweep of models over prompt files, loading each model once"
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        default=MODELS,
+        help="Models to run (default: download_models.MODELS)",
+    )
+    parser.add_argument(
+        "--prompt-glob",
+        nargs="+",
+        required=True,
+        help="Glob pattern(s) for prompt files, e.g. '../../datasets/*_prompts/*.txt'",
+    )
+    parser.add_argument(
+        "--completions-dir",
+        type=str,
+        default="../../completions",
+        help="Root of the completions tree (default: ../../completions)",
+    )
+    parser.add_argument("--max-tokens", type=int, default=512, help="Maximum tokens to generate (default: 512)")
+    parser.add_argument("--temperature", type=float, default=0.6, help="Sampling temperature (default: 0.6)")
+    parser.add_argument("--top-p", type=float, default=0.95, help="Top-p sampling parameter (default: 0.95)")
+    parser.add_argument("--num-runs", type=int, default=5, help="Number of runs to generate (default: 5)")
+    parser.add_argument(
+        "--parallel-sampling",
+        action="store_true",
+        help="Draw all --num-runs samples per prompt in one engine call (SamplingParams(n=num_runs))",
+    )
+    parser.add_argument(
+        "--guided-decoding",
+        action="store_true",
+        help="Constrain output to each prompt file's answer JSON schema",
+    )
+    parser.add_argument(
+        "--guided-reasoning-chars",
+        type=int,
+        default=None,
+        help="With --guided-decoding, add a reasoning field of at most this many characters",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Append JSONL inference telemetry for every model to this file",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Directory of a completion cache shared between jobs (default: no cache)",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Engine random seed (default: unseeded)")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume interrupted runs and skip prompt files that are already complete",
+    )
+    parser.add_argument(
+        "--tensor-parallel-size",
+        type=int,
+        default=None,
+        help="Number of GPUs for tensor parallelism (default: 2 for 32B models, else 1)",
+    )
+    parser.add_argument("--max-model-len", type=int, default=None, help="Maximum model length (default: auto-detect)")
+    parser.add_argument(
+        "--max-num-batched-tokens",
+        type=int,
+        default=None,
+        help="Maximum number of batched tokens per iteration (default: autotuned value, else auto-detect)",
+    )
+    parser.add_argument(
+        "--max-num-seqs",
+        type=int,
+        default=None,
+        help="Maximum number of sequences per batch (default: autotuned value, else auto-detect)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Maximum number of prompts submitted to the engine at once (default: all)",
+    )
+    parser.add_argument(
+        "--length-sort",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Submit prompts longest first by token count; output order is unchanged (default: on)",
+    )
+    parser.add_argument(
+        "--enable-prefix-caching",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Turn automatic prefix caching on or off (default: engine default)",
+    )
+
+    args = parser.parse_args()
+
+    prompt_files = expand_prompt_globs(args.prompt_glob)
+    if not prompt_files:
+        print(f"Error: No prompt files matched {args.prompt_glob}")
+        sys.exit(1)
+    print(f"Matched {len(prompt_files)} prompt files")
+
+    for i, model_name in enumerate(args.models, 1):
+        print(f"\n{'='*80}")
+        print(f"[{i}/{len(args.models)}] Model: {model_name}")
+        print(f"{'='*80}")
+
+        try:
+            plan = plan_model(model_name, prompt_files, args.completions_dir)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        total = sum(len(file_prompts) for _, _, file_prompts in plan)
+        print(f"Merged {len(plan)} prompt files into one batch of {total} prompts")
+        for prompt_file, prefix, file_prompts in plan:
+            print(f"  {prompt_file} ({len(file_prompts)} prompts) -> {prefix}_run*.txt")
+
+        run_model(model_name, plan, args)
+
+
+if __name__ == "__main__":
+    main()
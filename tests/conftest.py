@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules in src/humorbench import each other as top-level scripts
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "humorbench")
+sys.path.insert(0, SCRIPTS_DIR)
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+from answer_extraction import extract_answer, last_json_object
+
+
+@pytest.mark.parametrize("raw", [False, True])
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('Thinking... {"category": "pun"}', "pun"),
+        ('{"category": "pun"} then {"category": "irony"} done', "irony"),
+        ('He said "hi {"category": "pun"}', "pun"),
+        ('{"note": "a } and a { and \\"quote\\"", "category": "pun"}', "pun"),
+        ('{"outer": {"x": 1}, "category": "pun"}', "pun"),
+        ('{"category": "pun"} and later a broken {"category": ', "pun"),
+        ('{"category": "café"}\r\n', "café"),
+        ('no answer at all {"other": 1}', ""),
+    ],
+)
+def test_last_json_object_with_the_key(text, expected, raw):
+    assert extract_answer(text.encode() if raw else text, "category", "") == expected
+
+
+def test_innermost_object_around_the_last_key_wins():
+    text = 'x {"ANSWER": ["setup", "punchline"], "meta": {"ANSWER": []}} y'
+    assert last_json_object(text, "ANSWER") == {"ANSWER": []}
+    assert last_json_object(text.replace('{"ANSWER": []}', "1"), "ANSWER")["ANSWER"] == ["setup", "punchline"]
+
+
+@pytest.mark.parametrize("num_braces", [20000, 40000])
+def test_many_braces_before_a_broken_answer_stay_linear(num_braces):
+    # Decoding from every candidate brace to the end of the block took seconds here
+    text = ("Reasoning " + "{ x " * num_braces + '"category": broken ' + "y" * 40000).encode()
+    start = time.perf_counter()
+    assert extract_answer(text, "category", "") == ""
+    assert extract_answer(text + b'{"category": "pun"}', "category", "") == "pun"
+    assert time.perf_counter() - start < 1
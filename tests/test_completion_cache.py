@@ -0,0 +1,19 @@
+from completion_cache import CachedWriter, CompletionCache
+from completion_writer import CompletionWriter
+
+META = {"prompt_tokens": 12, "generated_tokens": 7, "finish_reason": "stop"}
+
+
+def test_cache_hits_keep_the_generation_meta(tmp_path):
+    cache = CompletionCache(str(tmp_path / "cache"))
+    keys = ["a" * 64, "b" * 64]
+
+    first = CachedWriter(CompletionWriter(str(tmp_path / "first.txt"), 2), cache, keys)
+    first.write(0, "one", META)
+    first.write(1, "two")
+    assert first.finalize()
+
+    second = CachedWriter(CompletionWriter(str(tmp_path / "second.txt"), 2), cache, keys)
+    assert second.pending == []
+    assert second.meta == {0: META}
+    assert cache.hits == 2
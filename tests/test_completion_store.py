@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+import answer_extraction  # noqa: E402
+import eval_task1  # noqa: E402
+from completion_store import (  # noqa: E402
+    extractor_version,
+    make_rows,
+    read_answers,
+    store_path,
+    uses_store,
+    write_store,
+)
+from completion_writer import write_completion_file  # noqa: E402
+
+TEXTS = ['{"category": "pun"}', 'So {"category": "irony"}', "no answer"]
+
+
+def test_store_from_another_extractor_version_is_reextracted(tmp_path):
+    path = str(tmp_path / "en_task1_m.parquet")
+    write_store(path, make_rows(0, TEXTS, 1))
+    assert extractor_version(path) == answer_extraction.EXTRACTOR_VERSION
+    assert read_answers(path, 0, 1) == ["pun", "irony", ""]
+
+    # A store whose answer column came from an older extractor
+    table = pq.read_table(path)
+    stale = [json.dumps("stale")] * table.num_rows
+    table = table.set_column(table.schema.get_field_index("answer"), "answer", [stale])
+    table = table.replace_schema_metadata({b"extractor_version": b"1"})
+    pq.write_table(table, path)
+
+    assert extractor_version(path) == 1
+    assert read_answers(path, 0, 1) == ["pun", "irony", ""]
+
+
+def test_newer_run_files_win_over_the_store(tmp_path):
+    prefix = str(tmp_path / "en_task1_m")
+    write_store(store_path(prefix), make_rows(0, TEXTS, 1))
+    assert uses_store(prefix)
+    assert eval_task1.load_runs([prefix], workers=1, num_runs=1) == [["pun", "irony", ""]]
+
+    # A rerun wrote text files next to the store it did not rebuild
+    write_completion_file(f"{prefix}_run1.txt", ['{"category": "absurd"}'] * 3)
+    mtime = os.stat(store_path(prefix)).st_mtime_ns
+    os.utime(f"{prefix}_run1.txt", ns=(mtime + 10**9, mtime + 10**9))
+    assert not uses_store(prefix)
+    assert eval_task1.load_runs([prefix], workers=1, num_runs=1) == [["absurd"] * 3]
+
+    # A store written after the text files is read again
+    os.utime(store_path(prefix), ns=(mtime + 2 * 10**9, mtime + 2 * 10**9))
+    assert uses_store(prefix)
+    assert eval_task1.load_runs([prefix], workers=1, num_runs=1) == [["pun", "irony", ""]]
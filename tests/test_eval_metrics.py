@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from eval_metrics import (
+    PAD,
+    confusion_matrix,
+    evaluate_all_k,
+    macro_f1,
+    majority_votes,
+    ovr_auc,
+    unbiased_pass_at_k,
+)
+
+NAMES = ["a", "b", "c"]
+# Truths 0, 0, 1, 2 predicted as 0, 1, 1, 2
+CM = np.array([[1, 1, 0], [0, 1, 0], [0, 0, 1]])
+
+
+def test_confusion_matrix_rows_are_truths():
+    y_true = np.array([0, 0, 1, 2])
+    y_pred = np.array([0, 1, 1, 2])
+    assert confusion_matrix(y_true, y_pred, 3).tolist() == CM.tolist()
+
+
+def test_macro_f1_by_hand():
+    # F1 of a = 2 / 3, b = 2 / 3, c = 1
+    assert macro_f1(CM, NAMES) == pytest.approx(7 / 9)
+
+
+def test_macro_f1_counts_unknown_predictions_as_a_label():
+    # One truth of a predicted as junk: a = 2 / 3, b = 1, junk = 0
+    cm = np.array([[1, 0, 1], [0, 1, 0], [0, 0, 0]])
+    assert macro_f1(cm, ["a", "b", "junk"]) == pytest.approx(5 / 9)
+
+
+def test_ovr_auc_by_hand():
+    # (fpr, tpr) of a = (0, 1/2), b = (1/3, 1), c = (0, 1): AUCs 3/4, 5/6, 1
+    assert ovr_auc(CM, NAMES) == pytest.approx(31 / 36)
+
+
+def test_ovr_auc_of_two_classes_scores_the_second():
+    # b: tpr = 1/2, fpr = 1/4
+    cm = np.array([[3, 1], [1, 1]])
+    assert ovr_auc(cm, ["a", "b"]) == pytest.approx(0.625)
+
+
+def test_ovr_auc_needs_two_classes():
+    with pytest.raises(ValueError, match="Only one class"):
+        ovr_auc(np.array([[2, 1], [0, 0]]), ["a", "b"])
+
+
+# Two questions, three samples: question 0 (truth a) is answered b, a, a;
+# question 1 (truth b) is answered a, a, b
+PRED = np.array([[[1], [0], [0]], [[0], [0], [1]]])
+TRUTH = np.array([[0], [1]])
+
+
+def test_pass_at_k_with_k_below_and_equal_to_n():
+    results = evaluate_all_k(PRED, TRUTH, ["a", "b"], [1, 2, 3])
+
+    assert [results[k]["pass"] for k in (1, 2, 3)] == [0.0, 0.5, 1.0]
+    assert [results[k]["num_correct"] for k in (1, 2, 3)] == [0, 1, 2]
+    assert results[3]["total"] == 2
+    # 1 - C(n - c, k) / C(n, k) with c = 2 and c = 1 correct of n = 3
+    assert results[1]["unbiased"] == pytest.approx((2 / 3 + 1 / 3) / 2)
+    assert results[2]["unbiased"] == pytest.approx((1 + 2 / 3) / 2)
+    assert results[3]["unbiased"] == pytest.approx(1.0)
+    assert results[1]["cm"].tolist() == [[0, 1], [1, 0]]
+    assert results[3]["cm"].tolist() == [[2, 1], [2, 1]]
+    # Majority of three: question 0 votes a (right), question 1 votes a (wrong)
+    assert results[3]["majority"] == 0.5
+
+
+def test_k_above_n_is_rejected():
+    with pytest.raises(ValueError, match="k=4"):
+        evaluate_all_k(PRED, TRUTH, ["a", "b"], [4])
+
+
+def test_unbiased_pass_at_k_table():
+    assert unbiased_pass_at_k(np.array([0, 1, 5]), 5, 5) == pytest.approx(2 / 3)
+    assert unbiased_pass_at_k(np.array([2]), 5, 2) == pytest.approx(1 - 3 / 10)
+
+
+def test_majority_ties_go_to_the_earliest_sample():
+    pred = np.array([[[2], [1], [1], [2]]])
+    assert majority_votes(pred, 4).tolist() == [[2]]
+    assert majority_votes(pred, 3).tolist() == [[1]]
+    # Question 0 ties b, a at k = 2, so its majority vote is wrong
+    assert evaluate_all_k(PRED, TRUTH, ["a", "b"], [2])[2]["majority"] == 0.0
+
+
+def test_padded_lines_are_not_scored():
+    pred = np.array([[[0, 1]], [[1, 1]]])
+    truth = np.array([[0, PAD], [1, 0]])
+    results = evaluate_all_k(pred, truth, ["a", "b"], [1])[1]
+    assert results["total"] == 3
+    assert results["pass"] == pytest.approx(2 / 3)
+    assert results["cm"].tolist() == [[1, 1], [0, 1]]
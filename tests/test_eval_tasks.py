@@ -0,0 +1,30 @@
+import eval_task1
+import eval_task2
+import pytest
+from label_taxonomy import TASK1
+
+
+@pytest.mark.parametrize("module", [eval_task1, eval_task2])
+def test_misaligned_runs_are_rejected(module):
+    module.check_aligned([["x", "y"], ["x", "y"]], ["t1", "t2"])
+    with pytest.raises(ValueError, match="Run 2 has 1 answers for 2 labelled jokes"):
+        module.check_aligned([["x", "y"], ["x"]], ["t1", "t2"])
+
+
+def test_task1_non_string_answers_count_as_unanswered():
+    completions = [[["wordplay"], None, {"category": "dark"}, "Wordplay", ""]]
+    codes, pred, truth = eval_task1.encode_answers(completions, ["wordplay"], 5)
+
+    unanswered = pred[0, 4, 0]
+    assert codes.names[unanswered] == ""
+    assert pred[0, :3, 0].tolist() == [unanswered] * 3
+    assert pred[0, 3, 0] == truth[0, 0] == TASK1.labels.index("wordplay")
+
+
+def test_task2_non_list_answers_and_non_string_lines_count_as_na():
+    completions = [["setup", [None, "punchline"], {"ANSWER": []}, None]]
+    codes, pred, truth = eval_task2.encode_answers(completions, [["setup", "punchline"]], 4)
+
+    na = codes.codes["NA"]
+    assert truth.tolist() == [[codes.codes["setup"], codes.codes["punchline"]]]
+    assert pred[0].tolist() == [[na, na], [na, codes.codes["punchline"]], [na, na], [na, na]]
@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web  # noqa: E402
+from openai_backend import OpenAICompletionsClient  # noqa: E402
+
+
+class FakeServer:
+    """``/v1/completions`` on a local port, run on its own event loop thread.
+
+    A prompt ``"<status>x<count>:<name>"`` fails with ``status`` on its
+    first ``count`` attempts, ``"slow:<name>"`` only answers once the
+    server shuts down and ``"nap:<name>"`` answers after 50 ms. ``peak`` is
+    the most requests the server held at once. Successful responses hold ``n`` choices in reverse
+    index order.
+    """
+
+    def __init__(self) -> None:
+        self.attempts: Counter = Counter()
+        self.active = 0
+        self.peak = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    async def completions(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        prompt = payload["prompt"]
+        self.attempts[prompt] += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            if prompt.startswith("slow:"):
+                await self.release.wait()
+            elif prompt.startswith("nap:"):
+                await asyncio.sleep(0.05)
+        finally:
+            self.active -= 1
+        head = prompt.split(":", 1)[0]
+        if "x" in head:
+            status, count = head.split("x")
+            if self.attempts[prompt] <= int(count):
+                return web.Response(status=int(status), text="try again")
+        n = payload.get("n", 1)
+        choices = [{"index": i, "text": f"{prompt}#{i}", "finish_reason": "stop"} for i in reversed(range(n))]
+        usage = {"prompt_tokens": 3, "completion_tokens": 2 * n}
+        return web.json_response({"choices": choices, "usage": usage})
+
+    async def _start(self) -> str:
+        self.release = asyncio.Event()
+        app = web.Application()
+        app.router.add_post("/v1/completions", self.completions)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> str:
+        self.thread.start()
+        return asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    def __exit__(self, *exc) -> None:
+        self.loop.call_soon_threadsafe(self.release.set)
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+@pytest.fixture
+def server():
+    fake = FakeServer()
+    with fake as url:
+        yield fake, url
+
+
+def make_client(url: str, **kwargs) -> OpenAICompletionsClient:
+    return OpenAICompletionsClient(url, "mock", backoff=0.01, **kwargs)
+
+
+def test_retries_429_and_5xx_and_returns_every_sample(server):
+    fake, url = server
+    prompts = ["ok:a", "429x2:b", "503x1:c", "500x3:d"]
+    timings = {}
+
+    results = dict(make_client(url, max_retries=3).stream(prompts, {"n": 3}, timings=timings))
+
+    assert sorted(results) == [0, 1, 2, 3]
+    for index, prompt in enumerate(prompts):
+        response = results[index]
+        assert response.request_id == f"req-{index}"
+        assert [c.index for c in response.outputs] == [0, 1, 2]
+        assert [c.text for c in response.outputs] == [f"{prompt}#{i}" for i in range(3)]
+        assert response.num_generated_tokens == 6
+        assert timings[index]["finished"] >= timings[index]["submitted"]
+    assert fake.attempts == Counter({"ok:a": 1, "429x2:b": 3, "503x1:c": 2, "500x3:d": 4})
+
+
+def test_gives_up_after_max_retries(server):
+    fake, url = server
+    with pytest.raises(RuntimeError, match="after 3 attempts: HTTP 502"):
+        list(make_client(url, max_retries=2).stream(["502x5:a"], {"n": 1}))
+    assert fake.attempts["502x5:a"] == 3
+
+
+def test_does_not_retry_client_errors(server):
+    fake, url = server
+    with pytest.raises(RuntimeError, match="Server returned 400"):
+        list(make_client(url).stream(["400x1:a"], {"n": 1}))
+    assert fake.attempts["400x1:a"] == 1
+
+
+def test_max_in_flight_caps_requests_held_by_the_server(server):
+    fake, url = server
+    prompts = [f"nap:{i}" for i in range(8)]
+
+    results = dict(make_client(url).stream(prompts, {"n": 1}, max_in_flight=2))
+
+    assert sorted(results) == list(range(8))
+    assert fake.peak == 2
+
+
+def test_closing_the_stream_cancels_requests_in_flight(server):
+    _, url = server
+    threads = threading.active_count()
+    stream = make_client(url).stream(["ok:a", "slow:b", "slow:c"], {"n": 1})
+
+    index, response = next(stream)
+    start = time.monotonic()
+    stream.close()
+
+    assert (index, response.outputs[0].text) == (0, "ok:a#0")
+    assert time.monotonic() - start < 5
+    assert threading.active_count() == threads
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from completion_writer import read_completion_file
+from conftest import SCRIPTS_DIR
+
+
+def run_script(name, *args, cwd):
+    subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS_DIR, name), *args],
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+    )
+
+
+@pytest.mark.parametrize("task", [1, 2])
+def test_sharded_mock_run_matches_single_process(tmp_path, task):
+    prompt_file = tmp_path / f"prompts_task{task}_en.txt"
+    prompt_file.write_text("".join(f"Classify joke {i}: Line one {i}\\nLine two\n" for i in range(23)))
+    common = ["--prompt-file", prompt_file.name, "--num-runs", "2", "--backend", "mock", "--model", "mock"]
+
+    run_script("vllm_inference.py", *common, "--output-prefix", "single", cwd=tmp_path)
+    run_script(
+        "sharded_inference.py",
+        *common,
+        "--output-prefix", "sharded",
+        "--num-workers", "2",
+        "--num-shards", "3",
+        "--poll-interval", "0.05",
+        cwd=tmp_path,
+    )
+
+    for run_num in (1, 2):
+        single = (tmp_path / f"single_run{run_num}.txt").read_bytes()
+        sharded = (tmp_path / f"sharded_run{run_num}.txt").read_bytes()
+        assert single.count(b"=== Prompt ") == 23
+        assert sharded == single
+    assert not (tmp_path / "sharded.shards").exists()
+
+
+def write_prompts(path, label):
+    path.write_text("".join(f"Classify {label} joke {i}: Line one {i}\n" for i in range(11)))
+
+
+def test_shards_from_another_prompt_file_are_rerun(tmp_path):
+    prompt_file = tmp_path / "prompts_task1_en.txt"
+    common = [
+        "--prompt-file", prompt_file.name,
+        "--backend", "mock",
+        "--model", "mock",
+        "--num-shards", "2",
+        "--keep-shards",
+        "--poll-interval", "0.05",
+    ]
+
+    write_prompts(prompt_file, "old")
+    run_script("sharded_inference.py", *common, "--output-prefix", "sharded", cwd=tmp_path)
+    old = (tmp_path / "sharded_run1.txt").read_bytes()
+
+    # Same prompt count and shard layout, different prompts: finished shards must not be reused
+    write_prompts(prompt_file, "new")
+    run_script("sharded_inference.py", *common, "--output-prefix", "sharded", cwd=tmp_path)
+    run_script("vllm_inference.py", *common[:6], "--output-prefix", "single", cwd=tmp_path)
+    assert (tmp_path / "sharded_run1.txt").read_bytes() == (tmp_path / "single_run1.txt").read_bytes() != old
+
+
+def test_parquet_shard_stores_are_merged(tmp_path):
+    pytest.importorskip("pyarrow.parquet")
+    from completion_store import read_answers, read_texts
+
+    prompt_file = tmp_path / "prompts_task1_en.txt"
+    write_prompts(prompt_file, "a")
+    common = ["--prompt-file", prompt_file.name, "--num-runs", "2", "--backend", "mock", "--model", "mock"]
+
+    run_script("vllm_inference.py", *common, "--output-prefix", "single", cwd=tmp_path)
+    run_script(
+        "sharded_inference.py",
+        *common,
+        "--output-prefix", "sharded",
+        "--output-format", "parquet",
+        "--num-workers", "2",
+        "--num-shards", "3",
+        "--poll-interval", "0.05",
+        cwd=tmp_path,
+    )
+
+    assert not (tmp_path / "sharded_run1.txt").exists()
+    store = str(tmp_path / "sharded.parquet")
+    for run_num in (1, 2):
+        single = read_completion_file(str(tmp_path / f"single_run{run_num}.txt"))
+        assert read_texts(store, run_num - 1) == single
+        assert len(read_answers(store, run_num - 1, 1)) == 11